@@ -3,12 +3,11 @@ Main Agent Module - Defines the root agent and its sub-agents for molecular anal
 This module orchestrates the parallel analysis of compounds using specialized sub-agents.
 """
 
-from google.adk.agents import Agent, ParallelAgent, SequentialAgent, LlmAgent
-from google.adk.models.lite_llm import LiteLlm
-from .sub_agents.activity_analysis_agent import activity_analysis_agent
-from .sub_agents.availability_analysis_agent import availability_analysis_agent
-from .sub_agents.toxicity_analysis_agent import toxicity_analysis_agent
-from pydantic import BaseModel, Field
+from .lazy import lazy_attributes
+
+# The agents are built on first access (`from MolSearch.agent import root_agent` or
+# `MolSearch.agent.root_agent`), so importing this module does not load google.adk,
+# LiteLlm or the tool clients. Each agent is built once and shared.
 
 # Define the parallel research agent
 # 并行 agent 只保留 description
@@ -20,10 +19,16 @@ from pydantic import BaseModel, Field
 # )
 
 
-parallel_research_agent = ParallelAgent(
-    name="ParallelResearchAgent",
-    sub_agents=[activity_analysis_agent, availability_analysis_agent, toxicity_analysis_agent],
-    description="""Runs multiple research agents in parallel to gather comprehensive information about compounds.
+def build_parallel_research_agent():
+    from google.adk.agents import ParallelAgent
+    from .sub_agents.activity_analysis_agent import activity_analysis_agent
+    from .sub_agents.availability_analysis_agent import availability_analysis_agent
+    from .sub_agents.toxicity_analysis_agent import toxicity_analysis_agent
+
+    return ParallelAgent(
+        name="ParallelResearchAgent",
+        sub_agents=[activity_analysis_agent, availability_analysis_agent, toxicity_analysis_agent],
+        description="""Runs multiple research agents in parallel to gather comprehensive information about compounds.
     Each sub-agent specializes in a different aspect of analysis:
     - Activity Analysis: Evaluates biological activities
     - Availability Analysis: Checks compound availability and pricing
@@ -31,7 +36,7 @@ parallel_research_agent = ParallelAgent(
     Each sub-agent should analyze the input compound (PubChem CID, CAS number and SMILES) and return its analysis result.
     The output from this agent will be a dictionary with keys: 'activity_result', 'toxicity_result', and 'availability_result', each containing the corresponding sub-agent's result.
     """
-)
+    )
 
 # 合成 agent 继续用 instruction，要求输出 JSON 格式
 # merger_agent = LlmAgent(
@@ -80,16 +85,20 @@ parallel_research_agent = ParallelAgent(
 # )
 
 
-merger_agent = LlmAgent(
+def build_merger_agent():
+    from google.adk.agents import LlmAgent
+    from .llm_cache import make_llm
 
- name="SynthesisAgent",
- # model='gemini-2.0-flash',
- # model = LiteLlm("deepseek/deepseek-chat"),
- model = LiteLlm(model="openai/gemini-2.0-flash"),
-#  instruction="""Print research findings from sub-agents including {activity_result}, {toxicity_result}, {availability_result}.
-# """,
+    return LlmAgent(
+
+     name="SynthesisAgent",
+     # model='gemini-2.0-flash',
+     # model = LiteLlm("deepseek/deepseek-chat"),
+     model = make_llm("SynthesisAgent", "openai/gemini-2.0-flash"),
+    #  instruction="""Print research findings from sub-agents including {activity_result}, {toxicity_result}, {availability_result}.
+    # """,
 
- instruction="""You are an expert AI Chemist and Data Analyst responsible for synthesizing research findings on potential algicidal molecules.
+     instruction="""You are an expert AI Chemist and Data Analyst responsible for synthesizing research findings on potential algicidal molecules.
 
 Your task is to analyze the raw results provided by the 'activity_analysis_agent', 'toxicity_analysis_agent', and 'availability_analysis_agent'. Based on this data, you must provide clear summaries, an overall evaluation, and a recommendation for experimental validation.
 
@@ -133,20 +142,25 @@ Generate a JSON object with the following eight fields:
  "recommended_for_experiment": "..."
  }
 """,
- description="Analyzes and synthesizes molecular data from parallel agents (Activity, Toxicity, Availability) into a structured JSON report for secondary screening decisions, strictly grounded on the provided input data."
+     description="Analyzes and synthesizes molecular data from parallel agents (Activity, Toxicity, Availability) into a structured JSON report for secondary screening decisions, strictly grounded on the provided input data."
 
-)
+    )
 
 # Define the sequential pipeline agent
-sequential_pipeline_agent = SequentialAgent(
-    name="ResearchAndSynthesisPipeline",
-    sub_agents=[parallel_research_agent, merger_agent],
-    description="""Coordinates parallel research and synthesizes the results.""",
-)
+def build_sequential_pipeline_agent():
+    from google.adk.agents import SequentialAgent
+
+    return SequentialAgent(
+        name="ResearchAndSynthesisPipeline",
+        sub_agents=[__getattr__("parallel_research_agent"), __getattr__("merger_agent")],
+        description="""Coordinates parallel research and synthesizes the results.""",
+    )
 
-# Define the root agent
-root_agent = sequential_pipeline_agent
-# root_agent = toxicity_analysis_agent
-# root_agent = activity_analysis_agent
-# root_agent = availability_analysis_agent
 
+# Define the root agent
+__getattr__ = lazy_attributes(globals(), {
+    "parallel_research_agent": build_parallel_research_agent,
+    "merger_agent": build_merger_agent,
+    "sequential_pipeline_agent": build_sequential_pipeline_agent,
+    "root_agent": lambda: __getattr__("sequential_pipeline_agent"),
+})
@@ -0,0 +1,35 @@
+"""
+Lazy Attribute Module - Builds module-level objects (agents, clients) on first access instead of at import.
+Importing google.adk, LiteLlm, the ChEMBL client, ctxpy and pandas takes seconds; with the agents built
+lazily, `import agent` and the tool modules stay cheap for short jobs, tests and worker processes, and the
+cost is paid only by the process that actually runs an agent.
+"""
+
+import threading
+from typing import Callable, Dict
+
+_lock = threading.RLock()
+
+
+def lazy_attributes(module_globals: dict, factories: Dict[str, Callable[[], object]]):
+    """Returns a module `__getattr__` (PEP 562) building each name once with its factory.
+
+    Args:
+        module_globals (dict): The module's `globals()`; built objects are stored there, so
+            later accesses are plain attribute lookups.
+        factories (dict): Maps attribute names to zero-argument factories.
+
+    Returns:
+        callable: The function to assign to the module's `__getattr__`.
+    """
+    def __getattr__(name):
+        factory = factories.get(name)
+        if factory is None:
+            raise AttributeError(f"module {module_globals['__name__']!r} has no attribute {name!r}")
+        # Re-entrant: building the root agent builds (and stores) its sub-agents.
+        with _lock:
+            if name not in module_globals:
+                module_globals[name] = factory()
+        return module_globals[name]
+
+    return __getattr__
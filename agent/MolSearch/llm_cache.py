@@ -0,0 +1,152 @@
+"""
+LLM Response Cache Module - Persists LiteLlm responses keyed by the model and the normalized request.
+A re-run after a crash or after editing one agent's prompt repeats only the LLM calls whose inputs changed:
+the key covers the system instruction (with the session state already substituted), the conversation
+including tool calls and tool results, the tool declarations and the sampling settings.
+
+Caching is opt-in per agent through MOLSEARCH_LLM_CACHE ("all" or a comma-separated list of agent names,
+e.g. "activity_analysis_agent,SynthesisAgent"); MOLSEARCH_LLM_CACHE_DIR overrides the cache directory.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import AsyncGenerator, Optional
+
+from google.adk.models.lite_llm import LiteLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+
+LLM_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'llm')
+GENERATION_SETTINGS = ('temperature', 'top_p', 'top_k', 'max_output_tokens', 'stop_sequences',
+                       'response_mime_type', 'seed')
+# Function call ids are generated per call (by the provider or by ADK), so they must not
+# take part in the key; they only link a call to its response within one session.
+FUNCTION_PARTS = {'function_call', 'function_response'}
+# ADK hands events of other agents to the model as user contents starting with this part, followed by
+# "[author] said: ..." / "[author] called tool ..." / "[author] `tool` tool returned result: ...".
+FOREIGN_EVENT_MARKER = 'For context:'
+FOREIGN_AUTHOR = re.compile(r'^\s*\[([^\]]+)\]')
+
+
+def _normalize(value, parent: Optional[str] = None):
+    if isinstance(value, dict):
+        return {k: _normalize(v, k) for k, v in sorted(value.items())
+                if v is not None and k != 'thought_signature' and not (k == 'id' and parent in FUNCTION_PARTS)}
+    if isinstance(value, list):
+        return [_normalize(v, parent) for v in value]
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    return value
+
+
+def _dump(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_dump(v) for v in value]
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(mode='json', exclude_none=True)
+    return str(value)
+
+
+def _foreign_author(content: dict) -> Optional[str]:
+    parts = content.get('parts') or []
+    if len(parts) < 2 or (parts[0].get('text') or '').strip() != FOREIGN_EVENT_MARKER:
+        return None
+    match = FOREIGN_AUTHOR.match(parts[1].get('text') or '')
+    return match.group(1) if match else None
+
+
+def order_branches(contents: list) -> list:
+    """Puts the events of concurrently run agents in a fixed order.
+
+    A ParallelAgent interleaves its branches' events in the order they finished, which depends on
+    tool latency. Every run of consecutive foreign-agent contents is stably sorted by author, so the
+    order within a branch is kept and only the interleaving between branches is normalized.
+    """
+    ordered, run = [], []
+    for content in contents + [None]:
+        author = _foreign_author(content) if content is not None else None
+        if author is not None:
+            run.append((author, content))
+            continue
+        ordered.extend(c for _, c in sorted(run, key=lambda item: item[0]))
+        run = []
+        if content is not None:
+            ordered.append(content)
+    return ordered
+
+
+def request_key(model: str, llm_request: LlmRequest) -> str:
+    """SHA-256 of the model name and the normalized instruction, messages, tool results and settings.
+
+    Parallel branches' events are ordered by author, so the key does not depend on which branch finished first.
+    """
+    config = llm_request.config
+    payload = {
+        'model': model,
+        'system_instruction': _dump(getattr(config, 'system_instruction', None)),
+        'tools': _dump(getattr(config, 'tools', None)),
+        'settings': {name: _dump(getattr(config, name, None)) for name in GENERATION_SETTINGS},
+        'contents': order_branches([_dump(content) for content in llm_request.contents or []]),
+    }
+    text = json.dumps(_normalize(payload), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CachedLiteLlm(LiteLlm):
+    """LiteLlm answering repeated requests from an on-disk cache (one JSON file per request key)."""
+
+    _cache_dir: str = PrivateAttr(default=LLM_CACHE_DIR)
+
+    def __init__(self, model: str, cache_dir: Optional[str] = None, **kwargs):
+        super().__init__(model=model, **kwargs)
+        self._cache_dir = cache_dir or os.getenv('MOLSEARCH_LLM_CACHE_DIR', LLM_CACHE_DIR)
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[:2], f"{key}.json")
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        key = request_key(self.model, llm_request)
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            for response in cached['responses']:
+                yield LlmResponse.model_validate(response)
+            return
+
+        responses = []
+        async for response in super().generate_content_async(llm_request, stream=stream):
+            responses.append(response)
+            yield response
+        # Only complete, successful answers are cached; streamed partial chunks are not replayed.
+        final = [r for r in responses if not r.partial]
+        if not final or any(r.error_code for r in final):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model,
+                       'responses': [r.model_dump(mode='json', exclude_none=True) for r in final]},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def cache_enabled(agent_name: str) -> bool:
+    """Whether MOLSEARCH_LLM_CACHE opts `agent_name` into the response cache."""
+    setting = os.getenv('MOLSEARCH_LLM_CACHE', '').strip()
+    if not setting:
+        return False
+    names = {name.strip() for name in setting.split(',')}
+    return 'all' in names or agent_name in names
+
+
+def make_llm(agent_name: str, model: str, **kwargs) -> LiteLlm:
+    """LiteLlm for an agent, cached when the agent is opted in through MOLSEARCH_LLM_CACHE."""
+    if cache_enabled(agent_name):
+        return CachedLiteLlm(model=model, **kwargs)
+    return LiteLlm(model=model, **kwargs)
@@ -1,24 +1,46 @@
 """
 Activity Analysis Agent - Specialized agent for analyzing biological activity data of compounds.
 This agent uses ChEMBL and PubChem data to evaluate the biological activity profile of molecules.
+When MOLSEARCH_PREDICTION_URL points at a running model/predict_server.py, it also reports the
+in-house DMPNN model's predicted EC50 activity per target.
 """
 
-from google.adk.agents import Agent
-from google.adk.models.lite_llm import LiteLlm
-from ..tools.activity import fetch_activity_data
+import os
 
-activity_analysis_agent = Agent(
-    name="activity_analysis_agent",
-    # model='gemini-2.0-flash',
-    # model = LiteLlm("deepseek/deepseek-chat"),
-    model = LiteLlm(model="openai/gemini-2.0-flash"),
-    description="""Specialized agent for analyzing biological activity data of compounds.
-    This agent evaluates molecules based on their known biological activities from ChEMBL database.
-    It focuses on identifying compounds with biological activities and potential applications.""",
-    tools=[fetch_activity_data],
-    instruction="""You are an expert in analyzing biological activity data of compounds.
+from ..lazy import lazy_attributes
+
+PREDICTION_INSTRUCTION = """
+    Also use the 'predict_ec50_activity' tool with the molecule's SMILES to obtain the in-house model's predicted EC50 activity (probability of being active) for each target, and report it separately from the measured ChEMBL data."""
+
+
+def build_activity_analysis_agent():
+    """Builds the agent; google.adk, LiteLlm and the tool dependencies are imported here."""
+    from google.adk.agents import Agent
+    from ..llm_cache import make_llm
+    from ..tools.activity import fetch_activity_data
+
+    tools = [fetch_activity_data.aio]
+    instruction = """You are an expert in analyzing biological activity data of compounds.
     When the user asks for the molecule availability with its PubChem CID, use the 'fetch_activity_data' tool to fetch the activity information from ChEMBL database.
     If the tool returns an error, inform the user politely.
-    If the tool is successful, present the availability information clearly.""",
-    output_key="activity_result"
-)
+    If the tool is successful, present the availability information clearly."""
+    if os.getenv('MOLSEARCH_PREDICTION_URL'):
+        from ..tools.prediction import predict_ec50_activity
+        tools.append(predict_ec50_activity.aio)
+        instruction += PREDICTION_INSTRUCTION
+
+    return Agent(
+        name="activity_analysis_agent",
+        # model='gemini-2.0-flash',
+        # model = LiteLlm("deepseek/deepseek-chat"),
+        model = make_llm("activity_analysis_agent", "openai/gemini-2.0-flash"),
+        description="""Specialized agent for analyzing biological activity data of compounds.
+    This agent evaluates molecules based on their known biological activities from ChEMBL database.
+    It focuses on identifying compounds with biological activities and potential applications.""",
+        tools=tools,
+        instruction=instruction,
+        output_key="activity_result"
+    )
+
+
+__getattr__ = lazy_attributes(globals(), {'activity_analysis_agent': build_activity_analysis_agent})
@@ -5,10 +5,11 @@ This module provides tools to retrieve and analyze biological activity data for
 
 import requests
 from typing import Dict, List, Optional
-from chembl_webresource_client.new_client import new_client
+from .singleflight import coalesce
 
 REQUEST_TIMEOUT = 20
 
+@coalesce(key=lambda cid: str(cid).strip())
 def fetch_activity_data(cid: str) -> Dict:
     """Retrieves comprehensive biological activity data for a compound using its PubChem CID.
     
@@ -41,6 +42,8 @@ def fetch_activity_data(cid: str) -> Dict:
             return "No record in ChEMBL"
         
         try:
+            # Imported here: the ChEMBL client is slow to import and only needed for a lookup.
+            from chembl_webresource_client.new_client import new_client
             activity = new_client.activity
             data = activity.filter(molecule_chembl_id=chembl_id)
             data = list(data)
@@ -168,6 +171,7 @@ def process_and_deduplicate_activity_data(data_list):
             
     return list(deduplicated_map.values())
 
+@coalesce(key=lambda cid: str(cid).strip())
 def get_chembl_id_from_pubchem(cid: str) -> Optional[str]:
     """Retrieves the ChEMBL ID for a compound using its PubChem CID.
     
@@ -1,9 +1,13 @@
+import os
 import requests
 import json
 from typing import Optional, Dict, Any
+from .singleflight import coalesce
+from .identity import canonical_smiles
 
-MCULE_API_TOKEN = 'f146936064c274e1d77231018c4f73182748fc6d'
+MCULE_API_TOKEN = os.getenv('MCULE_API_TOKEN', 'f146936064c274e1d77231018c4f73182748fc6d')
 REQUEST_TIMEOUT = 20
+@coalesce(key=lambda smiles_string: canonical_smiles(smiles_string))
 def get_mcule_id_from_smiles(smiles_string: str) -> Optional[str]:
     """
     Retrieve the MCULE compound ID for a molecule using its SMILES string via the MCULE API.
@@ -49,6 +53,7 @@ def get_mcule_id_from_smiles(smiles_string: str) -> Optional[str]:
         print(f"Unknown error occurred while querying MCULE ID: {e}")
         return None
 
+@coalesce(key=lambda smiles_string: canonical_smiles(smiles_string))
 def get_compound_prices_from_smiles(smiles_string: str) -> Optional[Dict[str, Any]]:
     """
     Retrieve compound price and supplier information from the MCULE API using a SMILES string.
@@ -0,0 +1,352 @@
+"""
+Identifier Resolution Module - Maps between CAS numbers, PubChem CIDs, canonical SMILES and InChIKeys.
+This module keeps a local identity index built from the repository CSVs and from cached PubChem responses,
+so bulk CAS -> CID resolution only sends the misses to PubChem.
+"""
+
+import json
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+REQUEST_TIMEOUT = 20
+PUBCHEM_MAX_REQUESTS_PER_SECOND = 5
+PUBCHEM_PROPERTY_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/{namespace}/property/Title,InChIKey,SMILES/JSON"
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT_DIR = os.path.dirname(AGENT_DIR)
+IDENTITY_SOURCES = [
+    os.path.join(AGENT_DIR, 'molecules_cas_cid_smiles.csv'),
+    os.path.join(AGENT_DIR, 'molecules.csv'),
+    os.path.join(ROOT_DIR, 'lotus', 'lotus_smiles_with_cas.csv'),
+]
+PUBCHEM_CACHE_PATH = os.path.join(AGENT_DIR, '.cache', 'pubchem_identity.jsonl')
+# The built index is saved next to the PubChem cache and reused while the source files are unchanged.
+INDEX_SNAPSHOT_NAME = 'identity_index.pkl'
+SNAPSHOT_VERSION = 1
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls at least `1 / rate` seconds apart."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_pubchem_limiter = RateLimiter(PUBCHEM_MAX_REQUESTS_PER_SECOND)
+
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value in ('', 'nan', 'None', '<NA>'):
+        return None
+    if value.endswith('.0') and value[:-2].isdigit():
+        return value[:-2]
+    return value
+
+
+def canonical_smiles(smiles: Optional[str]) -> Optional[str]:
+    """RDKit canonical SMILES when RDKit is installed, otherwise the SMILES as given."""
+    smiles = _clean(smiles)
+    if smiles is None:
+        return None
+    try:
+        from rdkit import Chem, RDLogger
+    except ImportError:
+        return smiles
+    RDLogger.DisableLog('rdApp.*')
+    mol = Chem.MolFromSmiles(smiles)
+    return Chem.MolToSmiles(mol) if mol is not None else smiles
+
+
+class IdentityIndex:
+    """In-memory many-to-many index between CAS, CID, canonical SMILES and InChIKey.
+
+    Every known compound identity is stored once as a record; one dictionary per
+    identifier type maps a key to the set of records carrying it, so lookups are
+    O(1) and a CAS number shared by several CIDs (or the reverse) keeps all links.
+    All reads and writes of the index go through `lock`, so `resolve_cids` can add
+    PubChem answers from its worker threads while other threads look up.
+    """
+
+    KEYS = ('cas', 'cid', 'smiles', 'inchikey')
+
+    def __init__(self):
+        self.records: List[Dict[str, Optional[str]]] = []
+        self.lookup: Dict[str, Dict[str, Set[int]]] = {key: defaultdict(set) for key in self.KEYS}
+        self.titles: Dict[str, str] = {}
+        self.misses: Set[Tuple[str, str]] = set()
+        self.cache_path: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def add(self, cas=None, cid=None, smiles=None, inchikey=None, title=None, canonicalize: bool = True):
+        record = {'cas': _clean(cas), 'cid': _clean(cid),
+                  'smiles': canonical_smiles(smiles) if canonicalize else _clean(smiles),
+                  'inchikey': _clean(inchikey)}
+        if sum(value is not None for value in record.values()) < 2 and not title:
+            return
+        with self.lock:
+            row = len(self.records)
+            self.records.append(record)
+            for key in self.KEYS:
+                if record[key] is not None:
+                    self.lookup[key][record[key]].add(row)
+            if record['cid'] and _clean(title):
+                self.titles[record['cid']] = title
+
+    def find(self, key: str, value) -> List[Dict[str, Optional[str]]]:
+        """All records linked to one identifier value ('smiles' values are canonicalized first)."""
+        value = canonical_smiles(value) if key == 'smiles' else _clean(value)
+        if value is None:
+            return []
+        with self.lock:
+            return [self.records[row] for row in self.lookup[key].get(value, ())]
+
+    def related(self, key: str, value, target: str) -> List[str]:
+        """Distinct `target` identifiers linked to one identifier value, e.g. related('cas', '57-88-5', 'cid')."""
+        seen = []
+        for record in self.find(key, value):
+            if record[target] is not None and record[target] not in seen:
+                seen.append(record[target])
+        return seen
+
+    def cid_of(self, cas: Optional[str] = None, smiles: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Local (cid, title) for a CAS number or SMILES; the first linked CID wins."""
+        for key, value in (('cas', cas), ('smiles', smiles)):
+            cids = self.related(key, value, 'cid')
+            if cids:
+                return cids[0], self.titles.get(cids[0], '')
+            # A CAS known only with its SMILES (e.g. from LOTUS) can still reach a CID through the structure.
+            if key == 'cas':
+                for structure in self.related('cas', value, 'smiles'):
+                    cids = self.related('smiles', structure, 'cid')
+                    if cids:
+                        return cids[0], self.titles.get(cids[0], '')
+        return None
+
+    @staticmethod
+    def _source_signature(paths: Iterable[str]) -> list:
+        return [(os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path))
+                for path in paths if os.path.exists(path)]
+
+    def save(self, path: str, signature: list, cache_offset: int):
+        """Writes the index, the source signature it was built from and how much of the PubChem cache it holds."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            state = {'version': SNAPSHOT_VERSION, 'signature': signature, 'cache_offset': cache_offset,
+                     'records': self.records, 'lookup': {k: dict(v) for k, v in self.lookup.items()},
+                     'titles': self.titles, 'misses': self.misses}
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _load_snapshot(cls, path: str, signature: list) -> Optional[Tuple['IdentityIndex', int]]:
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if state.get('version') != SNAPSHOT_VERSION or state.get('signature') != signature:
+            return None
+        index = cls()
+        index.records, index.titles, index.misses = state['records'], state['titles'], state['misses']
+        for key, values in state['lookup'].items():
+            index.lookup[key].update(values)
+        return index, state['cache_offset']
+
+    @classmethod
+    def from_sources(cls, paths: Iterable[str] = IDENTITY_SOURCES,
+                     cache_path: Optional[str] = PUBCHEM_CACHE_PATH) -> 'IdentityIndex':
+        """Builds the index from CSV files with any of the cas/cid/smiles columns and the PubChem cache.
+
+        With a `cache_path`, the built index is saved as identity_index.pkl next to it and loaded
+        instead of rebuilt while the source files are unchanged; only PubChem answers appended to
+        the cache since then are replayed.
+        """
+        paths = list(paths)
+        signature = cls._source_signature(paths)
+        snapshot_path = os.path.join(os.path.dirname(cache_path), INDEX_SNAPSHOT_NAME) if cache_path else None
+        cache_size = os.path.getsize(cache_path) if cache_path and os.path.exists(cache_path) else 0
+        loaded = cls._load_snapshot(snapshot_path, signature) if snapshot_path else None
+        if loaded is not None and loaded[1] > cache_size:
+            loaded = None  # the PubChem cache was truncated or replaced since the snapshot
+        if loaded is not None:
+            index, offset = loaded
+        else:
+            index, offset = cls._build(paths), 0
+        if cache_size:
+            with open(cache_path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # cut off by a crash; that lookup is simply asked again
+                    index._add_pubchem_entry(entry)
+                end = f.tell()
+        else:
+            end = 0
+        if snapshot_path and (loaded is None or end != offset):
+            index.save(snapshot_path, signature, end)
+        index.cache_path = cache_path
+        return index
+
+    @classmethod
+    def _build(cls, paths: Iterable[str]) -> 'IdentityIndex':
+        import pandas as pd
+
+        index = cls()
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            df = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
+            columns = [c for c in ('cas', 'cid', 'smiles', 'inchikey') if c in df.columns]
+            title_column = next((c for c in ('structure_nameTraditional', 'name') if c in df.columns), None)
+            for row in df.itertuples(index=False):
+                values = {c: getattr(row, c) for c in columns}
+                index.add(**values, title=getattr(row, title_column) if title_column else None)
+        return index
+
+    def _add_pubchem_entry(self, entry: dict):
+        if entry.get('cid') is None:
+            with self.lock:
+                self.misses.add((entry['namespace'], entry['query']))
+            return
+        cas = entry['query'] if entry['namespace'] == 'name' else None
+        self.add(cas=cas, cid=entry['cid'], smiles=entry.get('smiles'), inchikey=entry.get('inchikey'),
+                 title=entry.get('title'))
+        if entry['namespace'] == 'smiles':
+            self.add(cid=entry['cid'], smiles=entry['query'])
+
+    def _remember(self, entry: dict):
+        self._add_pubchem_entry(entry)
+        if self.cache_path:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+            with self.lock, open(self.cache_path, 'a+b') as f:
+                # after a crash mid-append, start on a new line instead of extending the broken one
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+
+    def resolve(self, cas: Optional[str] = None, smiles: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """(cid, title) from the local index, asking PubChem only on a miss; answers are cached."""
+        local = self.cid_of(cas, smiles)
+        if local:
+            return local
+        for namespace, value in (('name', _clean(cas)), ('smiles', _clean(smiles))):
+            if value is None or (namespace, value) in self.misses:
+                continue
+            try:
+                properties = _pubchem_property_lookup(namespace, value)
+            except Exception as e:
+                print(f"Error resolving {namespace} {value} in PubChem: {str(e)}")
+                continue
+            entry = {'namespace': namespace, 'query': value, 'cid': None}
+            if properties:
+                entry.update({'cid': str(properties['CID']), 'title': properties.get('Title', ''),
+                              'inchikey': properties.get('InChIKey'),
+                              'smiles': properties.get('SMILES') or properties.get('IsomericSMILES')})
+            self._remember(entry)
+            if entry['cid']:
+                return entry['cid'], entry.get('title', '')
+        return None
+
+
+def _pubchem_property_lookup(namespace: str, value: str) -> Optional[dict]:
+    """Queries PubChem for the properties of one identifier ('name' or 'smiles')."""
+    _pubchem_limiter.wait()
+    url = PUBCHEM_PROPERTY_URL.format(namespace=namespace)
+    response = requests.post(url, data={namespace: value}, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    properties = response.json()["PropertyTable"]["Properties"]
+    return properties[0] if properties else None
+
+
+_default_index: Optional[IdentityIndex] = None
+
+
+def get_identity_index() -> IdentityIndex:
+    """The process-wide identity index, built on first use."""
+    global _default_index
+    if _default_index is None:
+        _default_index = IdentityIndex.from_sources()
+    return _default_index
+
+
+def lookup_cid(cas: Optional[str] = None, smiles: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """Resolves one compound to its PubChem CID and title.
+
+    The local identity index is consulted first; on a miss PubChem is queried by
+    CAS number (indexed as a synonym), then by SMILES.
+
+    Args:
+        cas (str): CAS registry number (e.g., "499-44-5").
+        smiles (str): SMILES string, used when the CAS number is missing or unknown.
+
+    Returns:
+        Optional[Tuple[str, str]]: (cid, title) if found, otherwise None.
+    """
+    return get_identity_index().resolve(cas, smiles)
+
+
+def resolve_cids(records: List[Dict[str, str]], max_workers: int = PUBCHEM_MAX_REQUESTS_PER_SECOND,
+                 index: Optional[IdentityIndex] = None) -> List[Optional[Tuple[str, str]]]:
+    """Resolves many compounds, answering locally where possible and sending only the misses to PubChem.
+
+    Args:
+        records (list): Dictionaries with 'cas' and/or 'smiles' keys.
+        max_workers (int): Number of concurrent PubChem lookups for the misses.
+        index (IdentityIndex): Index to use, defaults to the process-wide one.
+
+    Returns:
+        list: (cid, title) or None for each record, in input order.
+    """
+    index = index or get_identity_index()
+    results = [index.cid_of(record.get("cas"), record.get("smiles")) for record in records]
+    # Repeated identifiers in the batch are looked up once.
+    misses: Dict[Tuple[Optional[str], Optional[str]], List[int]] = {}
+    for i, result in enumerate(results):
+        if result is None:
+            misses.setdefault((_clean(records[i].get("cas")), _clean(records[i].get("smiles"))), []).append(i)
+    if misses:
+        n_missed = sum(len(rows) for rows in misses.values())
+        print(f"{len(records) - n_missed} identifiers resolved locally, {len(misses)} distinct misses sent to PubChem")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            remote = executor.map(lambda key: index.resolve(*key), misses)
+            for rows, result in zip(misses.values(), remote):
+                for i in rows:
+                    results[i] = result
+    return results
+
+
+# Example usage (for testing only)
+if __name__ == "__main__":
+    print(resolve_cids([{"cas": "499-44-5"}, {"smiles": "CC(C)C1=CC(=O)C(=CC=C1)O"}]))
+    print(get_identity_index().related("cas", "134678-17-4", "cid"))
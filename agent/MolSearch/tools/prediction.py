@@ -0,0 +1,54 @@
+"""
+Activity Prediction Module - Queries the resident DMPNN prediction service (model/predict_server.py).
+The service keeps the checkpoints_multi_all ensemble loaded and caches predictions by canonical SMILES,
+so each call costs one local HTTP round trip instead of a model load.
+"""
+
+import os
+from typing import Dict, Union
+
+import requests
+
+from .identity import canonical_smiles
+from .singleflight import coalesce
+
+PREDICTION_URL = os.getenv('MOLSEARCH_PREDICTION_URL', 'http://127.0.0.1:8765')
+REQUEST_TIMEOUT = 60
+
+
+@coalesce(key=lambda smiles_string: canonical_smiles(smiles_string))
+def predict_ec50_activity(smiles_string: str) -> Union[Dict, str]:
+    """Predicts the EC50 activity of a compound for every target of the in-house DMPNN model.
+
+    The model is a multi-task classifier trained on EC50 data; each value is the predicted
+    probability (0-1) that the compound is active against that target (e.g. 'EC50_rsub').
+
+    Args:
+        smiles_string (str): The SMILES string of the compound (e.g. 'CC(C)C1=CC(=O)C(=CC=C1)O').
+
+    Returns:
+        dict: {'canonical_smiles': ..., 'predicted_activity': {target: probability}} or an error message.
+
+    Example:
+        >>> predict_ec50_activity('CCO')
+        {'canonical_smiles': 'CCO', 'predicted_activity': {'EC50_drer': 0.02, ...}}
+    """
+    try:
+        response = requests.post(f"{PREDICTION_URL.rstrip('/')}/predict", json={'smiles': [smiles_string]},
+                                 timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        record = response.json()['predictions'][0]
+    except requests.exceptions.RequestException as e:
+        return f"Prediction service unavailable: {str(e)}"
+    except (ValueError, KeyError, IndexError) as e:
+        return f"Unexpected response from the prediction service: {str(e)}"
+    if 'error' in record:
+        return f"Prediction failed: {record['error']}"
+    return {
+        'canonical_smiles': record['canonical_smiles'],
+        'predicted_activity': {k: v for k, v in record.items() if k not in ('smiles', 'canonical_smiles')},
+    }
+
+
+if __name__ == "__main__":
+    print(predict_ec50_activity("CC(C)C1=CC(=O)C(=CC=C1)O"))
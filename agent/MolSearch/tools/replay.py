@@ -0,0 +1,159 @@
+"""
+HTTP Record/Replay Module - Captures the PubChem, ChEMBL, MCULE and EPA responses once and serves them offline.
+The harness hooks the `requests` transport adapter, which every tool (and the ChEMBL and ctxpy clients)
+sends through, so the tools run unchanged against recorded fixtures with configurable latency and error
+injection on an air-gapped machine.
+
+Usage:
+    from MolSearch.tools import replay
+    replay.install("record", "fixtures/http")          # live calls, responses saved
+    replay.install("replay", "fixtures/http", latency=0.05, error_rate=0.1)
+
+or set MOLSEARCH_HTTP_MODE / MOLSEARCH_HTTP_FIXTURES / MOLSEARCH_HTTP_LATENCY / MOLSEARCH_HTTP_ERROR_RATE
+and call `install_from_env()`.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+SENSITIVE_PARAMS = {'api_key', 'apikey', 'token', 'x-api-key'}
+_original_send = HTTPAdapter.send
+_state = {}
+_lock = threading.Lock()
+
+
+class FixtureNotFound(requests.exceptions.ConnectionError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def _normalized_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in SENSITIVE_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def request_key(method: str, url: str, body) -> str:
+    """Fixture key of a request: method, URL without credentials and query order, and a hash of the body."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    body_hash = hashlib.sha1(body or b'').hexdigest()
+    return hashlib.sha1(f"{method.upper()} {_normalized_url(url)} {body_hash}".encode('utf-8')).hexdigest()
+
+
+def _fixture_path(fixtures_dir: str, key: str) -> str:
+    return os.path.join(fixtures_dir, f"{key}.json")
+
+
+def _record_send(adapter, request, **kwargs):
+    start = time.monotonic()
+    response = _original_send(adapter, request, **kwargs)
+    content = response.content
+    fixture = {
+        'method': request.method,
+        'url': _normalized_url(request.url),
+        'status': response.status_code,
+        'reason': response.reason,
+        'headers': {k: v for k, v in response.headers.items()
+                    if k.lower() not in ('content-encoding', 'transfer-encoding', 'set-cookie', 'content-length')},
+        'body': base64.b64encode(content).decode('ascii'),
+        'elapsed': time.monotonic() - start,
+    }
+    os.makedirs(_state['fixtures_dir'], exist_ok=True)
+    path = _fixture_path(_state['fixtures_dir'], request_key(request.method, request.url, request.body))
+    with _lock, open(path, 'w', encoding='utf-8') as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=1)
+    return response
+
+
+def _replay_send(adapter, request, **kwargs):
+    path = _fixture_path(_state['fixtures_dir'], request_key(request.method, request.url, request.body))
+    rng = _state['rng']
+    with _lock:
+        delay = _state['latency'] + rng.uniform(0, _state['jitter'])
+        fail = rng.random() < _state['error_rate']
+    if delay > 0:
+        time.sleep(delay)
+    if fail:
+        if _state['error_status']:
+            return _build_response(request, {'status': _state['error_status'], 'reason': 'Injected error',
+                                             'headers': {}, 'body': ''})
+        raise requests.exceptions.ConnectionError(f"Injected connection error for {request.url}", request=request)
+    if not os.path.exists(path):
+        raise FixtureNotFound(f"No recorded response for {request.method} {_normalized_url(request.url)}",
+                              request=request)
+    with open(path, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    return _build_response(request, fixture)
+
+
+def _build_response(request, fixture: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = fixture['status']
+    response.reason = fixture.get('reason', '')
+    response.headers = CaseInsensitiveDict(fixture.get('headers', {}))
+    response._content = base64.b64decode(fixture.get('body', ''))
+    response.url = request.url
+    response.request = request
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def install(mode: str, fixtures_dir: str, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+            error_status: Optional[int] = None, seed: Optional[int] = None):
+    """Routes every `requests` call through the recorder or the replayer.
+
+    Args:
+        mode (str): 'record' (live calls, responses saved), 'replay' (fixtures only) or 'live' (uninstall).
+        fixtures_dir (str): Directory holding one JSON file per recorded request.
+        latency (float): Seconds added to every replayed response.
+        jitter (float): Extra uniformly distributed delay of up to this many seconds.
+        error_rate (float): Fraction of replayed requests that fail.
+        error_status (int): HTTP status of injected failures (e.g. 429, 503); connection errors when None.
+        seed (int): Seed of the latency and error generator, for reproducible runs.
+    """
+    if mode == 'live':
+        uninstall()
+        return
+    if mode not in ('record', 'replay'):
+        raise ValueError(f"Unknown HTTP mode: {mode}")
+    _state.update({'mode': mode, 'fixtures_dir': fixtures_dir, 'latency': latency, 'jitter': jitter,
+                   'error_rate': error_rate, 'error_status': error_status, 'rng': random.Random(seed)})
+    HTTPAdapter.send = _record_send if mode == 'record' else _replay_send
+    try:
+        # The ChEMBL client keeps its own response cache, which would hide requests from the recorder.
+        from chembl_webresource_client.settings import Settings
+        Settings.Instance().CACHING = False
+    except ImportError:
+        pass
+
+
+def uninstall():
+    """Restores live HTTP."""
+    HTTPAdapter.send = _original_send
+    _state.clear()
+
+
+def install_from_env():
+    """Installs the harness from MOLSEARCH_HTTP_* environment variables, if MOLSEARCH_HTTP_MODE is set."""
+    mode = os.getenv('MOLSEARCH_HTTP_MODE')
+    if not mode:
+        return
+    error_status = os.getenv('MOLSEARCH_HTTP_ERROR_STATUS')
+    install(mode, os.getenv('MOLSEARCH_HTTP_FIXTURES', 'fixtures/http'),
+            latency=float(os.getenv('MOLSEARCH_HTTP_LATENCY', '0')),
+            jitter=float(os.getenv('MOLSEARCH_HTTP_JITTER', '0')),
+            error_rate=float(os.getenv('MOLSEARCH_HTTP_ERROR_RATE', '0')),
+            error_status=int(error_status) if error_status else None,
+            seed=int(os.getenv('MOLSEARCH_HTTP_SEED', '0')))
@@ -0,0 +1,138 @@
+"""
+Request Coalescing Module - Shares one in-flight lookup between concurrent callers asking for the same key.
+When several molecules of a batch resolve to the same CID, CAS number or structure, only the first caller
+hits PubChem/ChEMBL/MCULE/EPA; the others wait for that call and receive its result (or its exception).
+
+ADK runs a synchronous FunctionTool inline on the event-loop thread, so the agents register the `aio`
+variant of each coalesced tool: it runs the lookup in a worker thread and shares one asyncio future per
+key between the coroutines of the loop (parallel branches and the molecules `batch_run --concurrency`
+runs at once). Plain calls from threads are coalesced by the synchronous wrapper.
+"""
+
+import asyncio
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Duplicate call suppression keyed by an arbitrary hashable key.
+
+    Nothing is cached once a call has finished: a later call with the same key
+    runs again. Only callers that overlap in time share one execution.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Duplicate call suppression for coroutines of one event loop.
+
+    The leader runs the blocking function in a worker thread; later callers with the
+    same key await the leader's future. As with `SingleFlight`, nothing is cached.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)  # futures belong to one loop
+        future = self._calls.get(call_key)
+        if future is not None:
+            self.shared += 1
+            # shield: a cancelled waiter must not cancel the leader's call for everyone else
+            return await asyncio.shield(future)
+        future = self._calls[call_key] = loop.create_future()
+        # an error nobody else waited for is still re-raised to the leader, so don't log it as unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            result = await asyncio.to_thread(fn, *args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[call_key]
+
+
+def _strip(value: Any) -> Any:
+    return value.strip() if isinstance(value, str) else value
+
+
+def coalesce(key: Optional[Callable[..., Hashable]] = None):
+    """Decorator running concurrent calls of a function with the same key only once.
+
+    Args:
+        key: Maps the call arguments to the coalescing key; defaults to the
+            positional and keyword arguments with surrounding whitespace stripped.
+
+    The wrapped function keeps its name, docstring and signature, so it can still
+    be registered as an ADK tool. `wrapper.aio` is the coroutine version with the
+    same name, docstring and signature, coalescing callers on one event loop.
+    """
+    def decorator(fn):
+        flight = SingleFlight()
+        async_flight = AsyncSingleFlight()
+
+        def call_key(args, kwargs):
+            if key is not None:
+                return key(*args, **kwargs)
+            return (tuple(_strip(a) for a in args), tuple(sorted((k, _strip(v)) for k, v in kwargs.items())))
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return flight.do(call_key(args, kwargs), fn, *args, **kwargs)
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            return await async_flight.do(call_key(args, kwargs), wrapper, *args, **kwargs)
+
+        wrapper.single_flight = flight
+        async_wrapper.single_flight = async_flight
+        wrapper.aio = async_wrapper
+        return wrapper
+
+    return decorator
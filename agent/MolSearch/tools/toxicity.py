@@ -3,14 +3,15 @@ Toxicity Data Retrieval Module - Fetches compound toxicity information from the
 This module provides tools to retrieve and analyze toxicity data for compounds using their CAS numbers.
 """
 import asyncio
+import os
 import requests
-import ctxpy as ctx
 from typing import Dict, List, Optional, Any
-import pandas as pd
+from .singleflight import coalesce
 
-CTXPY_API_KEY = "7f641716-4ee0-45e8-b4c9-413162478c5a"
+CTXPY_API_KEY = os.getenv("CTXPY_API_KEY", "7f641716-4ee0-45e8-b4c9-413162478c5a")
 REQUEST_TIMEOUT = 10
 
+@coalesce(key=lambda cas_number: str(cas_number).strip())
 def fetch_toxicity_data(cas_number: str) -> Dict[str, Any]:
     """
     Retrieve toxicity information for a compound from the EPA using its CAS number.
@@ -25,6 +26,8 @@ def fetch_toxicity_data(cas_number: str) -> Dict[str, Any]:
         pandas dataframe: EPA data records
     """
     try:
+        # Imported here: ctxpy (and the pandas it loads) is only needed for an EPA lookup.
+        import ctxpy as ctx
         chem = ctx.Chemical(x_api_key=CTXPY_API_KEY)
         info = chem.search(by='equals', word=cas_number)
         if not info:
@@ -3,5 +3,12 @@ MolSearch package initialization.
 """
 
 # from .MolSearch import root_agent
-from .MolSearch.agent import root_agent
-__all__ = ['root_agent'] 
\ No newline at end of file
+# root_agent is resolved on first access, so `import agent` does not load google.adk.
+__all__ = ['root_agent']
+
+
+def __getattr__(name):
+    if name == 'root_agent':
+        from .MolSearch.agent import root_agent
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
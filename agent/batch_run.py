@@ -1,12 +1,14 @@
+import argparse
 import asyncio
-import pandas as pd
+import hashlib
+import heapq
 import json
 import os
 import re
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.adk.runners import Runner
-from google.genai import types
-from MolSearch.agent import root_agent
+import subprocess
+import sys
+from datetime import datetime
+# google.adk、pandas 和 agent 在用到时才导入，只解析结果或分发任务时启动更快
 os.environ["OPENAI_API_KEY"] = "YOUR API KEY"
 os.environ["OPENAI_API_BASE"] = "YOUR API BASE"
 
@@ -25,6 +27,7 @@ def extract_json_from_markdown(text):
     return text
 
 async def call_agent_async(query: str, runner, user_id, session_id):
+    from google.genai import types
     print(f"\n>>> User Query: {query}")
     content = types.Content(role='user', parts=[types.Part(text=query)])
     final_response_text = None
@@ -35,49 +38,280 @@ async def call_agent_async(query: str, runner, user_id, session_id):
             break
     return final_response_text
 
-async def batch_query():
-    df = pd.read_csv(CSV_PATH)
-    session_service = InMemorySessionService()
+def read_molecules(path):
+    """读取分子表，支持 CSV 和 Parquet。"""
+    import pandas as pd
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=['structure_nameTraditional', 'cas', 'cid', 'smiles'])
+    return pd.read_csv(path)
+
+def open_session_service(session_db=None):
+    """会话存储：默认内存；给出 session_db 时使用 SQLite 文件，进程崩溃后仍可查看未完成分子的会话。"""
+    if session_db:
+        from google.adk.sessions.database_session_service import DatabaseSessionService
+        return DatabaseSessionService(db_url=f"sqlite:///{os.path.abspath(session_db)}")
+    from google.adk.sessions.in_memory_session_service import InMemorySessionService
+    return InMemorySessionService()
+
+def write_results(records, output_path):
+    """把结果流式写成 JSON 数组（格式与 json.dump(indent=2) 相同），写完后原子替换，返回记录数。"""
+    tmp_path = output_path + '.tmp'
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as dst:
+        dst.write('[')
+        for record in records:
+            dst.write(',\n' if count else '\n')
+            dst.write('  ' + json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+            count += 1
+        dst.write('\n]')
+    os.replace(tmp_path, output_path)
+    return count
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """逐条读出 JSON 数组文件中的记录，不把整个文件读入内存。"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} 不是 JSON 数组")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,')
+            if buffer.startswith(']'):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer) if buffer else (None, 0)
+            except json.JSONDecodeError:
+                end = 0
+            if end:
+                yield record
+                buffer = buffer[end:]
+                continue
+            more = f.read(chunk_size)
+            if not more:
+                raise ValueError(f"{path} 不完整")
+            buffer += more
+
+def scan_partial(partial_path):
+    """扫描 <output>.partial.jsonl：返回 {行号: 该行最新记录的文件偏移} 和已成功的行号集合。
+
+    重跑时追加写入，失败的分子会再次运行，所以同一行可能有多条记录，以最后一条为准。
+    只保存偏移而不是记录本身，内存占用与结果大小无关。
+    """
+    offsets, done = {}, set()
+    if not os.path.exists(partial_path):
+        return offsets, done
+    with open(partial_path, 'rb') as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 崩溃时写了一半的最后一行
+            offsets[record['row']] = offset
+            if 'error' in record:
+                done.discard(record['row'])
+            else:
+                done.add(record['row'])
+    return offsets, done
+
+def repair_partial(partial_path):
+    """截掉崩溃时写了一半、没有换行结尾的最后一行，否则追加的下一条记录会接在它后面而被整行丢弃。"""
+    if not os.path.exists(partial_path):
+        return
+    with open(partial_path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < f.seek(0, os.SEEK_END):
+            f.truncate(end)
+
+def iter_partial(partial_path, offsets, keep_row=False):
+    """按行号顺序读出每行最新的记录。"""
+    with open(partial_path, 'rb') as f:
+        for row in sorted(offsets):
+            f.seek(offsets[row])
+            record = json.loads(f.readline())
+            if not keep_row:
+                record.pop('row', None)
+            yield record
+
+def shard_of(cas, cid, smiles, num_shards):
+    """按分子内容的哈希分片：与行顺序和进程无关，每个节点独立算出相同的划分。
+
+    标识符先规范化（3611.0 -> 3611，NaN/None/空 -> None），同一分子表的 CSV 和 Parquet
+    版本因类型推断不同读出的值不同，也会得到相同的划分。
+    """
+    from MolSearch.tools.identity import _clean
+    cas, cid, smiles = _clean(cas), _clean(cid), _clean(smiles)
+    digest = hashlib.md5(f"{cas}|{cid}|{smiles}".encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % num_shards
+
+def shard_output_path(output_path, shard_index, num_shards):
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.shard-{shard_index}-of-{num_shards}{ext or '.json'}"
+
+def load_env_file(path):
+    """读取 KEY=VALUE 格式的凭据文件（OPENAI_API_KEY、OPENAI_API_BASE、MCULE_API_TOKEN、CTXPY_API_KEY 等）。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            os.environ[key.strip().removeprefix('export ').strip()] = value.strip().strip('"').strip("'")
+
+def merge_shards(output_path, num_shards):
+    """按输入行号合并各分片的结果，得到与单进程运行相同顺序的结果文件。"""
+    paths = [shard_output_path(output_path, i, num_shards) for i in range(num_shards)]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"缺少分片结果: {', '.join(missing)}")
+    # 每个分片内部已按行号有序，流式读出后做一次多路归并即可
+    merged = heapq.merge(*(iter_json_array(path) for path in paths), key=lambda record: record['row'])
+    count = write_results(({k: v for k, v in record.items() if k != 'row'} for record in merged), output_path)
+    print(f"已合并 {num_shards} 个分片，共 {count} 条结果，保存到 {output_path}")
+
+def launch_workers(args, num_workers):
+    """在本机启动 num_workers 个分片进程，全部成功后合并结果。env_file 中的 {shard} 会替换为分片号。"""
+    processes = []
+    for i in range(num_workers):
+        cmd = [sys.executable, os.path.abspath(__file__), '--input', args.input, '--output', args.output,
+               '--num_shards', str(num_workers), '--shard_index', str(i)]
+        if args.env_file:
+            cmd += ['--env_file', args.env_file.format(shard=i)]
+        if args.session_db:
+            cmd += ['--session_db', shard_output_path(args.session_db, i, num_workers)]
+        if args.keep_failed_sessions:
+            cmd.append('--keep_failed_sessions')
+        if args.concurrency > 1:
+            cmd += ['--concurrency', str(args.concurrency)]
+        if args.http_mode:
+            cmd += ['--http_mode', args.http_mode, '--fixtures_dir', args.fixtures_dir, '--latency', str(args.latency),
+                    '--error_rate', str(args.error_rate)]
+            if args.error_status:
+                cmd += ['--error_status', str(args.error_status)]
+        processes.append(subprocess.Popen(cmd))
+    failed = [i for i, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"分片 {failed} 运行失败，修复后可用 --shard_index 单独重跑，再用 --merge 合并")
+    merge_shards(args.output, num_workers)
+
+async def batch_query(csv_path=CSV_PATH, output_path=OUTPUT_PATH, session_db=None, keep_failed_sessions=False,
+                      num_shards=1, shard_index=0, env_file=None, concurrency=1):
+    """逐个分子运行 agent 并保存结果。
+
+    每个分子的结果写入磁盘后立即删除它的会话（事件历史包含完整的工具返回和 LLM 回复），
+    结果也只追加到 <output>.partial.jsonl，内存占用与分子数量无关。中断后用相同的输入重跑，
+    partial.jsonl 中已成功的分子会跳过，只运行剩余和失败的分子。
+
+    Args:
+        csv_path (str): 分子表（CSV 或 Parquet）。
+        output_path (str): 结果 JSON 文件。
+        session_db (str): 可选的 SQLite 会话库路径，用于崩溃后排查。
+        keep_failed_sessions (bool): 保留结果无法解析的分子的会话（配合 session_db 使用）。
+        num_shards (int): 分片总数；大于 1 时只处理 shard_index 对应的分子，结果写入
+            <output>.shard-<i>-of-<n>.json 并带上输入行号 row，之后用 merge_shards 合并。
+        shard_index (int): 本进程处理的分片。
+        env_file (str): 本分片使用的凭据文件（各分片可使用不同的 API key）。
+        concurrency (int): 同时运行的分子数。并发的分子共用一个事件循环，查询相同 CID、CAS 或结构的
+            工具调用只请求一次（见 MolSearch/tools/singleflight.py）。
+    """
+    from google.adk.runners import Runner
+    import MolSearch  # 包初始化会设置默认的 OPENAI_* 变量，凭据文件需在其后加载
+    if env_file:
+        load_env_file(env_file)
+    from MolSearch.agent import root_agent
+    df = read_molecules(csv_path)
+    if num_shards > 1:
+        keep = [shard_of(row['cas'], row['cid'], row['smiles'], num_shards) == shard_index
+                for _, row in df.iterrows()]
+        df = df[keep]
+        output_path = shard_output_path(output_path, shard_index, num_shards)
+    session_service = open_session_service(session_db)
     APP_NAME = "batch_agent"
     USER_ID = "user_batch"
-    results = []
-    for idx, row in df.iterrows():
-        name = str(row['structure_nameTraditional'])
-        cas = str(row['cas'])
-        cid = str(row['cid'])
-        smiles = str(row['smiles'])
-        query = f"Analyze the activity, availability, and toxicity information of the molecule {name} which CAS number is {cas}, PubChem CID is {cid}, and SMILES is {smiles}."
-        SESSION_ID = f"session_{idx:04d}"
-        session = await session_service.create_session(
-            app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID
-        )
-        runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
-        print(f"[{idx+1}/{len(df)}] Querying: {name} (CAS: {cas}, CID: {cid}) ...")
-        try:
-            agent_result = await call_agent_async(query, runner, USER_ID, SESSION_ID)
-            # 处理 markdown 代码块包裹的 json
-            json_str = extract_json_from_markdown(agent_result)
-            agent_json = json.loads(json_str)
-        except Exception as e:
-            agent_json = None
-            error_msg = str(e)
-        merged = {
-            "name": name,
-            "cas": cas,
-            "cid": cid,
-            "smiles": smiles
-        }
-        if isinstance(agent_json, dict):
-            merged.update(agent_json)
-        else:
-            merged["error"] = error_msg
-        results.append(merged)
-        with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-    print(f"全部完成，结果已保存到 {OUTPUT_PATH}")
+    runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+    partial_path = output_path + '.partial.jsonl'
+    total = len(df) if num_shards == 1 else f"{len(df)} in shard {shard_index}"
+    repair_partial(partial_path)
+    _, done = scan_partial(partial_path)
+    if done:
+        print(f"partial.jsonl 中已有 {len(done)} 个分子的结果，跳过这些分子")
+    # 会话 ID 每次运行都不同：保留下来的失败会话（或崩溃残留的会话）不会和重跑冲突
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+    with open(partial_path, 'a', encoding='utf-8') as partial:
+        async def run_one(idx, row):
+            name = str(row['structure_nameTraditional'])
+            cas = str(row['cas'])
+            cid = str(row['cid'])
+            smiles = str(row['smiles'])
+            query = f"Analyze the activity, availability, and toxicity information of the molecule {name} which CAS number is {cas}, PubChem CID is {cid}, and SMILES is {smiles}."
+            SESSION_ID = f"session_{idx:04d}_{run_id}"
+            session = await session_service.create_session(
+                app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID
+            )
+            print(f"[{idx+1}/{total}] Querying: {name} (CAS: {cas}, CID: {cid}) ...")
+            try:
+                agent_result = await call_agent_async(query, runner, USER_ID, SESSION_ID)
+                # 处理 markdown 代码块包裹的 json
+                json_str = extract_json_from_markdown(agent_result)
+                agent_json = json.loads(json_str)
+            except Exception as e:
+                agent_json = None
+                error_msg = str(e)
+            merged = {
+                "name": name,
+                "cas": cas,
+                "cid": cid,
+                "smiles": smiles
+            }
+            if isinstance(agent_json, dict):
+                merged.update(agent_json)
+            else:
+                merged["error"] = error_msg
+            merged["row"] = int(idx)
+            partial.write(json.dumps(merged, ensure_ascii=False) + '\n')
+            partial.flush()
+            # 结果已落盘，释放会话（失败的会话可选保留以便排查）
+            if not (keep_failed_sessions and "error" in merged):
+                await session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID)
+
+        pending = ((idx, row) for idx, row in df.iterrows() if int(idx) not in done)
+
+        async def worker():
+            # 各 worker 共用一个生成器，依次取下一个待运行的分子
+            for idx, row in pending:
+                await run_one(idx, row)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    offsets, _ = scan_partial(partial_path)
+    # 分片结果保留行号供 merge_shards 归并
+    write_results(iter_partial(partial_path, offsets, keep_row=num_shards > 1), output_path)
+    missing = sorted(set(int(idx) for idx in df.index) - offsets.keys())
+    if missing:
+        # 有分子没有任何记录时保留 partial.jsonl，重跑即可补齐
+        print(f"{len(missing)} 个分子没有结果（行号 {missing[:10]}...），保留 {partial_path}，请重跑补齐")
+        return
+    os.remove(partial_path)
+    print(f"全部完成，结果已保存到 {output_path}")
 
 
 async def run_team_conversation(session_id):
+        from google.adk.sessions.in_memory_session_service import InMemorySessionService
+        from google.adk.runners import Runner
+        from MolSearch.agent import root_agent
         session_service = InMemorySessionService()
         APP_NAME = "MolSearch"
         USER_ID = "user_1_agent_team"
@@ -101,10 +335,48 @@ if __name__ == "__main__":
     warnings.filterwarnings("ignore")
     import logging
     logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="批量分子分析")
+    parser.add_argument('--input', default=CSV_PATH)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--session_db', default=None, help="SQLite 会话库路径（默认内存，结果保存后删除会话）")
+    parser.add_argument('--keep_failed_sessions', action='store_true', help="保留解析失败的分子的会话，便于排查")
+    parser.add_argument('--num_shards', type=int, default=1, help="分片总数（按分子哈希划分）")
+    parser.add_argument('--shard_index', type=int, default=0, help="本进程处理的分片号")
+    parser.add_argument('--env_file', default=None, help="本分片的凭据文件（KEY=VALUE），--launch 时可含 {shard}")
+    parser.add_argument('--concurrency', type=int, default=1, help="每个进程同时运行的分子数")
+    parser.add_argument('--merge', action='store_true', help="按行号合并 --num_shards 个分片的结果到 --output")
+    parser.add_argument('--launch', type=int, default=0, metavar='N', help="在本机启动 N 个分片进程并在结束后合并")
+    parser.add_argument('--llm_cache', default=None, metavar='AGENTS',
+                        help="缓存这些 agent 的 LLM 回复（all 或逗号分隔的 agent 名），重跑时输入未变的调用直接命中")
+    parser.add_argument('--http_mode', choices=['live', 'record', 'replay'], default=None,
+                        help="record: 保存真实响应; replay: 只使用已录制的响应（离线）")
+    parser.add_argument('--fixtures_dir', default=os.path.join(os.path.dirname(__file__), 'fixtures', 'http'))
+    parser.add_argument('--latency', type=float, default=0.0, help="replay 时每个请求增加的延迟（秒）")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="replay 时注入错误的比例")
+    parser.add_argument('--error_status', type=int, default=None, help="注入错误的 HTTP 状态码，默认连接错误")
+    args = parser.parse_args()
+    if args.llm_cache:
+        os.environ['MOLSEARCH_LLM_CACHE'] = args.llm_cache
+    if args.merge:
+        merge_shards(args.output, args.num_shards)
+        sys.exit(0)
+    if args.launch:
+        launch_workers(args, args.launch)
+        sys.exit(0)
+    from MolSearch.tools import replay
+    if args.http_mode:
+        replay.install(args.http_mode, args.fixtures_dir, latency=args.latency, error_rate=args.error_rate,
+                       error_status=args.error_status, seed=0)
+    else:
+        replay.install_from_env()
     try:
-        asyncio.run(batch_query())
+        asyncio.run(batch_query(args.input, args.output, session_db=args.session_db,
+                                keep_failed_sessions=args.keep_failed_sessions, num_shards=args.num_shards,
+                                shard_index=args.shard_index, env_file=args.env_file,
+                                concurrency=args.concurrency))
     except Exception as e:
         print(f"批量查询发生错误: {e}")
+        sys.exit(1)
 
 
 # import asyncio
@@ -0,0 +1,298 @@
+"""
+Results store - indexed SQLite copy of the MolSearch batch outputs.
+
+batch_result.json (and the sharded / partial outputs of batch_run.py, or molecules.csv)
+are loaded into one table with indexes on cid, cas, smiles and the recommendation score,
+and an FTS5 full-text index over the name, the *_result / *_summary / *_brief fields and
+the overall evaluation. Loading is an upsert keyed by CAS (or CID, or SMILES), so files
+can be re-loaded as batches grow; the newest record of a molecule wins.
+
+Example:
+    python agent/results_store.py load agent/batch_result.json agent/molecules.csv
+    python agent/results_store.py query --text "antiviral NOT cytotoxic" --min_score 50
+    python agent/results_store.py query --brief "in stock" --order score --limit 20 --format csv
+    python agent/results_store.py stats
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(AGENT_DIR, '.cache', 'results.sqlite')
+
+ID_COLUMNS = ('name', 'cas', 'cid', 'smiles')
+KEY_COLUMNS = ('cas', 'cid', 'smiles')
+BRIEF_COLUMNS = ('activity_brief', 'toxicity_brief', 'availability_brief',
+                 'activity_label', 'toxicity_label', 'availability_label')
+TEXT_COLUMNS = ('activity_result', 'toxicity_result', 'availability_result',
+                'activity_summary', 'toxicity_summary', 'availability_summary', 'overall_evaluation')
+FTS_COLUMNS = ('name',) + BRIEF_COLUMNS[:3] + TEXT_COLUMNS
+MISSING_IDENTIFIERS = {'', 'nan', 'none', 'null', '<na>'}
+DEFAULT_COLUMNS = ('name', 'cas', 'cid', 'score', 'activity_brief', 'toxicity_brief', 'availability_brief')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    {', '.join(f'{c} TEXT' for c in ID_COLUMNS + BRIEF_COLUMNS + TEXT_COLUMNS)},
+    score REAL,
+    error TEXT,
+    source TEXT,
+    loaded_at TEXT,
+    record TEXT
+);
+CREATE INDEX IF NOT EXISTS results_cid ON results(cid);
+CREATE INDEX IF NOT EXISTS results_cas ON results(cas);
+CREATE INDEX IF NOT EXISTS results_smiles ON results(smiles);
+CREATE INDEX IF NOT EXISTS results_score ON results(score);
+CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+    {', '.join(FTS_COLUMNS)}, content='results', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS results_ai AFTER INSERT ON results BEGIN
+    INSERT INTO results_fts(rowid, {', '.join(FTS_COLUMNS)}) VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS results_ad AFTER DELETE ON results BEGIN
+    INSERT INTO results_fts(results_fts, rowid, {', '.join(FTS_COLUMNS)})
+    VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS results_au AFTER UPDATE ON results BEGIN
+    INSERT INTO results_fts(results_fts, rowid, {', '.join(FTS_COLUMNS)})
+    VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    INSERT INTO results_fts(rowid, {', '.join(FTS_COLUMNS)}) VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+END;
+"""
+RECORD_COLUMNS = ('key',) + ID_COLUMNS + BRIEF_COLUMNS + TEXT_COLUMNS + ('score', 'error', 'source', 'loaded_at', 'record')
+
+
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """Opens (and creates if needed) the results database."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """Yields the records of a batch_run JSON array, a JSONL (partial / shard) file or a molecules CSV."""
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith('.csv'):
+        csv.field_size_limit(sys.maxsize)
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def _text(value) -> Optional[str]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def _score(value) -> Optional[float]:
+    """Numeric recommended_for_experiment; '60', 60 and '60%' all give 60.0."""
+    try:
+        return float(str(value).strip().rstrip('%'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _identifier(value) -> Optional[str]:
+    """Identifier text, None for the placeholders pandas and str() leave for missing values ('nan', 'None', ...)."""
+    value = _text(value)
+    if value is None or value.strip().lower() in MISSING_IDENTIFIERS:
+        return None
+    return value.strip()
+
+
+def record_key(record: dict) -> Optional[str]:
+    for column in KEY_COLUMNS:
+        value = _identifier(record.get(column))
+        if value:
+            return f"{column}:{value}"
+    return None
+
+
+def to_row(record: dict, source: str, loaded_at: str) -> Optional[tuple]:
+    key = record_key(record)
+    if key is None:
+        return None
+    values = {'key': key, 'score': _score(record.get('recommended_for_experiment')), 'error': _text(record.get('error')),
+              'source': source, 'loaded_at': loaded_at, 'record': json.dumps(record, ensure_ascii=False)}
+    for column in ID_COLUMNS + BRIEF_COLUMNS + TEXT_COLUMNS:
+        values[column] = _identifier(record.get(column)) if column in KEY_COLUMNS else _text(record.get(column))
+    return tuple(values[column] for column in RECORD_COLUMNS)
+
+
+def load(conn: sqlite3.Connection, paths: Iterable[str], batch_size: int = 1000) -> Dict[str, int]:
+    """Upserts the records of `paths`; returns the number of records loaded per file."""
+    placeholders = ', '.join('?' for _ in RECORD_COLUMNS)
+    updates = ', '.join(f"{c}=excluded.{c}" for c in RECORD_COLUMNS if c != 'key')
+    sql = (f"INSERT INTO results ({', '.join(RECORD_COLUMNS)}) VALUES ({placeholders}) "
+           f"ON CONFLICT(key) DO UPDATE SET {updates}")
+    loaded_at = datetime.now().isoformat(timespec='seconds')
+    counts = {}
+    for path in paths:
+        source, n, batch = os.path.abspath(path), 0, []
+        with conn:
+            for record in iter_records(path):
+                row = to_row(record, source, loaded_at)
+                if row is None:
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    conn.executemany(sql, batch)
+                    n, batch = n + len(batch), []
+            if batch:
+                conn.executemany(sql, batch)
+                n += len(batch)
+        counts[path] = n
+    return counts
+
+
+def query(conn: sqlite3.Connection, text: Optional[str] = None, min_score: Optional[float] = None,
+          max_score: Optional[float] = None, brief: Optional[str] = None, cid: Optional[str] = None,
+          cas: Optional[str] = None, smiles: Optional[str] = None, errors: Optional[bool] = None,
+          columns: Iterable[str] = DEFAULT_COLUMNS, order: str = 'score', limit: Optional[int] = 50) -> List[dict]:
+    """Filters the stored results.
+
+    Args:
+        text (str): FTS5 query over the name, briefs, results, summaries and overall evaluation
+            (e.g. 'antiviral NOT cytotoxic', '"acute oral toxicity"', 'toxicity_summary:ld50').
+        min_score (float): Minimum recommended_for_experiment score.
+        max_score (float): Maximum recommended_for_experiment score.
+        brief (str): Case-insensitive substring of any *_brief / *_label field.
+        cid (str): Exact PubChem CID.
+        cas (str): Exact CAS number.
+        smiles (str): Exact SMILES as stored.
+        errors (bool): True for failed molecules only, False for successful ones only.
+        columns (list): Columns returned; 'snippet' adds the best matching passage of a text query.
+        order (str): 'score' (descending), 'rank' (text relevance) or 'name'.
+        limit (int): Maximum number of rows, None for all.
+
+    Returns:
+        list: One dict per matching molecule.
+
+    Raises:
+        ValueError: `text` is not a valid FTS5 query (e.g. an unquoted '3-hydroxy').
+    """
+    columns = list(columns)
+    select = [f"r.{c}" for c in columns if c != 'snippet']
+    where, params = [], []
+    source = "results r"
+    if text:
+        source = "results_fts JOIN results r ON r.id = results_fts.rowid"
+        where.append("results_fts MATCH ?")
+        params.append(text)
+        if 'snippet' in columns:
+            select.append("snippet(results_fts, -1, '[', ']', ' ... ', 16) AS snippet")
+    for column, op, value in (('score', '>=', min_score), ('score', '<=', max_score),
+                              ('cid', '=', cid), ('cas', '=', cas), ('smiles', '=', smiles)):
+        if value is not None:
+            where.append(f"r.{column} {op} ?")
+            params.append(value)
+    if brief:
+        where.append('(' + ' OR '.join(f"r.{c} LIKE ?" for c in BRIEF_COLUMNS) + ')')
+        params.extend([f"%{brief}%"] * len(BRIEF_COLUMNS))
+    if errors is not None:
+        where.append("r.error IS NOT NULL" if errors else "r.error IS NULL")
+    orders = {'score': "r.score IS NULL, r.score DESC, r.name", 'name': "r.name",
+              'rank': "bm25(results_fts)" if text else "r.score IS NULL, r.score DESC"}
+    sql = f"SELECT {', '.join(select)} FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {orders[order]}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.OperationalError as e:
+        if not text:
+            raise
+        raise ValueError(f"invalid full-text query {text!r} ({e}); quote terms with punctuation, "
+                         f"e.g. '\"3-hydroxy\"'") from None
+
+
+def stats(conn: sqlite3.Connection) -> dict:
+    """Number of stored molecules, failures and the score distribution."""
+    row = conn.execute("SELECT COUNT(*), COUNT(error), COUNT(score), AVG(score), MIN(score), MAX(score) "
+                       "FROM results").fetchone()
+    sources = conn.execute("SELECT source, COUNT(*) FROM results GROUP BY source ORDER BY source").fetchall()
+    return {'molecules': row[0], 'errors': row[1], 'scored': row[2], 'mean_score': row[3],
+            'min_score': row[4], 'max_score': row[5], 'sources': {s: n for s, n in sources}}
+
+
+def _print_rows(rows: List[dict], fmt: str):
+    if fmt == 'json':
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if not rows:
+        return
+    if fmt == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+    widths = {c: min(40, max(len(c), *(len(str(r[c] or '')) for r in rows))) for c in rows[0]}
+    print('  '.join(c.ljust(widths[c]) for c in rows[0]))
+    for r in rows:
+        print('  '.join(str(r[c] if r[c] is not None else '')[:widths[c]].ljust(widths[c]) for c in r))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexed SQLite store of MolSearch batch results.")
+    parser.add_argument('--db', default=DB_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    load_parser = subparsers.add_parser('load', help="load batch_run JSON / JSONL or molecules CSV files")
+    load_parser.add_argument('paths', nargs='+')
+    query_parser = subparsers.add_parser('query', help="filter the stored results")
+    query_parser.add_argument('--text', default=None, help="FTS5 full-text query")
+    query_parser.add_argument('--min_score', type=float, default=None)
+    query_parser.add_argument('--max_score', type=float, default=None)
+    query_parser.add_argument('--brief', default=None, help="substring of the brief / label fields")
+    query_parser.add_argument('--cid', default=None)
+    query_parser.add_argument('--cas', default=None)
+    query_parser.add_argument('--smiles', default=None)
+    query_parser.add_argument('--errors', action='store_true', help="only molecules whose analysis failed")
+    query_parser.add_argument('--columns', nargs='+', default=list(DEFAULT_COLUMNS),
+                              help="result columns, plus 'snippet' for text queries")
+    query_parser.add_argument('--order', choices=['score', 'rank', 'name'], default='score')
+    query_parser.add_argument('--limit', type=int, default=50, help="0 for no limit")
+    query_parser.add_argument('--format', choices=['table', 'json', 'csv'], default='table')
+    subparsers.add_parser('stats', help="summary of the stored results")
+    cli_args = parser.parse_args()
+
+    conn = connect(cli_args.db)
+    if cli_args.command == 'load':
+        for path, n in load(conn, cli_args.paths).items():
+            print(f"loaded {n} records from {path}")
+    elif cli_args.command == 'query':
+        if cli_args.columns:
+            unknown = set(cli_args.columns) - set(RECORD_COLUMNS) - {'id', 'snippet'}
+            if unknown:
+                parser.error(f"unknown columns: {', '.join(sorted(unknown))}")
+        try:
+            rows = query(conn, cli_args.text, cli_args.min_score, cli_args.max_score, cli_args.brief, cli_args.cid,
+                         cli_args.cas, cli_args.smiles, True if cli_args.errors else None, cli_args.columns,
+                         cli_args.order, cli_args.limit or None)
+        except ValueError as e:
+            parser.error(str(e))
+        _print_rows(rows, cli_args.format)
+    else:
+        print(json.dumps(stats(conn), indent=2))
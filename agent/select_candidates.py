@@ -0,0 +1,160 @@
+"""
+Candidate selection - hands the top-scoring molecules of a DMPNN screen to the MolSearch batch pipeline.
+
+The prediction file (e.g. lotus/smiles_with_cas_preds.csv) is streamed in chunks
+and the top-K molecules are kept in bounded heaps, either per target or by one
+multi-target score. Their CAS numbers are resolved to PubChem CIDs in bulk and
+the result is written in the molecules_cas_cid_smiles.csv format, optionally
+followed directly by the batch agent run.
+
+Example:
+    python agent/select_candidates.py --top_k 20 --per_target --run
+"""
+
+import argparse
+import asyncio
+import heapq
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from MolSearch.tools.identity import resolve_cids
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREDS_PATH = os.path.join(ROOT_DIR, 'lotus', 'smiles_with_cas_preds.csv')
+CANDIDATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'candidates_cas_cid_smiles.csv')
+CHUNK_SIZE = 10000
+
+
+def _iter_predictions(preds_path: str, columns: List[str], chunk_size: int):
+    """Yields the needed columns of a CSV or (memory-mapped) Parquet prediction file in chunks."""
+    if preds_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(preds_path, memory_map=True).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(preds_path, chunksize=chunk_size, usecols=columns)
+
+
+def _columns_of(preds_path: str) -> List[str]:
+    if preds_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_schema(preds_path).names
+    return list(pd.read_csv(preds_path, nrows=0).columns)
+
+
+def _push(heap, k, score, row_id, row):
+    if np.isnan(score):
+        return
+    if len(heap) < k:
+        heapq.heappush(heap, (score, row_id, row))
+    elif score > heap[0][0]:
+        heapq.heapreplace(heap, (score, row_id, row))
+
+
+def select_top_k(preds_path: str, k: int, targets: Optional[List[str]] = None, per_target: bool = False,
+                 aggregate: str = 'max', chunk_size: int = CHUNK_SIZE, min_ad_similarity: Optional[float] = None,
+                 in_domain_only: bool = False) -> pd.DataFrame:
+    """Streams a prediction file and keeps the top-K molecules.
+
+    Args:
+        preds_path (str): CSV or Parquet file with a 'smiles' column, optionally 'cas', and one column per target.
+        k (int): Number of molecules kept (per target when `per_target` is True).
+        targets (list): Target columns, defaults to every column starting with 'EC50_'.
+        per_target (bool): Keep the top-K of every target and return their union.
+        aggregate (str): 'max' or 'mean' over targets when not selecting per target.
+        chunk_size (int): Number of rows read at a time.
+        min_ad_similarity (float): Skip molecules whose 'ad_max_similarity' to the training set is lower.
+        in_domain_only (bool): Skip molecules whose 'ad_in_domain' flag is False.
+
+    Returns:
+        pd.DataFrame: Selected rows sorted by descending 'score', with a 'selected_by' column.
+    """
+    all_columns = _columns_of(preds_path)
+    if targets is None:
+        targets = [c for c in all_columns if c.startswith('EC50_')]
+    # Only the identifiers and scores are read, whatever else the prediction file holds.
+    columns = [c for c in all_columns if c in ('smiles', 'cas', 'structure_wikidata')] + targets
+    ad_columns = [c for c in all_columns if c.startswith('ad_')]
+    if (min_ad_similarity is not None or in_domain_only) and not ad_columns:
+        raise ValueError(f"{preds_path} has no applicability-domain columns, run model/applicability.py first "
+                         f"and pass its output (<preds>_ad.csv)")
+    columns += ad_columns
+    heaps = {target: [] for target in targets} if per_target else {aggregate: []}
+    row_offset = 0
+    for chunk in _iter_predictions(preds_path, columns, chunk_size):
+        scores = chunk[targets].apply(pd.to_numeric, errors='coerce')
+        # Out-of-domain molecules are dropped before they can reach the heaps.
+        if min_ad_similarity is not None:
+            scores[~(chunk['ad_max_similarity'] >= min_ad_similarity)] = np.nan
+        if in_domain_only:
+            scores[~chunk['ad_in_domain'].astype(str).isin(['True', 'true', '1'])] = np.nan
+        if not per_target:
+            scores = pd.DataFrame({aggregate: scores.max(axis=1) if aggregate == 'max' else scores.mean(axis=1)})
+        for name, heap in heaps.items():
+            column = scores[name].values
+            # Only rows that can enter the heap are materialized.
+            floor = heap[0][0] if len(heap) >= k else -np.inf
+            for i in np.flatnonzero(column > floor):
+                _push(heap, k, column[i], row_offset + i, chunk.iloc[i])
+        row_offset += len(chunk)
+
+    best = {}
+    for name, heap in heaps.items():
+        for score, row_id, row in heap:
+            if row_id not in best or score > best[row_id][0]:
+                best[row_id] = (score, name, row)
+    rows = []
+    for row_id, (score, name, row) in best.items():
+        row = row.to_dict()
+        row.update({'score': score, 'selected_by': name})
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame(columns=['smiles', 'score', 'selected_by'])
+    return pd.DataFrame(rows).sort_values('score', ascending=False).reset_index(drop=True)
+
+
+def attach_cids(candidates: pd.DataFrame) -> pd.DataFrame:
+    """Resolves CAS/SMILES to PubChem CIDs in bulk and drops the molecules PubChem does not know."""
+    records = [{'cas': str(row.get('cas', '')), 'smiles': str(row['smiles'])} for _, row in candidates.iterrows()]
+    resolved = resolve_cids(records)
+    candidates = candidates.copy()
+    candidates['cid'] = [r[0] if r else None for r in resolved]
+    candidates['structure_nameTraditional'] = [r[1] if r and r[1] else None for r in resolved]
+    missing = candidates['cid'].isna()
+    if missing.any():
+        print(f"{int(missing.sum())} candidates have no PubChem CID and are skipped")
+    candidates = candidates[~missing]
+    if 'cas' not in candidates:
+        candidates['cas'] = ''
+    candidates['structure_nameTraditional'] = candidates['structure_nameTraditional'].fillna(candidates['cas'])
+    columns = ['structure_nameTraditional', 'cas', 'cid', 'smiles', 'score', 'selected_by']
+    return candidates[columns + [c for c in candidates.columns if c not in columns]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select top-K predicted molecules and hand them to the batch agent run.")
+    parser.add_argument('--preds_path', default=PREDS_PATH)
+    parser.add_argument('--output_path', default=CANDIDATES_PATH)
+    parser.add_argument('--top_k', type=int, default=20)
+    parser.add_argument('--targets', nargs='*', default=None)
+    parser.add_argument('--per_target', action='store_true', help="top-K per target instead of one multi-target score")
+    parser.add_argument('--aggregate', choices=['max', 'mean'], default='max')
+    parser.add_argument('--min_ad_similarity', type=float, default=None,
+                        help="minimum Tanimoto similarity to the nearest training molecule")
+    parser.add_argument('--in_domain_only', action='store_true', help="keep only molecules flagged ad_in_domain")
+    parser.add_argument('--run', action='store_true', help="run the batch agent on the selected candidates")
+    parser.add_argument('--results_path', default=None, help="batch agent output, defaults to batch_run.OUTPUT_PATH")
+    args = parser.parse_args()
+
+    candidates = select_top_k(args.preds_path, args.top_k, args.targets, args.per_target, args.aggregate,
+                              min_ad_similarity=args.min_ad_similarity, in_domain_only=args.in_domain_only)
+    candidates = attach_cids(candidates)
+    candidates.to_csv(args.output_path, index=False)
+    print(f"{len(candidates)} candidates saved to {args.output_path}")
+
+    if args.run:
+        import batch_run
+        asyncio.run(batch_run.batch_query(args.output_path, args.results_path or batch_run.OUTPUT_PATH))
@@ -0,0 +1,199 @@
+"""
+Benchmark cases for the pipeline's hot paths.
+
+Every case is a setup function registered with `@case`. Setup (fixture
+generation, model loading) is not timed; it returns a callable that runs the
+measured work once and returns the number of items it processed, from which the
+throughput is computed. Fixtures are fixed: synthetic data comes from seeded
+generators and real data from fixed slices of the repository files.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from typing import Callable, List, NamedTuple, Sequence
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENT_DIR = os.path.join(ROOT_DIR, 'agent')
+MODEL_DIR = os.path.join(ROOT_DIR, 'model')
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+for path in (AGENT_DIR, MODEL_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+LOTUS_PATH = os.path.join(ROOT_DIR, 'lotus', 'lotus_smiles_with_cas.csv')
+CHECKPOINT_DIR = os.getenv('BENCH_CHECKPOINT_DIR', os.path.join(ROOT_DIR, 'checkpoints', 'checkpoints_multi_all'))
+
+
+class Case(NamedTuple):
+    name: str
+    setup: Callable[[], Callable[[], int]]
+    requires: Sequence[str]
+    repeat: int
+
+
+CASES: List[Case] = []
+
+
+def case(name: str, requires: Sequence[str] = (), repeat: int = 3):
+    def decorator(setup):
+        CASES.append(Case(name, setup, tuple(requires), repeat))
+        return setup
+    return decorator
+
+
+class Skip(Exception):
+    """Raised by a setup function when a fixture (e.g. a checkpoint) is not available."""
+
+
+class ImportBudget(NamedTuple):
+    module: str
+    seconds: float
+    forbidden: Sequence[str]
+
+
+HEAVY_MODULES = ('google.adk', 'litellm', 'chembl_webresource_client', 'ctxpy', 'pandas')
+# Cold-import budgets (fresh interpreter, wall time of the import statement) for the modules every
+# batch job and worker process starts with. `forbidden` lists modules the import must not pull in.
+IMPORT_BUDGETS = [
+    ImportBudget('agent', 0.1, HEAVY_MODULES),
+    ImportBudget('MolSearch.agent', 0.1, HEAVY_MODULES),
+    ImportBudget('MolSearch.tools.activity', 0.5, HEAVY_MODULES),
+    ImportBudget('MolSearch.tools.toxicity', 0.5, HEAVY_MODULES),
+    ImportBudget('MolSearch.tools.availability', 0.5, HEAVY_MODULES),
+    ImportBudget('batch_run', 0.1, HEAVY_MODULES),
+]
+
+
+def chembl_records(n: int = 20000, seed: int = 0) -> List[dict]:
+    """Synthetic ChEMBL activity records with the key mix and sparsity of real responses."""
+    rng = np.random.RandomState(seed)
+    organisms = [f"Organism {i}" for i in range(300)] + [None]
+    types = ['IC50', 'EC50', 'Ki', 'MIC', 'Inhibition', None, '']
+    records = []
+    for i in range(n):
+        records.append({
+            'activity_id': i,
+            'standard_type': types[rng.randint(len(types))],
+            'relation': ['=', '>', '<', None][rng.randint(4)],
+            'standard_value': str(round(rng.lognormal(5, 2), 3)) if rng.rand() > 0.1 else None,
+            'standard_units': ['nM', 'ug.mL-1', '%', None][rng.randint(4)],
+            'assay_description': f"Assay {rng.randint(5000)} measuring inhibition in a cell-based format",
+            'target_pref_name': f"Target {rng.randint(800)}" if rng.rand() > 0.2 else None,
+            'target_organism': organisms[rng.randint(len(organisms))],
+            'activity_comment': [None, '', 'Not Active', 'Active'][rng.randint(4)],
+            'document_chembl_id': f"CHEMBL{rng.randint(10 ** 6)}",
+            'ligand_efficiency': None,
+            'action_type': [],
+        })
+    return records
+
+
+def lotus_smiles(n: int) -> List[str]:
+    import pandas as pd
+    return pd.read_csv(LOTUS_PATH, nrows=n)['smiles'].tolist()
+
+
+@case('activity_dedup', requires=['MolSearch.tools.activity'])
+def bench_activity_dedup():
+    from MolSearch.tools.activity import process_and_deduplicate_activity_data
+    records = chembl_records()
+    return lambda: (process_and_deduplicate_activity_data(records), len(records))[1]
+
+
+@case('markdown_json_parse', requires=['batch_run'])
+def bench_markdown_json_parse():
+    from batch_run import extract_json_from_markdown
+    with open(os.path.join(AGENT_DIR, 'batch_result.json'), 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    texts = ["Here is the report:\n```json\n" + json.dumps(entry, ensure_ascii=False, indent=1) + "\n```"
+             for entry in entries]
+
+    def run():
+        for text in texts:
+            parsed = json.loads(extract_json_from_markdown(text))
+            parsed.get('recommended_for_experiment')
+        return len(texts)
+    return run
+
+
+@case('rdkit_2d_featurization', requires=['chemprop', 'descriptastorus'], repeat=1)
+def bench_rdkit_2d_featurization():
+    from chemprop.features.features_generators import rdkit_2d_normalized_features_generator
+    smiles = lotus_smiles(200)
+    return lambda: (np.array([rdkit_2d_normalized_features_generator(s) for s in smiles]), len(smiles))[1]
+
+
+@case('bootstrap_auc', requires=['sklearn'], repeat=1)
+def bench_bootstrap_auc():
+    from metrics import bootstrap_auc
+    rng = np.random.RandomState(0)
+    y = rng.randint(0, 2, 300)
+    scores = np.clip(y * 0.3 + rng.rand(300) * 0.7, 0, 1)
+    n_bootstrap = 300
+    return lambda: (bootstrap_auc(y, scores, n_bootstrap, random_state=0), n_bootstrap)[1]
+
+
+@case('svm_training', requires=['sklearn'], repeat=1)
+def bench_svm_training():
+    from sklearn.svm import SVC
+    rng = np.random.RandomState(0)
+    X = rng.randn(800, 200)
+    y = (X[:, :10].sum(axis=1) + rng.randn(800) > 0).astype(int)
+    return lambda: (SVC(probability=True, kernel='rbf', C=1.0, random_state=0).fit(X, y), len(y))[1]
+
+
+@case('fingerprint_topk', requires=['rdkit'], repeat=3)
+def bench_fingerprint_topk():
+    from fpindex import FingerprintIndex, morgan_fingerprints
+    smiles = lotus_smiles(5000)
+    index = FingerprintIndex.build(smiles)
+    queries = morgan_fingerprints(smiles[:500])
+    return lambda: (index.search_topk(queries, 5), len(queries))[1]
+
+
+@case('chunked_ensemble_prediction', requires=['chemprop'], repeat=1)
+def bench_chunked_ensemble_prediction():
+    if not os.path.isdir(CHECKPOINT_DIR):
+        raise Skip(f"no checkpoints in {CHECKPOINT_DIR} (set BENCH_CHECKPOINT_DIR)")
+    from screening import load_ensemble, stream_predictions
+    ensemble = load_ensemble(CHECKPOINT_DIR, gpu=None)
+    work_dir = tempfile.mkdtemp(prefix='bench_predict_')
+    sample_path = os.path.join(work_dir, 'lotus_sample.csv')
+    import pandas as pd
+    pd.read_csv(LOTUS_PATH, nrows=500).to_csv(sample_path, index=False)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return stream_predictions(sample_path, os.path.join(work_dir, 'preds.csv'), chunk_size=100,
+                                      resume=False, ensemble=ensemble)
+    return run
+
+
+@case('batch_run_end_to_end', requires=['google.adk', 'batch_run'], repeat=1)
+def bench_batch_run_end_to_end():
+    import pandas as pd
+    import batch_run
+    from MolSearch.agent import root_agent
+    from MolSearch.tools import replay
+    from stub_llm import use_stub_llm
+
+    use_stub_llm(root_agent)
+    # Recorded fixtures are used when present (record them with batch_run.py --http_mode record);
+    # otherwise every HTTP call fails fast offline, which only exercises the agent and parsing path.
+    replay.install('replay', os.path.join(FIXTURES_DIR, 'http'), seed=0)
+    work_dir = tempfile.mkdtemp(prefix='bench_batch_')
+    input_path = os.path.join(work_dir, 'molecules.csv')
+    pd.read_csv(os.path.join(AGENT_DIR, 'molecules_cas_cid_smiles.csv'), nrows=10).to_csv(input_path, index=False)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(batch_run.batch_query(input_path, os.path.join(work_dir, 'results.json')))
+        return 10
+    return run
@@ -0,0 +1,171 @@
+"""
+Runs the benchmark suite, reports throughput and peak memory, and flags regressions.
+
+Usage (from the repository root):
+    python benchmarks/run.py                      # run everything, compare with baselines.json
+    python benchmarks/run.py --only activity_dedup bootstrap_auc
+    python benchmarks/run.py --update-baselines   # record the current numbers as the new baselines
+
+Throughput is the best of the case's repeats (items per second). Peak memory is
+the peak of Python-tracked allocations (tracemalloc, which includes NumPy
+buffers) during one extra run. Cases whose dependencies or fixtures are missing
+are reported as skipped. Each module in IMPORT_BUDGETS is then imported in a fresh
+interpreter and must stay within its time budget without loading any of its
+forbidden modules. The exit status is 1 when any case regressed by more than the
+tolerance or any import is over budget.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cases import AGENT_DIR, CASES, IMPORT_BUDGETS, ROOT_DIR, Skip  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def _missing(modules):
+    missing = []
+    for module in modules:
+        try:
+            if importlib.util.find_spec(module) is None:
+                missing.append(module)
+        except (ImportError, ValueError):
+            missing.append(module)
+    return missing
+
+
+def measure(bench_case):
+    """Runs one case and returns its result record."""
+    missing = _missing(bench_case.requires)
+    if missing:
+        return {'status': 'skipped', 'reason': f"missing {', '.join(missing)}"}
+    try:
+        run = bench_case.setup()
+    except Skip as e:
+        return {'status': 'skipped', 'reason': str(e)}
+    except ImportError as e:
+        return {'status': 'skipped', 'reason': f"import failed: {e}"}
+
+    run()  # warm-up
+    best = 0.0
+    for _ in range(bench_case.repeat):
+        start = time.perf_counter()
+        items = run()
+        best = max(best, items / (time.perf_counter() - start))
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'status': 'ok', 'throughput': best, 'peak_mb': peak / 2 ** 20}
+
+
+IMPORT_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def measure_import(budget, repeat=3):
+    """Imports `budget.module` in fresh interpreters; returns the best time and the forbidden modules loaded."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT_DIR, AGENT_DIR, os.environ.get('PYTHONPATH', '')]))
+    best, loaded = None, []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', IMPORT_PROBE, budget.module, *budget.forbidden],
+                              capture_output=True, text=True, env=env, cwd=ROOT_DIR)
+        if proc.returncode != 0:
+            return {'status': 'error', 'reason': proc.stderr.strip().splitlines()[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        best = result['seconds'] if best is None else min(best, result['seconds'])
+        loaded = result['loaded']
+    return {'status': 'ok', 'seconds': best, 'loaded': loaded}
+
+
+def compare(name, result, baselines, tolerance):
+    """Returns a list of regression messages for one result."""
+    baseline = baselines.get(name)
+    if result['status'] != 'ok' or not baseline:
+        return []
+    problems = []
+    if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+        problems.append(f"throughput {result['throughput']:.1f}/s < baseline {baseline['throughput']:.1f}/s")
+    if result['peak_mb'] > baseline['peak_mb'] * (1 + tolerance) + 1:
+        problems.append(f"peak memory {result['peak_mb']:.1f} MB > baseline {baseline['peak_mb']:.1f} MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline's hot paths.")
+    parser.add_argument('--only', nargs='*', default=None, help="case names to run")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown / memory growth")
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--output', default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, 'r', encoding='utf-8') as f:
+            baselines = json.load(f).get('cases', {})
+
+    results, regressions = {}, {}
+    print(f"{'case':<30}{'throughput (items/s)':>22}{'peak MB':>10}  status")
+    for bench_case in CASES:
+        if args.only and bench_case.name not in args.only:
+            continue
+        result = measure(bench_case)
+        results[bench_case.name] = result
+        problems = compare(bench_case.name, result, baselines, args.tolerance)
+        if problems:
+            regressions[bench_case.name] = problems
+        if result['status'] == 'ok':
+            status = 'REGRESSION: ' + '; '.join(problems) if problems else 'ok'
+            print(f"{bench_case.name:<30}{result['throughput']:>22.1f}{result['peak_mb']:>10.1f}  {status}")
+        else:
+            print(f"{bench_case.name:<30}{'-':>22}{'-':>10}  skipped ({result['reason']})")
+
+    print(f"\n{'import':<30}{'seconds':>10}{'budget':>10}  status")
+    imports = {}
+    for budget in IMPORT_BUDGETS:
+        result = imports[budget.module] = measure_import(budget)
+        if result['status'] != 'ok':
+            regressions[f"import {budget.module}"] = [result['reason']]
+            print(f"{budget.module:<30}{'-':>10}{budget.seconds:>10.2f}  ERROR: {result['reason']}")
+            continue
+        problems = []
+        if result['seconds'] > budget.seconds:
+            problems.append('over budget')
+        if result['loaded']:
+            problems.append(f"loads {', '.join(result['loaded'])}")
+        if problems:
+            regressions[f"import {budget.module}"] = problems
+        status = 'OVER BUDGET: ' + '; '.join(problems) if problems else 'ok'
+        print(f"{budget.module:<30}{result['seconds']:>10.3f}{budget.seconds:>10.2f}  {status}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cases': results, 'imports': imports}, f, indent=2)
+    if args.update_baselines:
+        for name, result in results.items():
+            if result['status'] == 'ok':
+                baselines[name] = {'throughput': round(result['throughput'], 2), 'peak_mb': round(result['peak_mb'], 2)}
+        with open(BASELINES_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'machine': f"{platform.system()} {platform.machine()} python {platform.python_version()}",
+                       'cases': baselines}, f, indent=2)
+            f.write('\n')
+        print(f"baselines saved to {BASELINES_PATH}")
+    return 1 if regressions and not args.update_baselines else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,11 @@ import descriptastorus
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
+from splits import chemprop_split_args
+from hyperopt_halving import halving_hyperopt
+from featcache import install as install_featcache
+# graphs and rdkit_2d_normalized features are reused across hyperopt trials, folds and runs
+install_featcache()
 # %% function
 def hyperopt_train(type, target, split):
     start_time = datetime.now()
@@ -25,13 +30,15 @@ def hyperopt_train(type, target, split):
             '--quiet',
             '--seed', '32',
             '--class_balance',
-            '--split_type', 'scaffold_balanced',
         ]
     if type == "single":
         arguments.extend(['--target_columns', f'EC50_{target}'])
     if split != "scaffold":
-        args = chemprop.args.HyperoptArgs().parse_args(arguments)
-        chemprop.hyperparameter_optimization.hyperopt(args=args)
+        # chemprop resets --seed to 0 under index_predetermined; seed=32 only fixes the folds written here
+        arguments.extend(chemprop_split_args(f'data/{split}/merge_dataset_train.csv', num_folds=5,
+                                             split_type='scaffold', seed=32,
+                                             target_columns=[f'EC50_{target}'] if type == "single" else None))
+        halving_hyperopt(arguments)
         print(f"finish {target} MPNN hyperopt, cost time {datetime.now() - start_time}")
 
     start_time = datetime.now()
@@ -87,10 +94,11 @@ def single_task(target):
             '--quiet',
             '--seed', '32',
             '--class_balance',
-            '--split_type', 'scaffold_balanced',
+            # chemprop resets --seed to 0 under index_predetermined; seed=32 only fixes the folds
+            *chemprop_split_args('data/merge_dataset_train.csv', num_folds=5, split_type='scaffold', seed=32,
+                                 target_columns=[f'EC50_{target}']),
         ]
-    args = chemprop.args.HyperoptArgs().parse_args(arguments)
-    chemprop.hyperparameter_optimization.hyperopt(args=args)
+    halving_hyperopt(arguments)
     print(f"finish {target} MPNN hyperopt, cost time {datetime.now() - start_time}")
 
     start_time = datetime.now()
@@ -137,10 +145,10 @@ arguments = [
         '--quiet',
         '--seed', '32',
         '--class_balance',
-        '--split_type', 'scaffold_balanced',
+        # chemprop resets --seed to 0 under index_predetermined; seed=32 only fixes the folds
+        *chemprop_split_args('data/merge_dataset_train.csv', num_folds=5, split_type='scaffold', seed=32),
     ]
-args = chemprop.args.HyperoptArgs().parse_args(arguments)
-chemprop.hyperparameter_optimization.hyperopt(args=args)
+halving_hyperopt(arguments)
 print(f"finish multi-task DMPNN hyperopt, cost time {datetime.now() - start_time}")
 start_time = datetime.now()
 
@@ -193,11 +201,11 @@ arguments = [
         '--quiet',
         '--seed', '3407',
         '--class_balance',
-        '--split_type', 'scaffold_balanced',
+        # chemprop resets --seed to 0 under index_predetermined; seed=3407 only fixes the folds
+        *chemprop_split_args('data/merge_dataset.csv', num_folds=5, split_type='scaffold', seed=3407),
     ]
-args = chemprop.args.HyperoptArgs().parse_args(arguments)
 start_time = datetime.now()
-chemprop.hyperparameter_optimization.hyperopt(args=args)
+halving_hyperopt(arguments)
 print(f"finish multi-task DMPNN hyperopt, cost time {datetime.now() - start_time}")
 start_time = datetime.now()
 
@@ -228,15 +236,26 @@ print(f"finish multi-task MPNN train, cost time {datetime.now() - start_time}")
 
 
 # %% predict
-predict_arguments = [
-    '--test_path', f'lotus/lotus_smiles_with_cas.csv',
-    '--preds_path', f'lotus/smiles_with_cas_preds.csv',
-    '--checkpoint_dir', 'checkpoints/checkpoints_multi_all',
-    '--features_generator', 'rdkit_2d_normalized',
-    '--no_features_scaling',
-    '--gpu', '0',
-    '--num_workers', '0',
-    '--smiles_columns', 'smiles'
-]
-args = chemprop.args.PredictArgs().parse_args(predict_arguments)
-preds = chemprop.train.make_predictions(args=args)
+# canonicalize and deduplicate the library, then stream each unique structure through the ensemble chunk by chunk;
+# rerunning resumes after the last finished chunk
+from screening import screen_library
+start_time = datetime.now()
+screen_library(
+    test_path='lotus/lotus_smiles_with_cas.csv',
+    preds_path='lotus/smiles_with_cas_preds.csv',
+    checkpoint_dir='checkpoints/checkpoints_multi_all',
+    chunk_size=2000,
+    smiles_column='smiles',
+    features_generator='rdkit_2d_normalized',
+    gpu=0,
+    isomeric=True,
+    n_jobs=4,
+)
+print(f"finish LOTUS screening, cost time {datetime.now() - start_time}")
+
+# %% applicability domain of the LOTUS predictions
+from applicability import annotate_predictions
+start_time = datetime.now()
+annotate_predictions('lotus/smiles_with_cas_preds.csv', train_path='data/merge_dataset.csv',
+                     out_path='lotus/smiles_with_cas_preds_ad.csv')
+print(f"finish applicability domain, cost time {datetime.now() - start_time}")
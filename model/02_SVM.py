@@ -15,17 +15,24 @@ from skopt import BayesSearchCV
 from xgboost import XGBClassifier
 from sklearn.utils import resample
 import joblib
+from tables import read_table, table_path
+from splits import kfold_indices
+from metrics import bootstrap_auc
 
 
 # %% function
 def get_target_dataset(target, type, split):
-    all_mols = pd.read_csv(f"data/merge_{split}_{type}.csv", usecols=["smiles", f"EC50_{target}"])
+    all_mols = read_table(table_path(f"data/merge_{split}_{type}.csv"), columns=["smiles", f"EC50_{target}"])
     target_mols = all_mols[~np.isnan(all_mols[f'EC50_{target}'])]
     features = target_mols["smiles"].apply(chemprop.features.features_generators.rdkit_2d_normalized_features_generator)
     features = np.array(features.apply(pd.Series))
     targets = np.array(target_mols[f'EC50_{target}'])
     return features, targets
 
+def get_target_smiles(target, type, split):
+    all_mols = read_table(table_path(f"data/merge_{split}_{type}.csv"), columns=["smiles", f"EC50_{target}"])
+    return all_mols[~np.isnan(all_mols[f'EC50_{target}'])]["smiles"].tolist()
+
 # %%
 def printModelResultWithConfidence(model, X_train, y_train, X_test, y_test):
     model.fit(X_train, y_train)
@@ -44,14 +51,7 @@ def printModelResultWithConfidence(model, X_train, y_train, X_test, y_test):
 
     print("roc score (Test): %f" % test_auc)
 
-    n_bootstrap = 1000
-    auc_scores = []
-    for i in range(n_bootstrap):
-        y_test_sample, y_pred_sample = resample(y_test, prob_test[:, 1])
-        test_auc_bootstrap = roc_auc_score(y_test_sample, y_pred_sample)
-        auc_scores.append(test_auc_bootstrap)
-    average_auc = np.mean(auc_scores)
-    std_auc = np.std(auc_scores)
+    average_auc, std_auc = bootstrap_auc(y_test, prob_test[:, 1], n_bootstrap=1000)
 
     print(average_auc, std_auc)
     return [average_auc, std_auc, test_auc, prauc, accuracy, precision, recall, f1score]
@@ -84,7 +84,9 @@ for split in ["scaffold", "random"]:
                   'gamma': (1e-6, 1e+1, 'log-uniform'),
                   'kernel': ['linear', 'rbf']}
 
-        search = BayesSearchCV(clf, params, n_iter=30, cv=5, scoring='roc_auc', random_state=32)
+        # seeded scaffold/random folds from the shared split module, scaffolds are cached across runs
+        cv = kfold_indices(get_target_smiles(target, "train", split), num_folds=5, split_type=split, seed=32)
+        search = BayesSearchCV(clf, params, n_iter=30, cv=cv, scoring='roc_auc', random_state=32)
         search.fit(train_X, train_Y)
         print("---------finish search---------------")
         clf.set_params(**search.best_params_)
@@ -92,7 +94,7 @@ for split in ["scaffold", "random"]:
         test_auc = printModelResultWithConfidence(clf, train_X, train_Y, test_X, test_Y)
         joblib.dump(clf, f"SVM_Models1/svm_{split}_{target}.pkl")
 
-        all_mols = pd.read_csv(f"data/merge_{split}_test.csv", usecols=["smiles", f"EC50_{target}"])
+        all_mols = read_table(table_path(f"data/merge_{split}_test.csv"), columns=["smiles", f"EC50_{target}"])
         target_mols = all_mols[~np.isnan(all_mols[f'EC50_{target}'])].loc[:, 'smiles'].values
 
         prob_test_y = clf.predict_proba(test_X)
@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-
+"""
+Applicability-domain scoring of screening predictions.
+
+For every predicted molecule two distances to the training set are computed,
+in batches and fully vectorized:
+
+* fingerprint similarity: the Tanimoto similarity to the nearest training
+  molecule and the mean over the k nearest (from a `fpindex` index);
+* descriptor distance: the mean Euclidean distance to the k nearest training
+  molecules in standardized RDKit 2D descriptor space (the model's own
+  feature space), divided by the 95th percentile of the same statistic within
+  the training set, so values above 1 lie outside the training cloud.
+
+The results are appended as `ad_*` columns to the prediction file, so candidate
+selection can drop out-of-domain molecules before any API or LLM call.
+
+Example (run from the repository root):
+    python model/applicability.py --preds_path lotus/smiles_with_cas_preds.csv --train_path data/merge_dataset.csv
+    (writes lotus/smiles_with_cas_preds_ad.csv)
+"""
+
+import argparse
+import json
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import chemprop
+
+from fpindex import FingerprintIndex
+from tables import TableWriter, iter_table, read_table
+
+K_NEIGHBOURS = 5
+MIN_SIMILARITY = 0.3
+MAX_DESCRIPTOR_DISTANCE = 1.0
+REFERENCE_DIR = 'data/.cache/ad_reference'
+REFERENCE_VERSION = 2  # bump when the cached reference is computed differently
+CHUNK_SIZE = 2000
+
+
+def rdkit_2d_descriptors(smiles: Sequence[str]) -> np.ndarray:
+    """RDKit 2D normalized descriptors, as used to train the ensemble; invalid SMILES give NaN rows.
+
+    Descriptors RDKit cannot compute for a valid molecule are set to 0, as chemprop
+    does when it featurizes the molecule for the model.
+    """
+    generator = chemprop.features.features_generators.rdkit_2d_normalized_features_generator
+    rows = []
+    for s in smiles:
+        try:
+            rows.append(np.nan_to_num(np.asarray(generator(s), dtype=np.float32), nan=0.0))
+        except Exception:
+            rows.append(None)
+    width = next((len(r) for r in rows if r is not None), 0)
+    return np.array([r if r is not None else np.full(width, np.nan, dtype=np.float32) for r in rows])
+
+
+def _knn_mean_distance(queries: np.ndarray, reference: np.ndarray, reference_sq: np.ndarray, k: int,
+                       exclude_self: bool = False) -> np.ndarray:
+    """Mean Euclidean distance of every query to its k nearest reference rows."""
+    sq = (queries ** 2).sum(axis=1)
+    dist = np.sqrt(np.maximum(sq[:, None] + reference_sq[None, :] - 2 * queries @ reference.T, 0))
+    if exclude_self:
+        k += 1
+    k = min(k, dist.shape[1])
+    nearest = np.sort(np.partition(dist, k - 1, axis=1)[:, :k], axis=1)
+    if exclude_self:
+        nearest = nearest[:, 1:]
+    return nearest.mean(axis=1)
+
+
+class ApplicabilityDomain:
+    """Fingerprint and descriptor reference of the training set."""
+
+    def __init__(self, index: FingerprintIndex, train_smiles: np.ndarray, descriptors: np.ndarray,
+                 mean: np.ndarray, std: np.ndarray, distance_scale: float, k: int = K_NEIGHBOURS):
+        self.index = index
+        self.train_smiles = train_smiles
+        self.descriptors = descriptors
+        self.descriptors_sq = (descriptors ** 2).sum(axis=1)
+        self.mean = mean
+        self.std = std
+        self.distance_scale = distance_scale
+        self.k = k
+
+    @classmethod
+    def build(cls, train_path: str, reference_dir: Optional[str] = REFERENCE_DIR, smiles_column: str = 'smiles',
+              k: int = K_NEIGHBOURS) -> 'ApplicabilityDomain':
+        """Builds the reference from a training CSV, reusing the cached one in `reference_dir` if present."""
+        meta_path = os.path.join(reference_dir, 'meta.json') if reference_dir else None
+        if meta_path and os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("train_path") == train_path and meta.get("version") == REFERENCE_VERSION:
+                return cls.load(reference_dir)
+        train_smiles = read_table(train_path, columns=[smiles_column])[smiles_column].astype(str).values
+        index = FingerprintIndex.build(train_smiles)
+        raw = rdkit_2d_descriptors(train_smiles)
+        valid = ~np.isnan(raw).any(axis=1)  # only invalid SMILES are left with NaN
+        mean = raw[valid].mean(axis=0)
+        std = raw[valid].std(axis=0)
+        std[std == 0] = 1
+        descriptors = ((raw[valid] - mean) / std).astype(np.float32)
+        train_distance = _knn_mean_distance(descriptors, descriptors, (descriptors ** 2).sum(axis=1), k,
+                                            exclude_self=True)
+        domain = cls(index, train_smiles, descriptors, mean, std, float(np.percentile(train_distance, 95)), k)
+        if reference_dir:
+            domain.save(reference_dir, train_path)
+        return domain
+
+    def save(self, reference_dir: str, train_path: Optional[str] = None):
+        self.index.save(os.path.join(reference_dir, 'fingerprints'))
+        np.save(os.path.join(reference_dir, 'descriptors.npy'), self.descriptors)
+        np.save(os.path.join(reference_dir, 'mean.npy'), self.mean)
+        np.save(os.path.join(reference_dir, 'std.npy'), self.std)
+        with open(os.path.join(reference_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({"distance_scale": self.distance_scale, "k": self.k, "train_path": train_path,
+                       "version": REFERENCE_VERSION}, f)
+
+    @classmethod
+    def load(cls, reference_dir: str) -> 'ApplicabilityDomain':
+        with open(os.path.join(reference_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = FingerprintIndex.load(os.path.join(reference_dir, 'fingerprints'))
+        return cls(index, np.asarray(index.ids), np.load(os.path.join(reference_dir, 'descriptors.npy')),
+                   np.load(os.path.join(reference_dir, 'mean.npy')), np.load(os.path.join(reference_dir, 'std.npy')),
+                   meta["distance_scale"], meta["k"])
+
+    def score(self, smiles: Sequence[str], descriptors: bool = True) -> pd.DataFrame:
+        """Applicability-domain columns for a batch of SMILES."""
+        fps = self.index.fingerprints(smiles)
+        sims, positions = self.index.search_topk(fps, self.k)
+        # Invalid SMILES have an all-zero fingerprint: no neighbours rather than similarity 0.
+        parsed = fps.any(axis=1)
+        sims[~parsed], positions[~parsed] = np.nan, -1
+        found = positions >= 0
+        mean_similarity = np.full(len(smiles), np.nan)
+        has_neighbours = found.any(axis=1)
+        mean_similarity[has_neighbours] = (np.where(found, sims, 0).sum(axis=1)[has_neighbours]
+                                           / found.sum(axis=1)[has_neighbours])
+        result = pd.DataFrame({
+            'ad_max_similarity': sims[:, 0],
+            'ad_mean_similarity': mean_similarity,
+            'ad_nearest_train': np.where(positions[:, 0] >= 0, np.asarray(self.index.ids)[positions[:, 0]], ''),
+        })
+        in_domain = result['ad_max_similarity'] >= MIN_SIMILARITY
+        if descriptors:
+            raw = rdkit_2d_descriptors(smiles)
+            distance = np.full(len(smiles), np.nan)
+            valid = ~np.isnan(raw).any(axis=1) if raw.size else np.zeros(len(smiles), dtype=bool)
+            if valid.any():
+                scaled = ((raw[valid] - self.mean) / self.std).astype(np.float32)
+                distance[valid] = _knn_mean_distance(scaled, self.descriptors, self.descriptors_sq,
+                                                     self.k) / self.distance_scale
+            result['ad_descriptor_distance'] = distance
+            in_domain &= result['ad_descriptor_distance'] <= MAX_DESCRIPTOR_DISTANCE
+        result['ad_in_domain'] = in_domain
+        return result
+
+
+def annotated_path(preds_path: str) -> str:
+    """Default output of `annotate_predictions`: `<preds>_ad` with the same extension."""
+    stem, ext = os.path.splitext(preds_path)
+    return f"{stem}_ad{ext}"
+
+
+def annotate_predictions(preds_path: str, train_path: str = 'data/merge_dataset.csv', out_path: Optional[str] = None,
+                         smiles_column: str = 'smiles', chunk_size: int = CHUNK_SIZE, descriptors: bool = True,
+                         reference_dir: Optional[str] = REFERENCE_DIR) -> int:
+    """Adds applicability-domain columns to a prediction file, chunk by chunk.
+
+    The prediction file is left untouched by default: its progress record (screening.py)
+    refers to its byte size, so rewriting it would break a later resume.
+
+    Args:
+        preds_path (str): Prediction CSV or Parquet file.
+        train_path (str): Training data the ensemble was fit on.
+        out_path (str): Output CSV or Parquet file, defaults to `annotated_path(preds_path)`.
+            When it is `preds_path` itself, the screening progress record is removed.
+        descriptors (bool): Also compute the descriptor-space distance.
+
+    Returns:
+        int: Number of annotated rows.
+    """
+    domain = ApplicabilityDomain.build(train_path, reference_dir, smiles_column)
+    target_path = out_path or annotated_path(preds_path)
+    root, ext = os.path.splitext(target_path)
+    tmp_path = f"{root}.ad-tmp{ext}"
+    n_rows = 0
+    with TableWriter(tmp_path) as writer:
+        for chunk in iter_table(preds_path, chunk_size):
+            chunk = chunk.drop(columns=[c for c in chunk.columns if c.startswith('ad_')])
+            scores = domain.score(chunk[smiles_column].astype(str).tolist(), descriptors)
+            scores.index = chunk.index
+            writer.write(pd.concat([chunk, scores], axis=1))
+            n_rows += len(chunk)
+    os.replace(tmp_path, target_path)
+    progress_path = f"{target_path}.progress.json"
+    if os.path.abspath(target_path) == os.path.abspath(preds_path) and os.path.exists(progress_path):
+        os.remove(progress_path)
+    return n_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append applicability-domain columns to a prediction file.")
+    parser.add_argument('--preds_path', default='lotus/smiles_with_cas_preds.csv')
+    parser.add_argument('--train_path', default='data/merge_dataset.csv')
+    parser.add_argument('--out_path', default=None, help="default <preds>_ad.csv / .parquet")
+    parser.add_argument('--smiles_column', default='smiles')
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--no_descriptors', action='store_true', help="fingerprint similarity only")
+    cli_args = parser.parse_args()
+
+    n_rows = annotate_predictions(cli_args.preds_path, cli_args.train_path, cli_args.out_path,
+                                  cli_args.smiles_column, cli_args.chunk_size, not cli_args.no_descriptors)
+    print(f"annotated {n_rows} predictions")
@@ -0,0 +1,256 @@
+# -*- coding:utf-8 -*-
+"""
+Distillation of the DMPNN ensemble into a single fingerprint student.
+
+Every ensemble member featurizes with RDKit descriptors and runs its own
+message passing, so screening cost grows with the ensemble size. The student
+is one multi-task MLP on Morgan fingerprint bits (no descriptor step, no graph)
+trained to reproduce the ensemble's soft predictions (in logit space) over the
+training data and LOTUS. A held-out part of the molecules is used for a
+fidelity report: agreement with the teacher per target (correlation, error and
+overlap of the top-ranked molecules) and, where experimental labels exist, the
+AUC of teacher and student side by side.
+
+The saved student is a stage-1 scorer for model/funnel.py
+(`--stage1 student --student_path ...`), or a stand-alone fast scorer.
+
+Example (run from the repository root):
+    python model/distill.py train --checkpoint_dir checkpoints/checkpoints_multi_all \
+        --source_paths data/merge_dataset.csv lotus/lotus_smiles_with_cas.csv \
+        --student_path checkpoints/student_multi_all.pkl
+    python model/distill.py score --student_path checkpoints/student_multi_all.pkl \
+        --test_path lotus/lotus_smiles_with_cas.csv --preds_path lotus/smiles_with_cas_student_preds.csv
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.stats import pearsonr, spearmanr
+from sklearn.metrics import roc_auc_score
+from sklearn.neural_network import MLPRegressor
+
+from fpindex import N_BITS, RADIUS, morgan_fingerprints_parallel
+from screening import CHUNK_SIZE, canonicalize_many, load_ensemble, stream_predictions, stream_scores, task_names_of
+from tables import iter_table, read_table
+
+HIDDEN_LAYERS = (1024, 256)
+HOLDOUT_FRACTION = 0.1
+TOP_FRACTION = 0.01
+EPS = 1e-4
+
+
+def fingerprint_bits(smiles: Sequence[str], radius: int = RADIUS, n_bits: int = N_BITS, n_jobs: int = 1) -> np.ndarray:
+    """Unpacked Morgan fingerprints, (n, n_bits) float32; invalid SMILES get all zeros."""
+    fps = morgan_fingerprints_parallel(list(smiles), radius, n_bits, n_jobs)
+    return np.unpackbits(fps.view(np.uint8), axis=1).astype(np.float32)
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, EPS, 1 - EPS)
+    return np.log(p / (1 - p))
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+def teacher_predictions(source_paths: Sequence[str], checkpoint_dir: str, work_dir: str,
+                        smiles_column: str = 'smiles', features_generator: Optional[str] = 'rdkit_2d_normalized',
+                        gpu: Optional[int] = 0, chunk_size: int = CHUNK_SIZE) -> pd.DataFrame:
+    """Soft labels of the ensemble for every molecule of `source_paths`, one row per unique SMILES.
+
+    Predictions are streamed to `<work_dir>/<file>_teacher.csv` and resumed, so the
+    ensemble runs over each source only once.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    ensemble = None
+    frames = []
+    for path in source_paths:
+        preds_path = os.path.join(work_dir, f"{os.path.splitext(os.path.basename(path))[0]}_teacher.csv")
+        if ensemble is None:
+            ensemble = load_ensemble(checkpoint_dir, features_generator, smiles_column, gpu)
+        stream_predictions(path, preds_path, chunk_size=chunk_size, smiles_column=smiles_column, ensemble=ensemble)
+        task_names = task_names_of(ensemble[1])
+        frames.append(read_table(preds_path, columns=[smiles_column] + task_names))
+    teacher = pd.concat(frames, ignore_index=True).dropna(subset=task_names, how='all')
+    return teacher.drop_duplicates(subset=smiles_column).reset_index(drop=True)
+
+
+def train_student(smiles: Sequence[str], soft_labels: np.ndarray, hidden_layers: Sequence[int] = HIDDEN_LAYERS,
+                  radius: int = RADIUS, n_bits: int = N_BITS, seed: int = 0, n_jobs: int = 1,
+                  max_iter: int = 200) -> MLPRegressor:
+    """Fits the fingerprint MLP to the teacher's logits (missing teacher values are set to the task mean)."""
+    X = fingerprint_bits(smiles, radius, n_bits, n_jobs)
+    y = _logit(np.asarray(soft_labels, dtype=float))
+    y = np.where(np.isnan(y), np.nanmean(y, axis=0), y)
+    model = MLPRegressor(hidden_layer_sizes=tuple(hidden_layers), alpha=1e-4, batch_size=256,
+                         learning_rate_init=1e-3, max_iter=max_iter, early_stopping=True,
+                         validation_fraction=0.1, n_iter_no_change=10, random_state=seed)
+    return model.fit(X, y)
+
+
+def student_predict(student: dict, smiles: Sequence[str], n_jobs: int = 1) -> np.ndarray:
+    """(n, num_tasks) probabilities of a saved student; NaN for invalid SMILES."""
+    X = fingerprint_bits(smiles, student['radius'], student['n_bits'], n_jobs)
+    preds = _sigmoid(student['model'].predict(X)).reshape(len(smiles), -1)
+    preds[X.sum(axis=1) == 0] = np.nan
+    return preds
+
+
+def student_scorer(student_path: str, n_jobs: int = 1):
+    """Builds a stage-1 scorer for model/funnel.py from a saved student.
+
+    Returns:
+        tuple: (predict_fn, task_names)
+    """
+    student = joblib.load(student_path)
+    return (lambda smiles: student_predict(student, smiles, n_jobs)), list(student['task_names'])
+
+
+def fidelity_report(teacher: np.ndarray, student: np.ndarray, task_names: List[str],
+                    labels: Optional[pd.DataFrame] = None, top_fraction: float = TOP_FRACTION) -> Dict:
+    """Agreement of the student with the teacher per target.
+
+    Reports Pearson/Spearman correlation and mean absolute error of the
+    probabilities, and the fraction of the teacher's top `top_fraction` molecules
+    that are also in the student's top `top_fraction`. With experimental `labels`
+    (same rows, 0/1/NaN per target) the teacher and student AUCs are added.
+    """
+    report = {}
+    for j, task_name in enumerate(task_names):
+        t, s = teacher[:, j], student[:, j]
+        mask = ~(np.isnan(t) | np.isnan(s))
+        t, s = t[mask], s[mask]
+        if len(t) < 2:
+            continue
+        k = max(1, int(round(len(t) * top_fraction)))
+        top_teacher, top_student = set(np.argsort(-t)[:k]), set(np.argsort(-s)[:k])
+        entry = {
+            'n': int(len(t)),
+            'pearson': float(pearsonr(t, s)[0]),
+            'spearman': float(spearmanr(t, s)[0]),
+            'mae': float(np.abs(t - s).mean()),
+            f'top{top_fraction:g}_overlap': len(top_teacher & top_student) / k,
+        }
+        if labels is not None and task_name in labels:
+            y = labels[task_name].values[mask]
+            known = ~np.isnan(y)
+            if known.sum() and len(np.unique(y[known])) == 2:
+                entry['labelled'] = int(known.sum())
+                entry['teacher_auc'] = float(roc_auc_score(y[known], t[known]))
+                entry['student_auc'] = float(roc_auc_score(y[known], s[known]))
+        report[task_name] = entry
+    return report
+
+
+def holdout_mask(smiles: Sequence[str], holdout_fraction: float = HOLDOUT_FRACTION, seed: int = 0,
+                 n_jobs: int = 1) -> np.ndarray:
+    """Random held-out split by structure without stereochemistry.
+
+    Morgan bits ignore stereochemistry, so stereoisomers have identical student inputs;
+    splitting them across train and held-out would inflate the fidelity report. All
+    molecules with the same non-isomeric canonical SMILES land on the same side.
+    """
+    groups = np.asarray(canonicalize_many(list(smiles), isomeric=False, n_jobs=n_jobs), dtype=object)
+    unique_groups = np.unique(groups)
+    rng = np.random.RandomState(seed)
+    held_groups = set(unique_groups[rng.rand(len(unique_groups)) < holdout_fraction])
+    return np.array([group in held_groups for group in groups], dtype=bool)
+
+
+def distill(source_paths: Sequence[str], checkpoint_dir: str, student_path: str, work_dir: Optional[str] = None,
+            smiles_column: str = 'smiles', holdout_fraction: float = HOLDOUT_FRACTION,
+            hidden_layers: Sequence[int] = HIDDEN_LAYERS, seed: int = 0, n_jobs: int = 1,
+            gpu: Optional[int] = 0) -> Dict:
+    """Labels the sources with the ensemble, trains the student on all but a held-out part and reports fidelity.
+
+    Returns:
+        dict: The fidelity report, also written next to the student as `<student>_fidelity.json`.
+    """
+    work_dir = work_dir or f"{os.path.splitext(student_path)[0]}_work"
+    start_time = datetime.now()
+    teacher = teacher_predictions(source_paths, checkpoint_dir, work_dir, smiles_column, gpu=gpu)
+    task_names = [c for c in teacher.columns if c != smiles_column]
+    print(f"finish teacher labels for {len(teacher)} molecules, cost time {datetime.now() - start_time}")
+
+    smiles = teacher[smiles_column].tolist()
+    holdout = holdout_mask(smiles, holdout_fraction, seed, n_jobs)
+    soft_labels = teacher[task_names].values.astype(float)
+
+    start_time = datetime.now()
+    model = train_student([s for s, h in zip(smiles, holdout) if not h], soft_labels[~holdout],
+                          hidden_layers, seed=seed, n_jobs=n_jobs)
+    student = {'model': model, 'task_names': task_names, 'radius': RADIUS, 'n_bits': N_BITS,
+               'teacher': checkpoint_dir, 'sources': list(source_paths)}
+    os.makedirs(os.path.dirname(student_path) or '.', exist_ok=True)
+    joblib.dump(student, student_path)
+    print(f"finish student training, cost time {datetime.now() - start_time}")
+
+    held_smiles = [s for s, h in zip(smiles, holdout) if h]
+    start_time = datetime.now()
+    student_preds = student_predict(student, held_smiles, n_jobs)
+    seconds = (datetime.now() - start_time).total_seconds()
+
+    # experimental labels of the held-out molecules, from the sources that have target columns
+    known = []
+    for path in source_paths:
+        columns = [c for c in next(iter_table(path, chunk_size=1)).columns if c in task_names]
+        if columns:
+            known.append(read_table(path, columns=[smiles_column] + columns))
+    labels = None
+    if known:
+        known = pd.concat(known, ignore_index=True).drop_duplicates(subset=smiles_column)
+        labels = pd.DataFrame({smiles_column: held_smiles}).merge(known, on=smiles_column, how='left')
+    report = {
+        'tasks': fidelity_report(soft_labels[holdout], student_preds, task_names, labels),
+        'holdout': int(holdout.sum()),
+        'train': int((~holdout).sum()),
+        'student_molecules_per_second': len(held_smiles) / seconds if seconds else None,
+    }
+    with open(f"{os.path.splitext(student_path)[0]}_fidelity.json", 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill the DMPNN ensemble into a fingerprint MLP student.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train')
+    train_parser.add_argument('--checkpoint_dir', default='checkpoints/checkpoints_multi_all')
+    train_parser.add_argument('--source_paths', nargs='+', default=['data/merge_dataset.csv', 'lotus/lotus_smiles_with_cas.csv'])
+    train_parser.add_argument('--student_path', default='checkpoints/student_multi_all.pkl')
+    train_parser.add_argument('--work_dir', default=None, help="teacher predictions, default <student>_work")
+    train_parser.add_argument('--holdout_fraction', type=float, default=HOLDOUT_FRACTION)
+    train_parser.add_argument('--hidden_layers', type=int, nargs='+', default=list(HIDDEN_LAYERS))
+    train_parser.add_argument('--seed', type=int, default=0)
+    train_parser.add_argument('--n_jobs', type=int, default=1)
+    train_parser.add_argument('--gpu', type=int, default=0)
+    train_parser.add_argument('--no_cuda', action='store_true')
+    score_parser = subparsers.add_parser('score')
+    score_parser.add_argument('--student_path', default='checkpoints/student_multi_all.pkl')
+    score_parser.add_argument('--test_path', default='lotus/lotus_smiles_with_cas.csv')
+    score_parser.add_argument('--preds_path', default='lotus/smiles_with_cas_student_preds.csv')
+    score_parser.add_argument('--chunk_size', type=int, default=50000)
+    score_parser.add_argument('--n_jobs', type=int, default=1)
+    score_parser.add_argument('--restart', action='store_true')
+    for sub in (train_parser, score_parser):
+        sub.add_argument('--smiles_column', default='smiles')
+    cli_args = parser.parse_args()
+
+    start_time = datetime.now()
+    if cli_args.command == 'train':
+        report = distill(cli_args.source_paths, cli_args.checkpoint_dir, cli_args.student_path, cli_args.work_dir,
+                         cli_args.smiles_column, cli_args.holdout_fraction, cli_args.hidden_layers,
+                         cli_args.seed, cli_args.n_jobs, gpu=None if cli_args.no_cuda else cli_args.gpu)
+        print(json.dumps(report, indent=2))
+    else:
+        predict_fn, task_names = student_scorer(cli_args.student_path, cli_args.n_jobs)
+        n_rows = stream_scores(cli_args.test_path, cli_args.preds_path, predict_fn, task_names,
+                               cli_args.chunk_size, cli_args.smiles_column, resume=not cli_args.restart)
+        print(f"finish student screening of {n_rows} rows, cost time {datetime.now() - start_time}")
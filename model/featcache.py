@@ -0,0 +1,335 @@
+# -*- coding:utf-8 -*-
+"""
+Persistent featurization cache for chemprop.
+
+chemprop builds a MolGraph and the RDKit 2D descriptors of every SMILES again
+in every process: each hyperopt trial, fold, ensemble member and prediction of
+a fresh run featurizes the same molecules. This module keeps both on disk,
+keyed by SMILES, in compact array form (atom and bond feature matrices plus
+index arrays, and one descriptor row per molecule) and memory-maps them back.
+
+`install()` plugs the cache into chemprop's own hooks: the module-level
+SMILES_TO_GRAPH dictionary that `MoleculeDataset.batch_graph` consults, and the
+features generator registry used for `--features_generator`. Hits are served
+from the arrays; misses are featurized by chemprop as usual and written as a
+new segment every FLUSH_EVERY molecules (and at exit), so memory stays bounded
+during large screens and a second run of the same script featurizes nothing. Graphs are stored per featurization
+setting (atom/bond feature sizes, explicit H, reaction mode), so a change of
+settings never serves a stale graph.
+
+Example (run from the repository root; warms the cache for the training data):
+    python model/featcache.py data/merge_dataset.csv data/merge_dataset_train.csv data/merge_dataset_test.csv
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+from datetime import datetime
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import chemprop
+import chemprop.data.data as chemprop_data
+from chemprop.features import featurization
+from chemprop.features import features_generators as fg_module
+from chemprop.features.featurization import MolGraph
+from chemprop.rdkit import make_mol
+from rdkit import Chem
+
+FEATCACHE_DIR = 'data/.cache/featcache'
+# new entries are written as a segment every FLUSH_EVERY molecules, so a long screen neither keeps them
+# all in memory nor loses them in a crash
+FLUSH_EVERY = 5000
+# graphs kept in memory once written; beyond this they are dropped and re-read from the memory map
+MAX_RESIDENT = 200000
+GRAPH_ARRAYS = ('atoms', 'bonds', 'a2b', 'a2b_offsets', 'b2a', 'b2revb', 'b2br', 'atom_offsets', 'bond_offsets')
+
+
+SETTING_NAMES = ('ATOM_FDIM', 'EXTRA_ATOM_FDIM', 'BOND_FDIM', 'EXTRA_BOND_FDIM', 'EXPLICIT_H', 'REACTION',
+                 'ADDING_H', 'KEEP_ATOM_MAP', 'REACTION_MODE')
+
+
+def _settings() -> tuple:
+    """The featurization settings a cached MolGraph depends on (set per run by chemprop from its args)."""
+    params = featurization.PARAMS
+    return (chemprop.__version__, *[getattr(params, name, None) for name in SETTING_NAMES])
+
+
+def _settings_tag(settings: tuple) -> str:
+    return hashlib.sha1(repr(settings).encode('utf-8')).hexdigest()[:12]
+
+
+class SegmentStore:
+    """SMILES-keyed rows in append-only segments of memory-mapped .npy files.
+
+    Each segment is a directory with `smiles.json` and one .npy file per array;
+    segments are written to a temporary directory and renamed, so concurrent
+    writers never expose a partial segment.
+    """
+
+    def __init__(self, root: str, names: Sequence[str]):
+        self.root = root
+        self.names = tuple(names)
+        self.segments: List[Dict[str, np.ndarray]] = []
+        self.index: Dict[str, tuple] = {}
+        self.reload()
+
+    def reload(self):
+        self.segments, self.index = [], {}
+        if not os.path.isdir(self.root):
+            return
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if name.startswith('seg-') and os.path.isdir(path):
+                self._add_segment(path)
+
+    def _add_segment(self, path: str):
+        with open(os.path.join(path, 'smiles.json'), 'r', encoding='utf-8') as f:
+            smiles = json.load(f)
+        arrays = {array: np.load(os.path.join(path, f"{array}.npy"), mmap_mode='r') for array in self.names}
+        segment_no = len(self.segments)
+        self.segments.append(arrays)
+        for row, s in enumerate(smiles):
+            self.index.setdefault(s, (segment_no, row))
+
+    def write(self, smiles: List[str], arrays: Dict[str, np.ndarray]):
+        if not smiles:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f"tmp-{os.getpid()}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}")
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        with open(os.path.join(tmp_dir, 'smiles.json'), 'w', encoding='utf-8') as f:
+            json.dump(smiles, f)
+        path = os.path.join(self.root, f"seg-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}")
+        os.rename(tmp_dir, path)
+        self._add_segment(path)
+
+
+def pack_graphs(graphs: List[MolGraph]) -> Dict[str, np.ndarray]:
+    """Concatenates MolGraphs into flat arrays with per-molecule offsets (indices stay molecule-local)."""
+    atom_offsets = np.cumsum([0] + [g.n_atoms for g in graphs])
+    bond_offsets = np.cumsum([0] + [g.n_bonds for g in graphs])
+    atom_fdim = next((len(g.f_atoms[0]) for g in graphs if g.n_atoms), 0)
+    bond_fdim = next((len(g.f_bonds[0]) for g in graphs if g.n_bonds), 0)
+    a2b_lists = [bonds for g in graphs for bonds in g.a2b]
+    return {
+        'atoms': np.array([f for g in graphs for f in g.f_atoms], dtype=np.float32).reshape(-1, atom_fdim),
+        'bonds': np.array([f for g in graphs for f in g.f_bonds], dtype=np.float32).reshape(-1, bond_fdim),
+        'a2b': np.array([b for bonds in a2b_lists for b in bonds], dtype=np.int32),
+        'a2b_offsets': np.cumsum([0] + [len(bonds) for bonds in a2b_lists]).astype(np.int64),
+        'b2a': np.array([a for g in graphs for a in g.b2a], dtype=np.int32),
+        'b2revb': np.array([b for g in graphs for b in g.b2revb], dtype=np.int32),
+        'b2br': np.concatenate([np.asarray(g.b2br, dtype=np.int32).reshape(-1, 2) for g in graphs]),
+        'atom_offsets': atom_offsets.astype(np.int64),
+        'bond_offsets': bond_offsets.astype(np.int64),
+    }
+
+
+class GraphCache(dict):
+    """Drop-in replacement for chemprop's SMILES_TO_GRAPH backed by a SegmentStore per featurization setting."""
+
+    def __init__(self, cache_dir: str = FEATCACHE_DIR, flush_every: int = FLUSH_EVERY,
+                 max_resident: int = MAX_RESIDENT):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.flush_every = flush_every
+        self.max_resident = max_resident
+        self.pending: Dict[tuple, Dict[str, MolGraph]] = {}
+        self._stores: Dict[tuple, SegmentStore] = {}
+        self._templates: Dict[tuple, dict] = {}
+
+    def _store(self, settings: tuple) -> SegmentStore:
+        store = self._stores.get(settings)
+        if store is None:
+            root = os.path.join(self.cache_dir, 'graphs', _settings_tag(settings))
+            store = self._stores[settings] = SegmentStore(root, GRAPH_ARRAYS)
+            os.makedirs(root, exist_ok=True)
+            with open(os.path.join(root, 'settings.json'), 'w', encoding='utf-8') as f:
+                json.dump([str(s) for s in settings], f)
+        return store
+
+    def __contains__(self, smiles) -> bool:
+        return dict.__contains__(self, smiles) or smiles in self._store(_settings()).index
+
+    def __missing__(self, smiles: str) -> MolGraph:
+        settings = _settings()
+        location = self._store(settings).index.get(smiles)
+        if location is None:
+            raise KeyError(smiles)
+        graph = self._materialize(settings, *location)
+        dict.__setitem__(self, smiles, graph)
+        return graph
+
+    def _materialize(self, settings: tuple, segment_no: int, row: int) -> MolGraph:
+        arrays = self._store(settings).segments[segment_no]
+        template = self._templates.get(settings)
+        if template is None:
+            template = self._templates[settings] = dict(vars(MolGraph(make_mol('CC', False, False, False))))
+        a0, a1 = int(arrays['atom_offsets'][row]), int(arrays['atom_offsets'][row + 1])
+        b0, b1 = int(arrays['bond_offsets'][row]), int(arrays['bond_offsets'][row + 1])
+        a2b_offsets = arrays['a2b_offsets'][a0:a1 + 1]
+        a2b = np.asarray(arrays['a2b'][a2b_offsets[0]:a2b_offsets[-1]])
+        graph = MolGraph.__new__(MolGraph)
+        graph.__dict__.update(template)
+        graph.n_atoms, graph.n_bonds = a1 - a0, b1 - b0
+        graph.f_atoms = arrays['atoms'][a0:a1].tolist()
+        graph.f_bonds = arrays['bonds'][b0:b1].tolist()
+        graph.a2b = [a2b[s - a2b_offsets[0]:e - a2b_offsets[0]].tolist() for s, e in zip(a2b_offsets[:-1], a2b_offsets[1:])]
+        graph.b2a = arrays['b2a'][b0:b1].tolist()
+        graph.b2revb = arrays['b2revb'][b0:b1].tolist()
+        graph.b2br = np.asarray(arrays['b2br'][b0 // 2:b1 // 2], dtype=float)
+        return graph
+
+    def __setitem__(self, smiles: str, graph: MolGraph):
+        dict.__setitem__(self, smiles, graph)
+        settings = _settings()
+        if smiles not in self._store(settings).index:
+            pending = self.pending.setdefault(settings, {})
+            pending[smiles] = graph
+            if len(pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """Writes the graphs featurized since the last flush as new segments."""
+        for settings, graphs in self.pending.items():
+            if graphs:
+                self._store(settings).write(list(graphs), pack_graphs(list(graphs.values())))
+        self.pending = {}
+        # everything resident is on disk now; past the limit it is served from the memory map instead
+        if len(self) > self.max_resident:
+            dict.clear(self)
+
+
+class CachedFeaturesGenerator:
+    """Wraps a chemprop features generator with a SMILES-keyed, memory-mapped row cache."""
+
+    def __init__(self, name: str, generator: Callable, cache_dir: str = FEATCACHE_DIR, flush_every: int = FLUSH_EVERY):
+        self.name = name
+        self.generator = generator
+        self.flush_every = flush_every
+        self.store = SegmentStore(os.path.join(cache_dir, 'features', name, chemprop.__version__), ('features',))
+        self.pending: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def key(mol) -> str:
+        # The same string the rdkit_2d generators compute internally, so keys and features agree.
+        return mol if isinstance(mol, str) else Chem.MolToSmiles(mol, isomericSmiles=True)
+
+    def __call__(self, mol) -> np.ndarray:
+        key = self.key(mol)
+        location = self.store.index.get(key)
+        if location is not None:
+            return np.array(self.store.segments[location[0]]['features'][location[1]])
+        features = self.pending.get(key)
+        if features is None:
+            features = self.pending[key] = np.asarray(self.generator(mol))
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+        return features.copy()
+
+    def flush(self):
+        if self.pending:
+            self.store.write(list(self.pending), {'features': np.stack(list(self.pending.values()))})
+        self.pending = {}
+
+
+class FeatCache:
+    """Handle returned by `install`; `flush()` persists everything featurized since the last flush."""
+
+    def __init__(self, graphs: GraphCache, generators: List[CachedFeaturesGenerator]):
+        self.graphs = graphs
+        self.generators = generators
+
+    def flush(self):
+        self.graphs.flush()
+        for generator in self.generators:
+            generator.flush()
+
+
+_installed: Optional[FeatCache] = None
+
+
+def install(cache_dir: str = FEATCACHE_DIR, features_generators: Iterable[str] = ('rdkit_2d_normalized',),
+            flush_every: int = FLUSH_EVERY) -> FeatCache:
+    """Routes chemprop's graph cache and the named features generators through the on-disk cache.
+
+    New entries are written every `flush_every` molecules and at interpreter exit.
+    Safe to call more than once.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+    graphs = GraphCache(cache_dir, flush_every)
+    chemprop_data.SMILES_TO_GRAPH = graphs
+    generators = []
+    for name in features_generators:
+        generator = fg_module.FEATURES_GENERATOR_REGISTRY.get(name)
+        if generator is None:
+            continue
+        cached = CachedFeaturesGenerator(name, generator, cache_dir, flush_every)
+        fg_module.FEATURES_GENERATOR_REGISTRY[name] = cached
+        generators.append(cached)
+    _installed = FeatCache(graphs, generators)
+    atexit.register(_installed.flush)
+    return _installed
+
+
+def _featurize(args):
+    smiles, generators = args
+    mol = make_mol(smiles, False, False, False)
+    if mol is None:
+        return smiles, None, None
+    return smiles, MolGraph(mol), [np.asarray(generator(mol)) for generator in generators]
+
+
+def warm(smiles: Sequence[str], n_jobs: int = 1, cache: Optional[FeatCache] = None) -> int:
+    """Featurizes (in `n_jobs` processes) every SMILES not cached yet; returns how many were new.
+
+    Results are written in segments of `flush_every` molecules as they arrive.
+    """
+    cache = cache or install()
+    settings = _settings()
+    store = cache.graphs._store(settings)
+    missing = sorted({s for s in smiles if isinstance(s, str) and s not in store.index})
+    # The wrapped generators are passed, not the cached ones, so workers never touch the stores.
+    generators = [generator.generator for generator in cache.generators]
+    jobs = ((s, generators) for s in missing)
+    pool = Pool(n_jobs) if n_jobs > 1 and len(missing) > 1000 else None
+    try:
+        results = pool.imap(_featurize, jobs, chunksize=200) if pool else map(_featurize, jobs)
+        for n, (s, graph, features) in enumerate(results, 1):
+            if graph is not None:
+                cache.graphs.pending.setdefault(settings, {})[s] = graph
+                key = CachedFeaturesGenerator.key(make_mol(s, False, False, False))
+                for generator, row in zip(cache.generators, features):
+                    if key not in generator.store.index:
+                        generator.pending[key] = row
+            if n % cache.graphs.flush_every == 0:
+                cache.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    cache.flush()
+    return len(missing)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the persistent chemprop featurization cache.")
+    parser.add_argument('paths', nargs='+', help="CSV files whose SMILES are featurized")
+    parser.add_argument('--smiles_column', default='smiles')
+    parser.add_argument('--cache_dir', default=FEATCACHE_DIR)
+    parser.add_argument('--n_jobs', type=int, default=1)
+    cli_args = parser.parse_args()
+
+    start_time = datetime.now()
+    cache = install(cli_args.cache_dir)
+    smiles = [s for path in cli_args.paths for s in pd.read_csv(path, usecols=[cli_args.smiles_column])[cli_args.smiles_column]]
+    n_new = warm(smiles, n_jobs=cli_args.n_jobs, cache=cache)
+    print(f"featurized {n_new} new molecules of {len(set(smiles))}, cost time {datetime.now() - start_time}")
@@ -0,0 +1,352 @@
+# -*- coding:utf-8 -*-
+"""
+Bit-packed Morgan fingerprint index with vectorized Tanimoto search.
+
+Fingerprints are packed into rows of uint64 words and stored sorted by their
+popcount. Because the Tanimoto similarity of two fingerprints with popcounts a
+and b is at most min(a, b) / max(a, b), a query only has to be compared with
+the database rows whose popcount lies in [t * a, a / t] for a threshold t. Top-k
+searches first scan a narrow popcount window, then use the k-th best similarity
+found as the threshold for the rest of the database.
+
+An index is saved as a directory of .npy files and loaded memory-mapped, so
+worker processes share the pages instead of copying the arrays.
+
+Example (run from the repository root):
+    python model/fpindex.py build --smiles_path data/merge_dataset.csv --index_dir data/.cache/fp_merge_dataset --active_only
+    python model/fpindex.py build --smiles_path lotus/lotus_smiles_with_cas.csv --id_column cas --index_dir lotus/.fp_lotus
+    python model/fpindex.py query --index_dir data/.cache/fp_merge_dataset --query_path lotus/lotus_smiles_with_cas.csv \
+        --query_id_column cas --k 5 --out_path lotus/lotus_nearest_actives.csv
+"""
+
+import argparse
+import json
+import os
+from multiprocessing import Pool
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+from rdkit.Chem import rdFingerprintGenerator
+
+RADIUS = 2
+N_BITS = 2048
+BLOCK_SIZE = 8192
+QUERY_CHUNK = 256
+WINDOW_SIMILARITY = 0.8
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """Number of set bits of every uint64 element."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    x = x - ((x >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+
+def morgan_fingerprints(smiles: Sequence[str], radius: int = RADIUS, n_bits: int = N_BITS) -> np.ndarray:
+    """Packs the Morgan fingerprints of `smiles` into an (n, n_bits / 64) uint64 array.
+
+    Invalid SMILES get an all-zero fingerprint, which is similar to nothing.
+    """
+    if n_bits % 64:
+        raise ValueError("n_bits must be a multiple of 64")
+    RDLogger.DisableLog('rdApp.*')
+    generator = rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=n_bits)
+    fps = np.zeros((len(smiles), n_bits // 64), dtype=np.uint64)
+    for i, s in enumerate(smiles):
+        mol = Chem.MolFromSmiles(s) if isinstance(s, str) else None
+        if mol is None:
+            continue
+        fps[i] = np.packbits(generator.GetFingerprintAsNumPy(mol)).view(np.uint64)
+    return fps
+
+
+def _fingerprint_chunk(args):
+    return morgan_fingerprints(*args)
+
+
+def morgan_fingerprints_parallel(smiles: Sequence[str], radius: int = RADIUS, n_bits: int = N_BITS,
+                                 n_jobs: int = 1, chunk_size: int = 5000) -> np.ndarray:
+    if n_jobs <= 1 or len(smiles) <= chunk_size:
+        return morgan_fingerprints(smiles, radius, n_bits)
+    chunks = [(list(smiles[i:i + chunk_size]), radius, n_bits) for i in range(0, len(smiles), chunk_size)]
+    with Pool(n_jobs) as pool:
+        return np.concatenate(pool.map(_fingerprint_chunk, chunks))
+
+
+class FingerprintIndex:
+    """Popcount-sorted, bit-packed fingerprint database.
+
+    Attributes:
+        fps (np.ndarray): (n, words) uint64 fingerprints sorted by popcount.
+        counts (np.ndarray): Popcount of every row of `fps`, ascending.
+        rows (np.ndarray): Original row number of every sorted fingerprint.
+        ids (np.ndarray): Identifier of every sorted fingerprint.
+    """
+
+    def __init__(self, fps: np.ndarray, counts: np.ndarray, rows: np.ndarray, ids: np.ndarray,
+                 meta: Optional[dict] = None, path: Optional[str] = None):
+        self.fps = fps
+        self.counts = counts
+        self.rows = rows
+        self.ids = ids
+        self.meta = meta or {}
+        self.path = path
+
+    def __len__(self):
+        return len(self.counts)
+
+    @classmethod
+    def build(cls, smiles: Sequence[str], ids: Optional[Sequence[str]] = None, radius: int = RADIUS,
+              n_bits: int = N_BITS, n_jobs: int = 1) -> 'FingerprintIndex':
+        fps = morgan_fingerprints_parallel(smiles, radius, n_bits, n_jobs)
+        counts = popcount(fps).sum(axis=1).astype(np.int32)
+        order = np.argsort(counts, kind='stable')
+        ids = np.asarray(list(ids) if ids is not None else list(smiles)).astype(str)
+        return cls(fps[order], counts[order], order.astype(np.int64), ids[order],
+                   {"radius": radius, "n_bits": n_bits, "size": len(order)})
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in ('fps', 'counts', 'rows', 'ids'):
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        self.path = index_dir
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> 'FingerprintIndex':
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ('fps', 'counts', 'rows', 'ids')]
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(*arrays, meta=meta, path=index_dir)
+
+    def fingerprints(self, smiles: Sequence[str], n_jobs: int = 1) -> np.ndarray:
+        """Fingerprints `smiles` with the settings the index was built with."""
+        return morgan_fingerprints_parallel(smiles, self.meta.get("radius", RADIUS),
+                                            self.meta.get("n_bits", N_BITS), n_jobs)
+
+    def _count_range(self, low: int, high: int, threshold: float) -> Tuple[int, int]:
+        """Sorted-row range that can reach `threshold` for queries with popcounts in [low, high]."""
+        if threshold <= 0:
+            return 0, len(self)
+        start = np.searchsorted(self.counts, np.ceil(threshold * low - 1e-9), side='left')
+        end = np.searchsorted(self.counts, np.floor(high / threshold + 1e-9), side='right')
+        return int(start), int(end)
+
+    def _similarities(self, queries: np.ndarray, query_counts: np.ndarray, start: int, end: int) -> np.ndarray:
+        # Word-major copy of the block, so every word is a contiguous row.
+        block = np.ascontiguousarray(np.asarray(self.fps[start:end]).T)
+        inter = np.zeros((len(queries), end - start), dtype=np.int32)
+        if hasattr(np, 'bitwise_count'):
+            anded = np.empty(inter.shape, dtype=np.uint64)
+            bits = np.empty(inter.shape, dtype=np.uint8)
+            for word in range(queries.shape[1]):
+                np.bitwise_and(queries[:, word, None], block[word][None, :], out=anded)
+                np.bitwise_count(anded, out=bits)
+                inter += bits
+        else:
+            for word in range(queries.shape[1]):
+                inter += popcount(queries[:, word, None] & block[word][None, :]).astype(np.int32)
+        union = query_counts[:, None] + np.asarray(self.counts[start:end])[None, :] - inter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(union > 0, inter / union, 0.0)
+
+    def _scan_topk(self, queries, query_counts, start, end, k, best_sims, best_idx):
+        for block_start in range(start, end, BLOCK_SIZE):
+            block_end = min(block_start + BLOCK_SIZE, end)
+            sims = self._similarities(queries, query_counts, block_start, block_end)
+            sims = np.concatenate([best_sims, sims], axis=1)
+            idx = np.concatenate([best_idx, np.broadcast_to(np.arange(block_start, block_end),
+                                                            (len(queries), block_end - block_start))], axis=1)
+            if sims.shape[1] > k:
+                keep = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                sims = np.take_along_axis(sims, keep, axis=1)
+                idx = np.take_along_axis(idx, keep, axis=1)
+            best_sims, best_idx = sims, idx
+        return best_sims, best_idx
+
+    def _topk_chunk(self, queries: np.ndarray, k: int, min_similarity: float):
+        query_counts = popcount(queries).sum(axis=1).astype(np.int32)
+        low, high = int(query_counts.min()), int(query_counts.max())
+        full = self._count_range(low, high, min_similarity)
+        window = self._count_range(low, high, max(min_similarity, WINDOW_SIMILARITY))
+        best_sims = np.empty((len(queries), 0))
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_sims, best_idx = self._scan_topk(queries, query_counts, *window, k, best_sims, best_idx)
+        # The worst k-th best similarity of the chunk bounds what the rest of the database can contribute.
+        kth = best_sims.min(axis=1) if best_sims.shape[1] >= k else np.zeros(len(queries))
+        rest = self._count_range(low, high, max(min_similarity, float(kth.min())))
+        for start, end in ((rest[0], window[0]), (window[1], rest[1])):
+            start, end = max(start, full[0]), min(end, full[1])
+            if start < end:
+                best_sims, best_idx = self._scan_topk(queries, query_counts, start, end, k, best_sims, best_idx)
+        order = np.argsort(-best_sims, axis=1, kind='stable')
+        best_sims = np.take_along_axis(best_sims, order, axis=1)
+        best_idx = np.take_along_axis(best_idx, order, axis=1)
+        if best_sims.shape[1] < k:
+            pad = k - best_sims.shape[1]
+            best_sims = np.pad(best_sims, ((0, 0), (0, pad)), constant_values=np.nan)
+            best_idx = np.pad(best_idx, ((0, 0), (0, pad)), constant_values=-1)
+        below = ~(best_sims >= min_similarity)
+        best_sims[below] = np.nan
+        best_idx[below] = -1
+        return best_sims, best_idx
+
+    def search_topk(self, queries: np.ndarray, k: int = 5, min_similarity: float = 0.0,
+                    n_jobs: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the k most similar database fingerprints of every query.
+
+        Args:
+            queries (np.ndarray): (q, words) uint64 query fingerprints.
+            k (int): Number of neighbours per query.
+            min_similarity (float): Neighbours below this Tanimoto similarity are not returned.
+            n_jobs (int): Worker processes; the index must be saved on disk to be shared.
+
+        Returns:
+            tuple: (similarities, positions), both (q, k). Positions index the sorted
+            database (see `rows` and `ids`); where fewer than k neighbours reach
+            `min_similarity`, the remaining slots hold NaN and -1.
+        """
+        return self._run_chunks(queries, '_topk_chunk', (k, min_similarity), n_jobs)
+
+    def _threshold_chunk(self, queries: np.ndarray, threshold: float):
+        query_counts = popcount(queries).sum(axis=1).astype(np.int32)
+        start, end = self._count_range(int(query_counts.min()), int(query_counts.max()), threshold)
+        hits = [[] for _ in range(len(queries))]
+        for block_start in range(start, end, BLOCK_SIZE):
+            block_end = min(block_start + BLOCK_SIZE, end)
+            sims = self._similarities(queries, query_counts, block_start, block_end)
+            for q, j in zip(*np.nonzero(sims >= threshold)):
+                hits[q].append((block_start + j, sims[q, j]))
+        return [sorted(h, key=lambda hit: -hit[1]) for h in hits]
+
+    def search_threshold(self, queries: np.ndarray, threshold: float = 0.7, n_jobs: int = 1) -> List[list]:
+        """Finds every database fingerprint with Tanimoto similarity >= `threshold` to each query.
+
+        Returns:
+            list: One list of (position, similarity) pairs per query, most similar first.
+        """
+        return self._run_chunks(queries, '_threshold_chunk', (threshold,), n_jobs)
+
+    def _run_chunks(self, queries: np.ndarray, method: str, args: tuple, n_jobs: int):
+        # Queries are processed sorted by popcount so that each chunk spans a narrow popcount range.
+        query_counts = popcount(queries).sum(axis=1)
+        order = np.argsort(query_counts, kind='stable')
+        tasks = [order[i:i + QUERY_CHUNK] for i in range(0, len(order), QUERY_CHUNK)]
+        if n_jobs > 1 and self.path and len(tasks) > 1:
+            with Pool(n_jobs, initializer=_init_worker, initargs=(self.path,)) as pool:
+                results = pool.map(_run_worker, [(method, queries[t], args) for t in tasks])
+        else:
+            results = [getattr(self, method)(queries[t], *args) for t in tasks]
+
+        if method == '_topk_chunk':
+            k = args[0]
+            sims = np.full((len(queries), k), np.nan)
+            positions = np.full((len(queries), k), -1, dtype=np.int64)
+            for t, (chunk_sims, chunk_positions) in zip(tasks, results):
+                sims[t], positions[t] = chunk_sims, chunk_positions
+            return sims, positions
+        hits = [None] * len(queries)
+        for t, chunk_hits in zip(tasks, results):
+            for i, h in zip(t, chunk_hits):
+                hits[i] = h
+        return hits
+
+
+_worker_index: Optional[FingerprintIndex] = None
+
+
+def _init_worker(index_dir: str):
+    global _worker_index
+    _worker_index = FingerprintIndex.load(index_dir, mmap=True)
+
+
+def _run_worker(task):
+    method, queries, args = task
+    return getattr(_worker_index, method)(queries, *args)
+
+
+def build_index(smiles_path: str, index_dir: str, smiles_column: str = 'smiles', id_column: Optional[str] = None,
+                active_only: bool = False, n_jobs: int = 1) -> FingerprintIndex:
+    """Builds and saves the index of a CSV file.
+
+    With `active_only`, only rows where at least one EC50_* column equals 1 are indexed.
+    """
+    df = pd.read_csv(smiles_path)
+    if active_only:
+        targets = [c for c in df.columns if c.startswith('EC50_')]
+        df = df[(df[targets] == 1).any(axis=1)]
+    ids = df[id_column].astype(str).tolist() if id_column else df[smiles_column].tolist()
+    index = FingerprintIndex.build(df[smiles_column].tolist(), ids, n_jobs=n_jobs)
+    index.save(index_dir)
+    return index
+
+
+def nearest_neighbours(index: FingerprintIndex, query_smiles: Sequence[str], query_ids: Sequence[str],
+                       k: int = 5, min_similarity: float = 0.0, n_jobs: int = 1) -> pd.DataFrame:
+    """Top-k neighbours of every query as a long table (query_id, rank, neighbour_id, similarity)."""
+    sims, positions = index.search_topk(index.fingerprints(query_smiles, n_jobs), k, min_similarity, n_jobs)
+    found = positions >= 0
+    query_rows, ranks = np.nonzero(found)
+    return pd.DataFrame({
+        'query_id': np.asarray(query_ids)[query_rows],
+        'rank': ranks + 1,
+        'neighbour_id': np.asarray(index.ids)[positions[found]],
+        'similarity': sims[found],
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query bit-packed Morgan fingerprint indexes.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build')
+    build_parser.add_argument('--smiles_path', required=True)
+    build_parser.add_argument('--index_dir', required=True)
+    build_parser.add_argument('--smiles_column', default='smiles')
+    build_parser.add_argument('--id_column', default=None)
+    build_parser.add_argument('--active_only', action='store_true')
+    build_parser.add_argument('--n_jobs', type=int, default=4)
+    query_parser = subparsers.add_parser('query')
+    query_parser.add_argument('--index_dir', required=True)
+    query_parser.add_argument('--query_path', required=True)
+    query_parser.add_argument('--query_smiles_column', default='smiles')
+    query_parser.add_argument('--query_id_column', default=None)
+    query_parser.add_argument('--k', type=int, default=5)
+    query_parser.add_argument('--min_similarity', type=float, default=0.0)
+    query_parser.add_argument('--threshold', type=float, default=None, help="return all neighbours above this similarity instead of top-k")
+    query_parser.add_argument('--out_path', required=True)
+    query_parser.add_argument('--n_jobs', type=int, default=4)
+    cli_args = parser.parse_args()
+
+    if cli_args.command == 'build':
+        index = build_index(cli_args.smiles_path, cli_args.index_dir, cli_args.smiles_column,
+                            cli_args.id_column, cli_args.active_only, cli_args.n_jobs)
+        print(f"indexed {len(index)} fingerprints into {cli_args.index_dir}")
+    else:
+        index = FingerprintIndex.load(cli_args.index_dir)
+        queries = pd.read_csv(cli_args.query_path)
+        query_smiles = queries[cli_args.query_smiles_column].tolist()
+        query_ids = queries[cli_args.query_id_column or cli_args.query_smiles_column].astype(str).tolist()
+        if cli_args.threshold is None:
+            result = nearest_neighbours(index, query_smiles, query_ids, cli_args.k, cli_args.min_similarity,
+                                        cli_args.n_jobs)
+        else:
+            hits = index.search_threshold(index.fingerprints(query_smiles, cli_args.n_jobs), cli_args.threshold,
+                                          cli_args.n_jobs)
+            result = pd.DataFrame([(query_ids[q], rank + 1, index.ids[p], s) for q, h in enumerate(hits)
+                                   for rank, (p, s) in enumerate(h)],
+                                  columns=['query_id', 'rank', 'neighbour_id', 'similarity'])
+        result.to_csv(cli_args.out_path, index=False)
+        print(f"{len(result)} neighbour pairs saved to {cli_args.out_path}")
@@ -0,0 +1,275 @@
+# -*- coding:utf-8 -*-
+"""
+Two-stage screening funnel.
+
+Stage 1 scores the whole library with a cheap model: by default the distilled
+fingerprint student of model/distill.py (Morgan bits and one MLP, no RDKit
+descriptors and no message passing), or the per-target SVM baselines. A single
+ensemble member is also available, but it still featurizes every molecule with
+rdkit_2d_normalized and runs a full D-MPNN, so stage 1 then costs about
+1/ensemble_size of stage 2 per molecule and the funnel saves at most a factor
+of ensemble_size. It is used when no student has been distilled yet. Only the molecules above a stage-1 threshold,
+or in the top fraction of stage-1 scores, are passed to the full ensemble in
+stage 2. When a full-ensemble prediction file of the same library is available,
+the recall of the funnel against it is reported.
+
+Stage-1 scores are resumed as long as the library and the stage-1 model are the same;
+the promoted set and stage 2 are redone whenever the cutoff (--top_fraction / --threshold)
+changes.
+
+Example (run from the repository root):
+    python model/funnel.py --test_path lotus/lotus_smiles_with_cas.csv \
+        --preds_path lotus/smiles_with_cas_funnel_preds.csv \
+        --checkpoint_dir checkpoints/checkpoints_multi_all --student_path checkpoints/student_multi_all.pkl \
+        --top_fraction 0.1 \
+        --reference_path lotus/smiles_with_cas_preds.csv
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+import chemprop
+
+from distill import student_scorer
+from tables import read_table
+from screening import CHUNK_SIZE, load_ensemble, predict_smiles, stream_predictions, stream_scores, task_names_of
+
+STAGE1_PREFIX = 'stage1_'
+FUNNEL_SCORE = 'funnel_score'
+STUDENT_PATH = 'checkpoints/student_multi_all.pkl'
+
+
+def first_checkpoint(checkpoint_dir: str) -> str:
+    """Returns the path of the first model.pt found under `checkpoint_dir`."""
+    for root, _, files in sorted(os.walk(checkpoint_dir)):
+        for fname in sorted(files):
+            if fname.endswith('.pt'):
+                return os.path.join(root, fname)
+    raise ValueError(f"No checkpoint found in {checkpoint_dir}")
+
+
+def member_scorer(checkpoint_path: str, features_generator: Optional[str] = 'rdkit_2d_normalized',
+                  smiles_column: str = 'smiles', gpu: Optional[int] = 0):
+    """Builds a stage-1 scorer from a single ensemble member.
+
+    Returns:
+        tuple: (predict_fn, task_names)
+    """
+    args, model_objects = load_ensemble(checkpoint_path, features_generator, smiles_column, gpu)
+    args.preds_path = os.devnull
+    return (lambda smiles: predict_smiles(args, model_objects, smiles)), task_names_of(model_objects)
+
+
+def svm_scorer(model_paths: Dict[str, str]):
+    """Builds a stage-1 scorer from the SVM baselines trained in 02_SVM.py.
+
+    Args:
+        model_paths (dict): Target column name -> joblib file, e.g.
+            {'EC50_drer': 'SVM_Models1/svm_scaffold_drer.pkl'}.
+
+    Returns:
+        tuple: (predict_fn, task_names)
+    """
+    task_names = list(model_paths)
+    models = [joblib.load(model_paths[task_name]) for task_name in task_names]
+    generator = chemprop.features.features_generators.rdkit_2d_normalized_features_generator
+
+    def predict_fn(smiles: List[str]) -> np.ndarray:
+        out = np.full((len(smiles), len(task_names)), np.nan)
+        features, valid = [], []
+        for i, s in enumerate(smiles):
+            try:
+                features.append(generator(s))
+                valid.append(i)
+            except Exception:
+                continue
+        if valid:
+            features = np.nan_to_num(np.array(features))
+            for j, model in enumerate(models):
+                out[valid, j] = model.predict_proba(features)[:, 1]
+        return out
+
+    return predict_fn, task_names
+
+
+def default_scorer(checkpoint_dir: str, student_path: str = STUDENT_PATH,
+                   features_generator: Optional[str] = 'rdkit_2d_normalized', smiles_column: str = 'smiles',
+                   gpu: Optional[int] = 0):
+    """The distilled student if it has been trained, otherwise the first member of the ensemble.
+
+    Returns:
+        tuple: ((predict_fn, task_names), stage1_name)
+    """
+    if os.path.exists(student_path):
+        return student_scorer(student_path), f"student:{student_path}"
+    checkpoint_path = first_checkpoint(checkpoint_dir)
+    print(f"no student at {student_path} (train one with model/distill.py), "
+          f"scoring stage 1 with ensemble member {checkpoint_path}")
+    return member_scorer(checkpoint_path, features_generator, smiles_column, gpu), f"member:{checkpoint_path}"
+
+
+def aggregate_score(preds: pd.DataFrame) -> pd.Series:
+    """Multi-target funnel score: the highest predicted probability over all targets."""
+    return preds.max(axis=1, skipna=True)
+
+
+def funnel_cutoff(stage1_path: str, top_fraction: Optional[float], threshold: Optional[float]) -> float:
+    """Returns the stage-1 score a molecule needs to reach to be promoted to stage 2."""
+    if threshold is not None:
+        return threshold
+    scores = read_table(stage1_path, columns=[FUNNEL_SCORE])[FUNNEL_SCORE].dropna().values
+    if len(scores) == 0:
+        return np.inf
+    return float(np.quantile(scores, 1 - top_fraction))
+
+
+def _load_state(work_dir: str) -> dict:
+    path = os.path.join(work_dir, 'funnel.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(work_dir: str, state: dict):
+    tmp_path = os.path.join(work_dir, 'funnel.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(work_dir, 'funnel.json'))
+
+
+def run_funnel(test_path: str, preds_path: str, checkpoint_dir: str, stage1: Optional[tuple] = None,
+               top_fraction: Optional[float] = 0.1, threshold: Optional[float] = None,
+               chunk_size: int = CHUNK_SIZE, smiles_column: str = 'smiles',
+               features_generator: Optional[str] = 'rdkit_2d_normalized', gpu: Optional[int] = 0,
+               resume: bool = True, stage1_name: Optional[str] = None) -> dict:
+    """Runs the two-stage funnel.
+
+    Args:
+        test_path (str): CSV file with the molecules to screen.
+        preds_path (str): Output CSV with the promoted molecules, their stage-1 scores and full-ensemble predictions.
+        checkpoint_dir (str): Full ensemble used in stage 2.
+        stage1 (tuple): (predict_fn, task_names) from `student_scorer`, `svm_scorer` or `member_scorer`;
+            defaults to `default_scorer` (the student at STUDENT_PATH, else one ensemble member).
+        top_fraction (float): Fraction of the library promoted to stage 2, used when `threshold` is None.
+        threshold (float): Minimum stage-1 funnel score to be promoted.
+        resume (bool): Continue a previous run. Stage 1 is redone when `test_path` or `stage1_name`
+            differs from the previous run, stage 2 also when the cutoff differs.
+        stage1_name (str): Identifies the stage-1 model across runs, e.g. 'student:<path>'.
+
+    Returns:
+        dict: Summary with the number of scored and promoted molecules and the cutoff used.
+    """
+    work_dir = f"{preds_path}.work"
+    os.makedirs(work_dir, exist_ok=True)
+    stage1_path = os.path.join(work_dir, 'stage1.csv')
+    promoted_path = os.path.join(work_dir, 'promoted.csv')
+
+    start_time = datetime.now()
+    if stage1 is None:
+        stage1, stage1_name = default_scorer(checkpoint_dir, STUDENT_PATH, features_generator, smiles_column, gpu)
+    stage1_name = stage1_name or 'custom'
+    library = os.path.abspath(test_path)
+    state = _load_state(work_dir) if resume else {}
+    resume_stage1 = resume and state.get('stage1') == stage1_name and state.get('test_path') == library
+    predict_fn, task_names = stage1
+    stage1_columns = [STAGE1_PREFIX + task_name for task_name in task_names]
+
+    def scored(smiles):
+        preds = predict_fn(smiles)
+        return np.column_stack([preds, aggregate_score(pd.DataFrame(preds)).values])
+
+    _save_state(work_dir, {'test_path': library, 'stage1': stage1_name})
+    n_scored = stream_scores(test_path, stage1_path, scored, stage1_columns + [FUNNEL_SCORE],
+                             chunk_size, smiles_column, resume_stage1)
+    print(f"finish stage 1 on {n_scored} molecules, cost time {datetime.now() - start_time}")
+
+    cutoff = funnel_cutoff(stage1_path, top_fraction, threshold)
+    # stage-2 progress only applies to the promoted set it was computed for
+    resume_stage2 = resume_stage1 and state.get('cutoff') == cutoff
+    _save_state(work_dir, {'test_path': library, 'stage1': stage1_name, 'cutoff': cutoff})
+    n_promoted = 0
+    for i, chunk in enumerate(pd.read_csv(stage1_path, chunksize=chunk_size)):
+        chunk = chunk[chunk[FUNNEL_SCORE] >= cutoff]
+        chunk.to_csv(promoted_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_promoted += len(chunk)
+
+    start_time = datetime.now()
+    stream_predictions(promoted_path, preds_path, checkpoint_dir, chunk_size, smiles_column,
+                       features_generator, gpu, resume_stage2)
+    print(f"finish stage 2 on {n_promoted} molecules, cost time {datetime.now() - start_time}")
+    return {"scored": n_scored, "promoted": n_promoted, "cutoff": cutoff}
+
+
+def funnel_recall(preds_path: str, reference_path: str, task_names: List[str], top_fraction: float = 0.01,
+                  threshold: Optional[float] = None, smiles_column: str = 'smiles') -> dict:
+    """Measures how many full-ensemble hits the funnel kept.
+
+    Hits are the molecules of the full-ensemble reference run whose aggregated
+    score is in the top `top_fraction` (or at least `threshold`), overall and
+    per target.
+
+    Returns:
+        dict: Recall overall and per target, with the number of reference hits.
+    """
+    reference = read_table(reference_path, columns=[smiles_column] + task_names)
+    kept = set(read_table(preds_path, columns=[smiles_column])[smiles_column])
+    report = {}
+    for name, score in [('overall', aggregate_score(reference[task_names]))] + \
+                       [(task_name, reference[task_name]) for task_name in task_names]:
+        cutoff = threshold if threshold is not None else score.quantile(1 - top_fraction)
+        hits = reference.loc[score >= cutoff, smiles_column]
+        recall = float(hits.isin(kept).mean()) if len(hits) else float('nan')
+        report[name] = {"hits": int(len(hits)), "recall": recall}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cheap stage-1 scoring followed by full-ensemble scoring of the top molecules.")
+    parser.add_argument('--test_path', default='lotus/lotus_smiles_with_cas.csv')
+    parser.add_argument('--preds_path', default='lotus/smiles_with_cas_funnel_preds.csv')
+    parser.add_argument('--checkpoint_dir', default='checkpoints/checkpoints_multi_all')
+    parser.add_argument('--stage1', choices=['student', 'svm', 'member'], default='student',
+                        help="student: distilled fingerprint MLP (falls back to member until one is trained); "
+                             "member: one full D-MPNN member (slow)")
+    parser.add_argument('--svm_models', nargs='*', default=[],
+                        help="target=path pairs for --stage1 svm, e.g. EC50_drer=SVM_Models1/svm_scaffold_drer.pkl")
+    parser.add_argument('--student_path', default=STUDENT_PATH,
+                        help="student saved by model/distill.py, for --stage1 student")
+    parser.add_argument('--top_fraction', type=float, default=0.1)
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--reference_path', default=None, help="full-ensemble predictions used to report recall")
+    parser.add_argument('--hit_fraction', type=float, default=0.01, help="top fraction of the reference counted as hits")
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--smiles_column', default='smiles')
+    parser.add_argument('--gpu', type=int, default=0)
+    parser.add_argument('--no_cuda', action='store_true')
+    parser.add_argument('--restart', action='store_true')
+    cli_args = parser.parse_args()
+
+    gpu = None if cli_args.no_cuda else cli_args.gpu
+    if cli_args.stage1 == 'svm':
+        stage1 = svm_scorer(dict(pair.split('=', 1) for pair in cli_args.svm_models))
+        stage1_name = f"svm:{','.join(sorted(cli_args.svm_models))}"
+    elif cli_args.stage1 == 'member':
+        checkpoint_path = first_checkpoint(cli_args.checkpoint_dir)
+        stage1 = member_scorer(checkpoint_path, smiles_column=cli_args.smiles_column, gpu=gpu)
+        stage1_name = f"member:{checkpoint_path}"
+    else:
+        stage1, stage1_name = default_scorer(cli_args.checkpoint_dir, cli_args.student_path,
+                                             smiles_column=cli_args.smiles_column, gpu=gpu)
+    summary = run_funnel(cli_args.test_path, cli_args.preds_path, cli_args.checkpoint_dir, stage1,
+                         cli_args.top_fraction, cli_args.threshold, cli_args.chunk_size,
+                         cli_args.smiles_column, gpu=gpu, resume=not cli_args.restart, stage1_name=stage1_name)
+    print(summary)
+    if cli_args.reference_path:
+        task_names = [c for c in pd.read_csv(cli_args.preds_path, nrows=0).columns if c.startswith('EC50_')]
+        report = funnel_recall(cli_args.preds_path, cli_args.reference_path, task_names,
+                               cli_args.hit_fraction, smiles_column=cli_args.smiles_column)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,230 @@
+# -*- coding:utf-8 -*-
+"""
+Successive-halving hyperparameter search for chemprop.
+
+`chemprop.hyperparameter_optimization.hyperopt` trains every sampled
+configuration on all folds for all epochs. Here the configurations are first
+trained on a small budget (one fold, a few epochs); only the best 1/eta of each
+rung is promoted to the next, larger budget, and only the finalists are trained
+with the full number of folds and epochs. The search space and the written
+config file are the same as chemprop's (depth, dropout, ffn_num_layers and a
+linked hidden_size / ffn_hidden_size), so the file can be passed to
+`--config_path` unchanged.
+
+Every evaluation is appended to `<config>_trials.jsonl` with its budget (folds,
+epochs, wall time); rerunning the same search reuses the logged scores.
+
+Example (run from the repository root):
+    python model/hyperopt_halving.py --data_path data/merge_dataset.csv \
+        --config_save_path chemprop_config/multi_config_all.json --num_iters 30 --epochs 30
+"""
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import chemprop
+
+from splits import chemprop_split_args
+
+# chemprop's default ("basic") search space
+SEARCH_SPACE = {
+    'depth': np.arange(2, 7, 1),
+    'dropout': np.round(np.arange(0.0, 0.401, 0.05), 2),
+    'ffn_num_layers': np.arange(1, 4, 1),
+    'linked_hidden_size': np.arange(300, 2401, 100),
+}
+# (fraction of folds, fraction of epochs) per rung; the last rung is the full budget
+RUNGS = ((0.2, 0.2), (0.4, 0.5), (1.0, 1.0))
+ETA = 3
+HYPEROPT_ONLY = ('--num_iters', '--config_save_path', '--hyperopt_checkpoint_dir', '--log_dir',
+                 '--startup_random_iters', '--search_parameter_keywords', '--manual_trial_dirs', '--hyperopt_seed')
+
+
+def _drop_option(arguments: Sequence[str], flag: str) -> List[str]:
+    """Removes `flag` and its values from a command line argument list."""
+    out, skipping = [], False
+    for token in arguments:
+        if token == flag:
+            skipping = True
+            continue
+        if skipping and not token.startswith('--'):
+            continue
+        skipping = False
+        out.append(token)
+    return out
+
+
+def _set_option(arguments: Sequence[str], flag: str, *values) -> List[str]:
+    return _drop_option(arguments, flag) + [flag, *[str(v) for v in values]]
+
+
+def sample_configs(num_iters: int, seed: int = 0) -> List[Dict]:
+    """Draws `num_iters` distinct configurations from the search space."""
+    rng = np.random.RandomState(seed)
+    configs, seen = [], set()
+    max_configs = np.prod([len(values) for values in SEARCH_SPACE.values()])
+    while len(configs) < min(num_iters, max_configs):
+        config = {name: values[rng.randint(len(values))].item() for name, values in SEARCH_SPACE.items()}
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def config_to_hyperparams(config: Dict) -> Dict:
+    """Expands `linked_hidden_size` the way chemprop's save_config does."""
+    hyperparams = {k: v for k, v in config.items() if k != 'linked_hidden_size'}
+    hyperparams['hidden_size'] = hyperparams['ffn_hidden_size'] = int(config['linked_hidden_size'])
+    for name in ('depth', 'ffn_num_layers'):
+        hyperparams[name] = int(hyperparams[name])
+    return hyperparams
+
+
+def fold_subset_args(arguments: Sequence[str], num_folds: int) -> List[str]:
+    """Returns arguments whose predetermined fold file keeps only the first `num_folds` folds."""
+    if '--crossval_index_file' in arguments:
+        index_path = arguments[list(arguments).index('--crossval_index_file') + 1]
+        with open(index_path, 'rb') as f:
+            folds = pickle.load(f)
+        if num_folds >= len(folds):
+            return list(arguments)
+        subset_path = f"{os.path.splitext(index_path)[0]}_first{num_folds}.pkl"
+        if not os.path.exists(subset_path):
+            with open(subset_path, 'wb') as f:
+                pickle.dump(folds[:num_folds], f)
+        return _set_option(arguments, '--crossval_index_file', subset_path)
+    return _set_option(arguments, '--num_folds', num_folds)
+
+
+def evaluate(train_arguments: Sequence[str], config: Dict, num_folds: int, epochs: int) -> Tuple[float, float]:
+    """Cross-validates one configuration on a (folds, epochs) budget and returns (mean, std) score."""
+    arguments = fold_subset_args(train_arguments, num_folds)
+    arguments = _set_option(arguments, '--epochs', epochs)
+    for name, value in config_to_hyperparams(config).items():
+        arguments = _set_option(arguments, f'--{name}', value)
+    save_dir = tempfile.mkdtemp(prefix='halving_trial_')
+    try:
+        args = chemprop.args.TrainArgs().parse_args(_set_option(arguments, '--save_dir', save_dir))
+        mean_score, std_score = chemprop.train.cross_validate(args=args, train_func=chemprop.train.run_training)
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    return float(mean_score), float(std_score)
+
+
+def _load_log(log_path: str) -> Dict[Tuple[str, int, int], dict]:
+    done = {}
+    if os.path.exists(log_path):
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    done[(json.dumps(record['config'], sort_keys=True), record['folds'], record['epochs'])] = record
+    return done
+
+
+def halving_hyperopt(arguments: Sequence[str], eta: int = ETA, rungs: Sequence[Tuple[float, float]] = RUNGS,
+                     log_path: Optional[str] = None) -> Dict:
+    """Successive-halving replacement for `chemprop.hyperparameter_optimization.hyperopt`.
+
+    Args:
+        arguments (list): The HyperoptArgs command line (as passed to chemprop's hyperopt);
+            --num_iters configurations are sampled and --num_folds / --epochs are the full budget.
+        eta (int): Reduction factor; the best 1/eta of each rung is promoted.
+        rungs (list): (fraction of folds, fraction of epochs) of each rung, ending with (1, 1).
+        log_path (str): Trial log, default `<config_save_path>_trials.jsonl`.
+
+    Returns:
+        dict: The best hyperparameters, also written to --config_save_path.
+    """
+    hyper_args = chemprop.args.HyperoptArgs().parse_args(list(arguments))
+    train_arguments = list(arguments)
+    for flag in HYPEROPT_ONLY:
+        train_arguments = _drop_option(train_arguments, flag)
+    log_path = log_path or f"{os.path.splitext(hyper_args.config_save_path)[0]}_trials.jsonl"
+    done = _load_log(log_path)
+    sign = 1 if hyper_args.minimize_score else -1
+
+    # chemprop resets --seed to 0 for predetermined splits; --hyperopt_seed seeds the sampling as in chemprop
+    configs = sample_configs(hyper_args.num_iters, seed=hyper_args.hyperopt_seed)
+    full_folds, full_epochs = hyper_args.num_folds, hyper_args.epochs
+    spent = 0
+    for rung, (fold_fraction, epoch_fraction) in enumerate(rungs):
+        num_folds = max(1, int(round(full_folds * fold_fraction)))
+        epochs = max(1, int(round(full_epochs * epoch_fraction)))
+        print(f"rung {rung}: {len(configs)} configs x {num_folds} folds x {epochs} epochs")
+        scored = []
+        for trial, config in enumerate(configs):
+            key = (json.dumps(config, sort_keys=True), num_folds, epochs)
+            record = done.get(key)
+            if record is None:
+                start_time = datetime.now()
+                mean_score, std_score = evaluate(train_arguments, config, num_folds, epochs)
+                record = {'rung': rung, 'trial': trial, 'config': config, 'folds': num_folds, 'epochs': epochs,
+                          'budget': num_folds * epochs, 'mean_score': mean_score, 'std_score': std_score,
+                          'seconds': (datetime.now() - start_time).total_seconds()}
+                with open(log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+                done[key] = record
+                spent += record['budget']
+            if np.isnan(record['mean_score']):
+                continue
+            scored.append((sign * record['mean_score'], trial, config))
+        scored.sort(key=lambda item: item[0])
+        if rung == len(rungs) - 1 or len(scored) <= 1:
+            break
+        configs = [config for _, _, config in scored[:max(1, len(scored) // eta)]]
+
+    if not scored:
+        raise RuntimeError("every hyperparameter configuration failed")
+    best = config_to_hyperparams(scored[0][2])
+    os.makedirs(os.path.dirname(hyper_args.config_save_path) or '.', exist_ok=True)
+    with open(hyper_args.config_save_path, 'w') as f:
+        json.dump(best, f, indent=4, sort_keys=True)
+    full_search = hyper_args.num_iters * full_folds * full_epochs
+    print(f"best {hyper_args.metric} {sign * scored[0][0]:.4f} with {best}; "
+          f"{spent} fold-epochs trained this run, full search would take {full_search}")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving chemprop hyperparameter search.")
+    parser.add_argument('--data_path', default='data/merge_dataset.csv')
+    parser.add_argument('--config_save_path', default='chemprop_config/multi_config_all.json')
+    parser.add_argument('--num_iters', type=int, default=30)
+    parser.add_argument('--num_folds', type=int, default=5)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=3407)
+    parser.add_argument('--target_columns', nargs='*', default=None)
+    parser.add_argument('--eta', type=int, default=ETA)
+    parser.add_argument('--gpu', type=int, default=0)
+    cli_args = parser.parse_args()
+
+    arguments = [
+        '--data_path', cli_args.data_path,
+        '--dataset_type', 'classification',
+        '--num_iters', str(cli_args.num_iters),
+        '--config_save_path', cli_args.config_save_path,
+        '--epochs', str(cli_args.epochs),
+        '--aggregation', 'norm',
+        '--features_generator', 'rdkit_2d_normalized',
+        '--no_features_scaling',
+        '--gpu', str(cli_args.gpu),
+        '--quiet',
+        '--seed', str(cli_args.seed),
+        '--class_balance',
+        *chemprop_split_args(cli_args.data_path, num_folds=cli_args.num_folds, split_type='scaffold',
+                             seed=cli_args.seed, target_columns=cli_args.target_columns),
+    ]
+    if cli_args.target_columns:
+        arguments.extend(['--target_columns', *cli_args.target_columns])
+    start_time = datetime.now()
+    halving_hyperopt(arguments, eta=cli_args.eta)
+    print(f"finish halving hyperopt, cost time {datetime.now() - start_time}")
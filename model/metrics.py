@@ -0,0 +1,24 @@
+# -*- coding:utf-8 -*-
+"""
+Evaluation helpers shared by the model scripts.
+"""
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+from sklearn.utils import resample
+
+
+def bootstrap_auc(y_true, y_score, n_bootstrap: int = 1000, random_state=None):
+    """Bootstrap estimate of the ROC AUC.
+
+    Resamples (label, score) pairs with replacement `n_bootstrap` times.
+
+    Returns:
+        tuple: (mean AUC, standard deviation of the AUC) over the bootstrap samples.
+    """
+    rng = np.random.RandomState(random_state) if random_state is not None else None
+    auc_scores = []
+    for _ in range(n_bootstrap):
+        y_sample, score_sample = resample(y_true, y_score, random_state=rng)
+        auc_scores.append(roc_auc_score(y_sample, score_sample))
+    return np.mean(auc_scores), np.std(auc_scores)
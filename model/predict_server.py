@@ -0,0 +1,236 @@
+# -*- coding:utf-8 -*-
+"""
+Resident prediction service for the DMPNN ensemble.
+
+The checkpoints are loaded once when the server starts. SMILES arrive over a
+local HTTP endpoint; concurrent requests are collected into micro-batches (up
+to `max_batch` molecules, or whatever arrived within `max_wait` seconds of the
+first one) and predicted together, and every prediction is cached by RDKit
+canonical SMILES, so repeated structures never reach the model again.
+
+Endpoints:
+    POST /predict   {"smiles": ["CCO", ...]}
+                    -> {"targets": [...], "predictions": [{"smiles": ..., "canonical_smiles": ...,
+                                                           "EC50_drer": 0.12, ...}, ...]}
+    GET  /health    -> {"status": "ok", "targets": [...], "stats": {...}}
+
+Example (run from the repository root):
+    python model/predict_server.py --checkpoint_dir checkpoints/checkpoints_multi_all --port 8765
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from screening import canonicalize_smiles, load_ensemble, predict_smiles, task_names_of
+
+MAX_BATCH = 256
+MAX_WAIT = 0.02
+CACHE_SIZE = 100000
+MAX_REQUEST_SMILES = 10000
+
+
+class PredictionService:
+    """Micro-batching, caching front end of a loaded model.
+
+    Args:
+        predict_fn (callable): Maps a list of SMILES to an (n, num_tasks) array, NaN for failures.
+        task_names (list): Names of the predicted targets.
+        max_batch (int): Largest number of molecules predicted in one call.
+        max_wait (float): Seconds the batcher waits for more requests after the first one.
+        cache_size (int): Number of canonical SMILES whose predictions are kept (LRU).
+    """
+
+    def __init__(self, predict_fn: Callable[[List[str]], np.ndarray], task_names: List[str],
+                 max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT, cache_size: int = CACHE_SIZE):
+        self.predict_fn = predict_fn
+        self.task_names = list(task_names)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[Optional[float]]]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._queue: Queue = Queue()
+        self.stats = {'requests': 0, 'molecules': 0, 'cache_hits': 0, 'batches': 0, 'predicted': 0}
+        self._worker = threading.Thread(target=self._batch_loop, name='prediction-batcher', daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_checkpoints(cls, checkpoint_dir: str, features_generator: Optional[str] = 'rdkit_2d_normalized',
+                         gpu: Optional[int] = 0, **kwargs) -> 'PredictionService':
+        """Loads the ensemble in `checkpoint_dir` once and wraps it in a service."""
+        args, model_objects = load_ensemble(checkpoint_dir, features_generator=features_generator, gpu=gpu)
+        return cls(lambda smiles: predict_smiles(args, model_objects, smiles), task_names_of(model_objects), **kwargs)
+
+    def _cached(self, key: str) -> Optional[List[Optional[float]]]:
+        row = self._cache.get(key)
+        if row is not None:
+            self._cache.move_to_end(key)
+        return row
+
+    def _store(self, key: str, row: List[Optional[float]]):
+        self._cache[key] = row
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            try:
+                preds = self.predict_fn(batch)
+                rows = [[None if math.isnan(v) else float(v) for v in pred] for pred in np.asarray(preds, dtype=float)]
+                error = None
+            except Exception as e:  # a failing batch must not kill the batcher
+                rows, error = None, e
+            with self._lock:
+                self.stats['batches'] += 1
+                self.stats['predicted'] += len(batch)
+                for i, key in enumerate(batch):
+                    future = self._pending.pop(key)
+                    if error is not None:
+                        future.set_exception(error)
+                        continue
+                    self._store(key, rows[i])
+                    future.set_result(rows[i])
+
+    def predict(self, smiles: List[str], timeout: Optional[float] = None) -> List[dict]:
+        """Predicts a list of SMILES, blocking until every prediction is available.
+
+        Returns:
+            list: One dict per input with the input SMILES, its canonical form and one value per
+                target; invalid SMILES get an 'error' entry instead of predictions.
+        """
+        keys = [canonicalize_smiles(s) for s in smiles]
+        slots = []
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['molecules'] += len(smiles)
+            for key in keys:
+                if not key:
+                    slots.append(None)
+                    continue
+                row = self._cached(key)
+                if row is not None:
+                    self.stats['cache_hits'] += 1
+                    slots.append(row)
+                    continue
+                # A structure already queued by another request is shared, not predicted twice.
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                    self._queue.put(key)
+                slots.append(future)
+
+        results = []
+        for s, key, slot in zip(smiles, keys, slots):
+            record = {'smiles': s, 'canonical_smiles': key}
+            if slot is None:
+                record['error'] = 'Invalid SMILES'
+            else:
+                row = slot.result(timeout) if isinstance(slot, Future) else slot
+                record.update(zip(self.task_names, row))
+            results.append(record)
+        return results
+
+
+def make_handler(service: PredictionService):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') != '/health':
+                self._send(404, {'error': f"unknown path {self.path}"})
+                return
+            with service._lock:
+                stats = dict(service.stats, cached=len(service._cache))
+            self._send(200, {'status': 'ok', 'targets': service.task_names, 'stats': stats})
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/predict':
+                self._send(404, {'error': f"unknown path {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not isinstance(request, dict):
+                    raise ValueError("the request body must be a JSON object")
+                smiles = request['smiles']
+                if isinstance(smiles, str):
+                    smiles = [smiles]
+                if not isinstance(smiles, list) or not all(isinstance(s, str) for s in smiles):
+                    raise ValueError("'smiles' must be a string or a list of strings")
+                if len(smiles) > MAX_REQUEST_SMILES:
+                    raise ValueError(f"at most {MAX_REQUEST_SMILES} SMILES per request")
+            except (ValueError, KeyError) as e:
+                self._send(400, {'error': str(e)})
+                return
+            try:
+                predictions = service.predict(smiles)
+            except Exception as e:
+                self._send(500, {'error': f"prediction failed: {e}"})
+                return
+            self._send(200, {'targets': service.task_names, 'predictions': predictions})
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+
+def serve(service: PredictionService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    """Starts the HTTP server in a background thread and returns it (call `shutdown()` to stop)."""
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='prediction-http', daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident DMPNN prediction service.")
+    parser.add_argument('--checkpoint_dir', default='checkpoints/checkpoints_multi_all')
+    parser.add_argument('--features_generator', default='rdkit_2d_normalized')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--gpu', type=int, default=0)
+    parser.add_argument('--no_cuda', action='store_true')
+    parser.add_argument('--max_batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max_wait_ms', type=float, default=MAX_WAIT * 1000)
+    parser.add_argument('--cache_size', type=int, default=CACHE_SIZE)
+    cli_args = parser.parse_args()
+
+    service = PredictionService.from_checkpoints(cli_args.checkpoint_dir, cli_args.features_generator or None,
+                                                 gpu=None if cli_args.no_cuda else cli_args.gpu,
+                                                 max_batch=cli_args.max_batch, max_wait=cli_args.max_wait_ms / 1000,
+                                                 cache_size=cli_args.cache_size)
+    server = ThreadingHTTPServer((cli_args.host, cli_args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"serving {len(service.task_names)} targets on http://{cli_args.host}:{cli_args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
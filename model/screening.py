@@ -0,0 +1,347 @@
+# -*- coding:utf-8 -*-
+"""
+Streaming screening with a trained chemprop ensemble.
+
+The ensemble is loaded once and a (possibly very large) CSV of molecules is
+read, featurized and predicted chunk by chunk, with every finished chunk
+appended to the output file. A small progress file next to the output records
+how many input rows have been written, so an interrupted screen resumes from
+the last completed chunk instead of starting over.
+
+Duplicate structures can be collapsed before the ensemble is run: SMILES are
+canonicalized with RDKit, invalid ones are dropped up front, every unique
+structure is predicted once and the predictions are fanned back out to all
+original rows.
+
+Example (run from the repository root):
+    python model/screening.py --test_path lotus/lotus_smiles_with_cas.csv \
+        --preds_path lotus/smiles_with_cas_preds.csv \
+        --checkpoint_dir checkpoints/checkpoints_multi_all
+"""
+
+import argparse
+import json
+import os
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+import chemprop
+from rdkit import Chem, RDLogger
+
+from tables import iter_table
+
+CHUNK_SIZE = 2000
+
+
+def load_ensemble(checkpoint_dir: str, features_generator: Optional[str] = 'rdkit_2d_normalized',
+                  smiles_column: str = 'smiles', gpu: Optional[int] = 0, extra_args: Optional[List[str]] = None):
+    """Loads every checkpoint of an ensemble once.
+
+    Args:
+        checkpoint_dir (str): Directory searched recursively for model.pt files, or the path
+            of a single model.pt file to load one ensemble member only.
+        features_generator (str): Features generator used when training, None for none.
+        smiles_column (str): Name of the SMILES column of the files to be screened.
+        gpu (int): GPU index, None to run on CPU.
+        extra_args (list): Additional chemprop PredictArgs command line arguments.
+
+    Returns:
+        tuple: (args, model_objects) ready to be passed to `predict_smiles`.
+    """
+    arguments = [
+        '--test_path', os.devnull,
+        '--preds_path', os.devnull,
+        '--checkpoint_path' if checkpoint_dir.endswith('.pt') else '--checkpoint_dir', checkpoint_dir,
+        '--num_workers', '0',
+        '--smiles_columns', smiles_column,
+    ]
+    if features_generator:
+        arguments.extend(['--features_generator', features_generator, '--no_features_scaling'])
+    if gpu is None:
+        arguments.append('--no_cuda')
+    else:
+        arguments.extend(['--gpu', str(gpu)])
+    arguments.extend(extra_args or [])
+    args = chemprop.args.PredictArgs().parse_args(arguments)
+    model_objects = chemprop.train.load_model(args=args)
+    return args, model_objects
+
+
+def task_names_of(model_objects) -> List[str]:
+    """Returns the task (target column) names of a loaded ensemble."""
+    return list(model_objects[5])
+
+
+def predict_smiles(args, model_objects, smiles: List[str]) -> np.ndarray:
+    """Predicts a list of SMILES with an already loaded ensemble.
+
+    Invalid SMILES do not abort the batch; their rows are filled with NaN.
+
+    Returns:
+        np.ndarray: Array of shape (len(smiles), num_tasks).
+    """
+    num_tasks = len(task_names_of(model_objects))
+    if len(smiles) == 0:
+        return np.empty((0, num_tasks))
+    preds = chemprop.train.make_predictions(args=args, smiles=[[s] for s in smiles],
+                                            model_objects=model_objects)
+    out = np.full((len(smiles), num_tasks), np.nan)
+    for i, pred in enumerate(preds):
+        if pred is None or any(isinstance(p, str) for p in pred):
+            continue
+        out[i] = pred
+    return out
+
+
+def canonicalize_smiles(smiles: str, isomeric: bool = True) -> str:
+    """Returns the RDKit canonical SMILES, or an empty string for invalid input.
+
+    With `isomeric=False` stereochemistry is dropped, so stereoisomers collapse
+    into one structure (the model then sees them as identical).
+    """
+    RDLogger.DisableLog('rdApp.*')
+    mol = Chem.MolFromSmiles(smiles) if isinstance(smiles, str) else None
+    if mol is None:
+        return ''
+    return Chem.MolToSmiles(mol, isomericSmiles=isomeric)
+
+
+def _canonicalize_isomeric(smiles):
+    return canonicalize_smiles(smiles, True)
+
+
+def _canonicalize_flat(smiles):
+    return canonicalize_smiles(smiles, False)
+
+
+def canonicalize_many(smiles: List[str], isomeric: bool = True, n_jobs: int = 1, pool=None) -> List[str]:
+    """Canonicalizes a list of SMILES, optionally in `n_jobs` processes.
+
+    Callers canonicalizing many chunks pass their own `pool` so the worker
+    processes are started once instead of once per chunk.
+    """
+    func = _canonicalize_isomeric if isomeric else _canonicalize_flat
+    if pool is not None and len(smiles) > 1000:
+        return pool.map(func, smiles, chunksize=500)
+    if n_jobs > 1 and len(smiles) > 1000:
+        with Pool(n_jobs) as pool:
+            return pool.map(func, smiles, chunksize=500)
+    return [func(s) for s in smiles]
+
+
+def deduplicate_library(test_path: str, mapped_path: str, unique_path: str, smiles_column: str = 'smiles',
+                        chunk_size: int = CHUNK_SIZE, isomeric: bool = True, n_jobs: int = 1) -> dict:
+    """Canonicalizes a library and writes its unique valid structures.
+
+    Args:
+        test_path (str): CSV file with the molecules to screen.
+        mapped_path (str): Output copy of `test_path` with an added `canonical_smiles` column
+            (empty for invalid SMILES).
+        unique_path (str): Output CSV with one `smiles` column holding each unique canonical SMILES once.
+        isomeric (bool): Keep stereochemistry when canonicalizing.
+        n_jobs (int): Number of processes used for canonicalization, shared by all chunks.
+
+    Returns:
+        dict: Counts of total, invalid and unique rows.
+    """
+    seen = set()
+    stats = {"rows": 0, "invalid": 0, "unique": 0}
+    with (Pool(n_jobs) if n_jobs > 1 else nullcontext()) as pool:
+        for i, chunk in enumerate(iter_table(test_path, chunk_size)):
+            canonical = canonicalize_many(chunk[smiles_column].tolist(), isomeric, pool=pool)
+            chunk['canonical_smiles'] = canonical
+            chunk.to_csv(mapped_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            new = []
+            for smiles in canonical:
+                if smiles and smiles not in seen:
+                    seen.add(smiles)
+                    new.append(smiles)
+            pd.DataFrame({'smiles': new}).to_csv(unique_path, mode='w' if i == 0 else 'a', header=i == 0,
+                                                 index=False)
+            stats["rows"] += len(chunk)
+            stats["invalid"] += sum(1 for smiles in canonical if not smiles)
+    stats["unique"] = len(seen)
+    return stats
+
+
+def fan_out_predictions(mapped_path: str, unique_preds_path: str, preds_path: str, chunk_size: int = CHUNK_SIZE):
+    """Joins the predictions of unique structures back onto every original row.
+
+    Only the unique predictions are held in memory; the original rows are streamed.
+    The helper `canonical_smiles` column is not written to `preds_path`.
+    """
+    unique_preds = pd.read_csv(unique_preds_path).drop_duplicates('smiles').set_index('smiles')
+    for i, chunk in enumerate(pd.read_csv(mapped_path, chunksize=chunk_size,
+                                          keep_default_na=False)):
+        preds = unique_preds.reindex(chunk['canonical_smiles'])
+        preds.index = chunk.index
+        chunk = pd.concat([chunk.drop(columns='canonical_smiles'), preds], axis=1)
+        chunk.to_csv(preds_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+def screen_library(test_path: str, preds_path: str, checkpoint_dir: str = None, chunk_size: int = CHUNK_SIZE,
+                   smiles_column: str = 'smiles', features_generator: Optional[str] = 'rdkit_2d_normalized',
+                   gpu: Optional[int] = 0, resume: bool = True, ensemble=None,
+                   isomeric: bool = True, n_jobs: int = 1) -> dict:
+    """Canonicalizes and deduplicates a library, predicts each unique structure once and fans out.
+
+    Intermediate files live in `<preds_path>.work/`; the prediction of unique
+    structures is resumable like `stream_predictions`. A resume redoes every stage
+    when `test_path`, `smiles_column` or `isomeric` differ from the previous run.
+
+    Returns:
+        dict: Counts of total, invalid and unique rows.
+    """
+    work_dir = f"{preds_path}.work"
+    os.makedirs(work_dir, exist_ok=True)
+    mapped_path = os.path.join(work_dir, 'mapped.csv')
+    unique_path = os.path.join(work_dir, 'unique.csv')
+    unique_preds_path = os.path.join(work_dir, 'unique_preds.csv')
+    stats_path = os.path.join(work_dir, 'dedup_stats.json')
+
+    # The deduplication is only reused for the same library, SMILES column and stereo handling.
+    params = {"test_path": os.path.abspath(test_path), "smiles_column": smiles_column, "isomeric": isomeric}
+    stats = None
+    if resume and os.path.exists(stats_path):
+        with open(stats_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.pop("params", None) == params:
+            stats = saved
+        else:
+            print(f"{work_dir} was deduplicated with different settings, starting over")
+    if stats is None:
+        start_time = datetime.now()
+        stats = deduplicate_library(test_path, mapped_path, unique_path, smiles_column, chunk_size, isomeric, n_jobs)
+        with open(stats_path, 'w', encoding='utf-8') as f:
+            json.dump({**stats, "params": params}, f)
+        resume = False
+        print(f"{stats['rows']} rows, {stats['invalid']} invalid, {stats['unique']} unique structures, "
+              f"cost time {datetime.now() - start_time}")
+
+    stream_predictions(unique_path, unique_preds_path, checkpoint_dir, chunk_size, 'smiles',
+                       features_generator, gpu, resume, ensemble)
+    fan_out_predictions(mapped_path, unique_preds_path, preds_path, chunk_size)
+    return stats
+
+
+def _progress_path(preds_path: str) -> str:
+    return f"{preds_path}.progress.json"
+
+
+def _load_progress(preds_path: str) -> dict:
+    """Reads the progress record and truncates any partially written chunk."""
+    progress_path = _progress_path(preds_path)
+    if not (os.path.exists(progress_path) and os.path.exists(preds_path)):
+        return {"rows_done": 0, "bytes": 0}
+    with open(progress_path, 'r', encoding='utf-8') as f:
+        progress = json.load(f)
+    if os.path.getsize(preds_path) > progress["bytes"]:
+        with open(preds_path, 'r+b') as f:
+            f.truncate(progress["bytes"])
+    return progress
+
+
+def _save_progress(preds_path: str, progress: dict):
+    tmp_path = _progress_path(preds_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, _progress_path(preds_path))
+
+
+def stream_scores(test_path: str, preds_path: str, predict_fn: Callable[[List[str]], np.ndarray],
+                  column_names: List[str], chunk_size: int = CHUNK_SIZE, smiles_column: str = 'smiles',
+                  resume: bool = True) -> int:
+    """Scores a CSV or Parquet file chunk by chunk with any `predict_fn` and appends the results to `preds_path`.
+
+    `predict_fn` maps a list of SMILES to an array of shape (n, len(column_names)).
+    The output keeps every input column and adds `column_names`.
+
+    Returns:
+        int: Number of input rows written to `preds_path` in total.
+    """
+    progress = _load_progress(preds_path) if resume else {"rows_done": 0, "bytes": 0}
+    if progress["rows_done"] == 0 and os.path.exists(preds_path):
+        os.remove(preds_path)
+
+    for chunk in iter_table(test_path, chunk_size, skip_rows=progress["rows_done"]):
+        start_time = datetime.now()
+        preds = predict_fn(chunk[smiles_column].astype(str).tolist())
+        for i, column_name in enumerate(column_names):
+            chunk[column_name] = preds[:, i]
+        chunk.to_csv(preds_path, mode='a', header=progress["rows_done"] == 0, index=False)
+        progress["rows_done"] += len(chunk)
+        progress["bytes"] = os.path.getsize(preds_path)
+        _save_progress(preds_path, progress)
+        print(f"predicted {progress['rows_done']} rows, chunk cost time {datetime.now() - start_time}")
+    return progress["rows_done"]
+
+
+def stream_predictions(test_path: str, preds_path: str, checkpoint_dir: str = None, chunk_size: int = CHUNK_SIZE,
+                       smiles_column: str = 'smiles', features_generator: Optional[str] = 'rdkit_2d_normalized',
+                       gpu: Optional[int] = 0, resume: bool = True, ensemble=None) -> int:
+    """Screens a CSV file chunk by chunk and appends the predictions to `preds_path`.
+
+    The output keeps every input column and adds one column per task, like
+    `chemprop.train.make_predictions` does, so memory stays flat no matter how
+    large the input is.
+
+    Args:
+        test_path (str): CSV file with the molecules to screen.
+        preds_path (str): Output CSV file.
+        checkpoint_dir (str): Ensemble directory, ignored when `ensemble` is given.
+        chunk_size (int): Number of rows featurized and predicted at once.
+        smiles_column (str): Name of the SMILES column.
+        features_generator (str): Features generator used when training the ensemble.
+        gpu (int): GPU index, None to run on CPU.
+        resume (bool): Continue after the last completed chunk of a previous run.
+        ensemble (tuple): Output of `load_ensemble`, to reuse already loaded models.
+
+    Returns:
+        int: Number of input rows written to `preds_path` in total.
+    """
+    if ensemble is None:
+        ensemble = load_ensemble(checkpoint_dir, features_generator, smiles_column, gpu)
+    args, model_objects = ensemble
+    scratch_path = f"{preds_path}.chunk.csv"
+    args.preds_path = scratch_path
+
+    n_rows = stream_scores(test_path, preds_path, lambda smiles: predict_smiles(args, model_objects, smiles),
+                           task_names_of(model_objects), chunk_size, smiles_column, resume)
+    if os.path.exists(scratch_path):
+        os.remove(scratch_path)
+    return n_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunked, resumable ensemble screening.")
+    parser.add_argument('--test_path', default='lotus/lotus_smiles_with_cas.csv')
+    parser.add_argument('--preds_path', default='lotus/smiles_with_cas_preds.csv')
+    parser.add_argument('--checkpoint_dir', default='checkpoints/checkpoints_multi_all')
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--smiles_column', default='smiles')
+    parser.add_argument('--gpu', type=int, default=0)
+    parser.add_argument('--no_cuda', action='store_true')
+    parser.add_argument('--restart', action='store_true', help="ignore previous progress and start over")
+    parser.add_argument('--deduplicate', action='store_true', help="predict each canonical structure only once")
+    parser.add_argument('--ignore_stereo', action='store_true', help="collapse stereoisomers when deduplicating")
+    parser.add_argument('--n_jobs', type=int, default=1, help="processes used for canonicalization")
+    cli_args = parser.parse_args()
+
+    start_time = datetime.now()
+    gpu = None if cli_args.no_cuda else cli_args.gpu
+    if cli_args.deduplicate:
+        stats = screen_library(cli_args.test_path, cli_args.preds_path, cli_args.checkpoint_dir,
+                               chunk_size=cli_args.chunk_size, smiles_column=cli_args.smiles_column, gpu=gpu,
+                               resume=not cli_args.restart, isomeric=not cli_args.ignore_stereo,
+                               n_jobs=cli_args.n_jobs)
+        n_rows = stats["rows"]
+    else:
+        n_rows = stream_predictions(cli_args.test_path, cli_args.preds_path, cli_args.checkpoint_dir,
+                                    chunk_size=cli_args.chunk_size, smiles_column=cli_args.smiles_column,
+                                    gpu=gpu, resume=not cli_args.restart)
+    print(f"finish screening {n_rows} rows, cost time {datetime.now() - start_time}")
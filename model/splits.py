@@ -0,0 +1,192 @@
+# -*- coding:utf-8 -*-
+"""
+Reproducible dataset splits as index arrays.
+
+Bemis-Murcko scaffolds are computed once, in parallel, and cached on disk by
+SMILES, so repeated sweeps never recompute them. From the scaffolds (or from a
+seeded permutation) this module builds random, scaffold-balanced and k-fold
+splits as NumPy index arrays over the rows of a dataset file, without writing
+CSV copies. The same indices can be handed to chemprop (`index_predetermined`
+splits) and to scikit-learn (`cv=` iterables).
+
+Example (run from the repository root):
+    python model/splits.py --data_path data/merge_dataset.csv --split_type scaffold --num_folds 5
+"""
+
+import argparse
+import json
+import os
+import pickle
+from collections import defaultdict
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+from rdkit.Chem.Scaffolds import MurckoScaffold
+
+SCAFFOLD_CACHE_PATH = 'data/.cache/scaffolds.json'
+SPLIT_DIR = 'data/.cache/splits'
+
+
+def scaffold_of(smiles: str) -> str:
+    """Bemis-Murcko scaffold without chirality, as chemprop computes it; invalid SMILES map to themselves."""
+    RDLogger.DisableLog('rdApp.*')
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return smiles
+    return MurckoScaffold.MurckoScaffoldSmiles(mol=mol, includeChirality=False)
+
+
+def compute_scaffolds(smiles: Sequence[str], cache_path: str = SCAFFOLD_CACHE_PATH, n_jobs: int = 4) -> List[str]:
+    """Returns the scaffold of every SMILES, computing only the ones missing from the on-disk cache."""
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    missing = sorted(set(smiles) - cache.keys())
+    if missing:
+        if n_jobs > 1 and len(missing) > 1000:
+            with Pool(n_jobs) as pool:
+                scaffolds = pool.map(scaffold_of, missing, chunksize=500)
+        else:
+            scaffolds = [scaffold_of(s) for s in missing]
+        cache.update(zip(missing, scaffolds))
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+    return [cache[s] for s in smiles]
+
+
+def scaffold_groups(scaffolds: Sequence[str]) -> List[np.ndarray]:
+    """Groups row indices by scaffold, in order of first appearance."""
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for i, scaffold in enumerate(scaffolds):
+        groups[scaffold].append(i)
+    return [np.array(indices) for indices in groups.values()]
+
+
+def random_split(n: int, sizes: Tuple[float, float, float] = (0.8, 0.1, 0.1), seed: int = 0) -> List[np.ndarray]:
+    """Seeded random train/val/test split of `n` rows."""
+    permutation = np.random.RandomState(seed).permutation(n)
+    train_end = int(sizes[0] * n)
+    val_end = int((sizes[0] + sizes[1]) * n)
+    return [np.sort(permutation[:train_end]), np.sort(permutation[train_end:val_end]), np.sort(permutation[val_end:])]
+
+
+def scaffold_split(scaffolds: Sequence[str], sizes: Tuple[float, float, float] = (0.8, 0.1, 0.1),
+                   seed: int = 0) -> List[np.ndarray]:
+    """Seeded scaffold-balanced train/val/test split, following chemprop's `scaffold_balanced` rule.
+
+    Scaffold sets too big for val/test go to train first; the remaining sets are
+    shuffled and filled greedily into train, val and test.
+    """
+    n = len(scaffolds)
+    train_size, val_size = sizes[0] * n, sizes[1] * n
+    test_size = n - int(train_size) - int(val_size)
+    groups = scaffold_groups(scaffolds)
+    rng = np.random.RandomState(seed)
+    big = [g for g in groups if len(g) > val_size / 2 or len(g) > test_size / 2]
+    small = [g for g in groups if not (len(g) > val_size / 2 or len(g) > test_size / 2)]
+    rng.shuffle(big)
+    rng.shuffle(small)
+    train, val, test = [], [], []
+    for group in big + small:
+        if len(train) + len(group) <= train_size:
+            train.extend(group)
+        elif len(val) + len(group) <= val_size:
+            val.extend(group)
+        else:
+            test.extend(group)
+    return [np.sort(np.array(part, dtype=int)) for part in (train, val, test)]
+
+
+def kfold_indices(smiles: Sequence[str], num_folds: int = 5, split_type: str = 'scaffold', seed: int = 0,
+                  cache_path: str = SCAFFOLD_CACHE_PATH) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Seeded k-fold (train, test) index pairs, usable directly as a scikit-learn `cv=` argument.
+
+    With `split_type='scaffold'` whole scaffold sets are assigned to folds,
+    largest first, each to the currently smallest fold.
+    """
+    n = len(smiles)
+    rng = np.random.RandomState(seed)
+    if split_type == 'random':
+        fold_of = rng.permutation(n) % num_folds
+    else:
+        groups = scaffold_groups(compute_scaffolds(smiles, cache_path))
+        order = rng.permutation(len(groups))
+        order = sorted(order, key=lambda i: -len(groups[i]))
+        fold_of = np.empty(n, dtype=int)
+        fold_sizes = np.zeros(num_folds, dtype=int)
+        for i in order:
+            fold = int(np.argmin(fold_sizes))
+            fold_of[groups[i]] = fold
+            fold_sizes[fold] += len(groups[i])
+    all_indices = np.arange(n)
+    return [(all_indices[fold_of != fold], all_indices[fold_of == fold]) for fold in range(num_folds)]
+
+
+def cross_validation_splits(smiles: Sequence[str], num_folds: int = 5, split_type: str = 'scaffold',
+                            sizes: Tuple[float, float, float] = (0.8, 0.1, 0.1), seed: int = 0,
+                            cache_path: str = SCAFFOLD_CACHE_PATH) -> List[List[np.ndarray]]:
+    """One seeded train/val/test split per fold (seeds `seed` .. `seed + num_folds - 1`)."""
+    if split_type == 'random':
+        return [random_split(len(smiles), sizes, seed + fold) for fold in range(num_folds)]
+    scaffolds = compute_scaffolds(smiles, cache_path)
+    return [scaffold_split(scaffolds, sizes, seed + fold) for fold in range(num_folds)]
+
+
+def chemprop_rows(data_path: str, smiles_column: str = 'smiles',
+                  target_columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """The rows of `data_path` that chemprop keeps when it loads the file for training.
+
+    chemprop skips rows whose selected targets are all empty and rows whose SMILES
+    RDKit cannot parse (or that have no heavy atoms), and `index_predetermined`
+    splits index into what is left. Without `target_columns`, every column other
+    than the SMILES column is a target, as in chemprop.
+    """
+    df = pd.read_csv(data_path)
+    targets = list(target_columns) if target_columns else [c for c in df.columns if c != smiles_column]
+    df = df[df[targets].notna().any(axis=1)]
+    RDLogger.DisableLog('rdApp.*')
+    mols = [Chem.MolFromSmiles(s) if isinstance(s, str) else None for s in df[smiles_column]]
+    return df[[mol is not None and mol.GetNumHeavyAtoms() > 0 for mol in mols]]
+
+
+def chemprop_split_args(data_path: str, num_folds: int = 5, split_type: str = 'scaffold',
+                        sizes: Tuple[float, float, float] = (0.8, 0.1, 0.1), seed: int = 0,
+                        smiles_column: str = 'smiles', split_dir: str = SPLIT_DIR,
+                        target_columns: Optional[Sequence[str]] = None) -> List[str]:
+    """Writes (once) the folds of `data_path` for chemprop and returns the matching command line arguments.
+
+    chemprop reads the file with `--split_type index_predetermined`; the number
+    of folds is taken from the file. The folds index the rows chemprop keeps
+    (see `chemprop_rows`), so `target_columns` must match the run's `--target_columns`.
+    """
+    name = os.path.splitext(os.path.normpath(data_path))[0].replace(os.sep, '_')
+    targets_tag = '-'.join(target_columns) if target_columns else 'all'
+    sizes_tag = '_'.join(str(size) for size in sizes)
+    index_path = os.path.join(split_dir, f"{name}_{targets_tag}_{split_type}_{num_folds}fold_{sizes_tag}_seed{seed}.pkl")
+    if not os.path.exists(index_path):
+        smiles = chemprop_rows(data_path, smiles_column, target_columns)[smiles_column].tolist()
+        folds = cross_validation_splits(smiles, num_folds, split_type, sizes, seed)
+        os.makedirs(split_dir, exist_ok=True)
+        with open(index_path, 'wb') as f:
+            pickle.dump([[part.tolist() for part in fold] for fold in folds], f)
+    return ['--split_type', 'index_predetermined', '--crossval_index_file', index_path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache scaffolds and write seeded index splits for chemprop.")
+    parser.add_argument('--data_path', default='data/merge_dataset.csv')
+    parser.add_argument('--split_type', choices=['scaffold', 'random'], default='scaffold')
+    parser.add_argument('--num_folds', type=int, default=5)
+    parser.add_argument('--split_sizes', type=float, nargs=3, default=[0.8, 0.1, 0.1])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target_columns', nargs='+', default=None, help="the --target_columns of the chemprop run")
+    cli_args = parser.parse_args()
+
+    print(chemprop_split_args(cli_args.data_path, cli_args.num_folds, cli_args.split_type,
+                              tuple(cli_args.split_sizes), cli_args.seed, target_columns=cli_args.target_columns))
@@ -0,0 +1,167 @@
+# -*- coding:utf-8 -*-
+"""
+Table I/O for datasets, predictions and batch results.
+
+Every table can be stored as CSV (for compatibility) or Parquet. Parquet reads
+only the requested columns and memory-maps the file, which matters for the
+LOTUS library, the prediction files and the agent result tables with their
+long free-text columns. pyarrow is only needed when a Parquet file is touched.
+
+Example (run from the repository root):
+    python model/tables.py convert data/merge_dataset.csv data/merge_dataset.parquet
+    python model/tables.py convert-all
+"""
+
+import argparse
+import glob
+import os
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+CHUNK_SIZE = 10000
+REPO_TABLES = [
+    'data/merge_*.csv',
+    'lotus/lotus_smiles_with_cas.csv',
+    'lotus/smiles_with_cas_preds.csv',
+    'agent/molecules.csv',
+    'agent/molecules_cas_cid_smiles.csv',
+]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("pyarrow is required for Parquet tables: pip install pyarrow") from e
+    return pyarrow
+
+
+def is_parquet(path: str) -> bool:
+    return path.endswith('.parquet') or path.endswith('.pq')
+
+
+def table_path(path: str) -> str:
+    """Returns the Parquet twin of a CSV path if it exists, otherwise the path itself."""
+    if path.endswith('.csv'):
+        parquet_path = path[:-len('.csv')] + '.parquet'
+        if os.path.exists(parquet_path):
+            return parquet_path
+    return path
+
+
+def read_table(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads a CSV or Parquet table, loading only `columns` when given.
+
+    Parquet files are memory-mapped.
+    """
+    if is_parquet(path):
+        pa = _pyarrow()
+        return pa.parquet.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_table(path: str, chunk_size: int = CHUNK_SIZE, columns: Optional[List[str]] = None,
+               skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """Yields a CSV or Parquet table in chunks of `chunk_size` rows, after skipping `skip_rows` rows."""
+    if not is_parquet(path):
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns, skiprows=range(1, skip_rows + 1))
+        return
+    pa = _pyarrow()
+    parquet_file = pa.parquet.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+        if skip_rows:
+            batch = batch.slice(skip_rows)
+            skip_rows = 0
+        yield batch.to_pandas()
+
+
+def write_table(df: pd.DataFrame, path: str):
+    """Writes a table as Parquet or CSV depending on the file extension."""
+    if is_parquet(path):
+        _pyarrow()
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+class TableWriter:
+    """Writes a table chunk by chunk as Parquet or CSV depending on the file extension.
+
+    Parquet chunks become row groups sharing the schema of the first chunk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+        self._schema = None
+        self._rows = 0
+
+    def write(self, df: pd.DataFrame):
+        if is_parquet(self.path):
+            pa = _pyarrow()
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self._rows == 0 else 'a', header=self._rows == 0, index=False)
+        self._rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self) -> 'TableWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert(src: str, dst: str, chunk_size: int = CHUNK_SIZE):
+    """Converts a table between CSV and Parquet without loading it into memory at once."""
+    pa = _pyarrow()
+    if is_parquet(dst) and not is_parquet(src):
+        # Column types are fixed from the first block so that every row group shares one schema.
+        reader = pa.csv.open_csv(src, read_options=pa.csv.ReadOptions(block_size=1 << 24))
+        with pa.parquet.ParquetWriter(dst, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+    elif is_parquet(src) and not is_parquet(dst):
+        for i, chunk in enumerate(iter_table(src, chunk_size)):
+            chunk.to_csv(dst, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    else:
+        raise ValueError(f"Nothing to convert between {src} and {dst}")
+
+
+def convert_all(root: str = '.'):
+    """Writes a Parquet twin next to every known CSV table of the repository."""
+    for pattern in REPO_TABLES:
+        for src in sorted(glob.glob(os.path.join(root, pattern))):
+            dst = src[:-len('.csv')] + '.parquet'
+            convert(src, dst)
+            print(f"{src} ({os.path.getsize(src) / 1e6:.1f} MB) -> {dst} ({os.path.getsize(dst) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CSV <-> Parquet conversion of the repository tables.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert')
+    convert_parser.add_argument('src')
+    convert_parser.add_argument('dst')
+    all_parser = subparsers.add_parser('convert-all')
+    all_parser.add_argument('--root', default='.')
+    cli_args = parser.parse_args()
+
+    if cli_args.command == 'convert':
+        convert(cli_args.src, cli_args.dst)
+    else:
+        convert_all(cli_args.root)
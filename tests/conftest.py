@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The model scripts import their siblings and the agent code imports MolSearch, both run from their directories.
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, 'agent'), os.path.join(ROOT_DIR, 'model')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
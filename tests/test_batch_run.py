@@ -0,0 +1,82 @@
+import json
+
+import batch_run
+
+
+def _write(path, records, tail=''):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        f.write(tail)
+
+
+def test_rerun_skips_finished_rows_and_keeps_latest_record(tmp_path):
+    partial = tmp_path / 'out.json.partial.jsonl'
+    _write(partial, [
+        {'row': 0, 'cas': 'a', 'overall_evaluation': 'ok'},
+        {'row': 2, 'cas': 'c', 'error': 'timeout'},
+        {'row': 1, 'cas': 'b', 'overall_evaluation': 'ok'},
+        {'row': 2, 'cas': 'c', 'overall_evaluation': 'retried'},
+        {'row': 3, 'cas': 'd', 'error': 'parse'},
+    ], tail='{"row": 4, "cas"')  # line cut short by a crash
+
+    offsets, done = batch_run.scan_partial(str(partial))
+    assert done == {0, 1, 2}
+    assert sorted(offsets) == [0, 1, 2, 3]
+
+    records = list(batch_run.iter_partial(str(partial), offsets))
+    assert [r['cas'] for r in records] == ['a', 'b', 'c', 'd']
+    assert records[2]['overall_evaluation'] == 'retried'
+    assert all('row' not in r for r in records)
+
+
+def test_missing_partial_file_means_nothing_done(tmp_path):
+    assert batch_run.scan_partial(str(tmp_path / 'none.jsonl')) == ({}, set())
+
+
+def test_append_after_crash_starts_on_a_new_line(tmp_path):
+    partial = tmp_path / 'out.json.partial.jsonl'
+    _write(partial, [{'row': 0, 'overall_evaluation': 'ok'}], tail='{"row": 1, "overall_ev')
+
+    batch_run.repair_partial(str(partial))
+    with open(partial, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'row': 1, 'overall_evaluation': 'retried'}) + '\n')
+        f.write(json.dumps({'row': 2, 'overall_evaluation': 'ok'}) + '\n')
+
+    assert batch_run.scan_partial(str(partial))[1] == {0, 1, 2}
+    batch_run.repair_partial(str(partial))  # a clean file is left untouched
+    assert batch_run.scan_partial(str(partial))[1] == {0, 1, 2}
+
+
+def test_shard_of_ignores_how_identifiers_were_parsed():
+    num_shards = 7
+    # The same molecule as read from CSV (float CID with NaNs in the column) and from Parquet (int or <NA>)
+    variants = [(' 499-44-5', 3611.0, 'CC(C)C1=CC(=O)C(=CC=C1)O'), ('499-44-5', '3611', 'CC(C)C1=CC(=O)C(=CC=C1)O'),
+                ('499-44-5', 3611, 'CC(C)C1=CC(=O)C(=CC=C1)O')]
+    assert len({batch_run.shard_of(*v, num_shards) for v in variants}) == 1
+    missing = [('64-17-5', float('nan'), 'CCO'), ('64-17-5', None, 'CCO'), ('64-17-5', '<NA>', 'CCO')]
+    assert len({batch_run.shard_of(*v, num_shards) for v in missing}) == 1
+    shards = [batch_run.shard_of(f"{i}-00-0", i, 'C' * (i % 5 + 1), num_shards) for i in range(200)]
+    assert set(shards) == set(range(num_shards))
+
+
+def test_merge_shards_restores_input_order(tmp_path):
+    output = str(tmp_path / 'results.json')
+    rows = {0: [0, 3, 4, 9], 1: [1, 2, 8], 2: [5, 6, 7]}
+    for shard, shard_rows in rows.items():
+        batch_run.write_results(({'row': r, 'name': f"m{r}", 'note': '[a, "b"]'} for r in shard_rows),
+                                batch_run.shard_output_path(output, shard, 3))
+
+    batch_run.merge_shards(output, 3)
+    with open(output, encoding='utf-8') as f:
+        merged = json.load(f)
+    assert merged == [{'name': f"m{r}", 'note': '[a, "b"]'} for r in range(10)]
+
+
+def test_iter_json_array_across_chunk_boundaries(tmp_path):
+    path = str(tmp_path / 'records.json')
+    records = [{'row': i, 'text': 'x' * i + ']},'} for i in range(20)]
+    batch_run.write_results(records, path)
+    assert list(batch_run.iter_json_array(path, chunk_size=7)) == records
+    batch_run.write_results([], path)
+    assert list(batch_run.iter_json_array(path)) == []
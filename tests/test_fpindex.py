@@ -0,0 +1,16 @@
+import numpy as np
+
+from fpindex import FingerprintIndex, morgan_fingerprints, nearest_neighbours
+
+SMILES = ['CCO', 'c1ccccc1O', 'CC(C)C1=CC(=O)C(=CC=C1)O', 'CCN(CC)CC']
+
+
+def test_topk_drops_neighbours_below_min_similarity():
+    index = FingerprintIndex.build(SMILES)
+    sims, positions = index.search_topk(morgan_fingerprints(['c1ccccc1']), k=3, min_similarity=0.2)
+
+    found = positions >= 0
+    assert found.sum() == 1 and index.ids[positions[0, 0]] == 'c1ccccc1O'
+    assert np.isnan(sims[~found]).all() and (sims[found] >= 0.2).all()
+    table = nearest_neighbours(index, ['c1ccccc1'], ['benzene'], k=3, min_similarity=0.2)
+    assert table['neighbour_id'].tolist() == ['c1ccccc1O']
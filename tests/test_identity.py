@@ -0,0 +1,80 @@
+import json
+import threading
+
+from MolSearch.tools import identity
+from MolSearch.tools.identity import IdentityIndex
+
+
+def test_built_index_is_saved_and_reused(tmp_path, monkeypatch):
+    source = tmp_path / 'compounds.csv'
+    source.write_text('cas,cid,smiles,name\n64-17-5,702,CCO,ethanol\n', encoding='utf-8')
+    cache_path = tmp_path / '.cache' / 'pubchem_identity.jsonl'
+    cache_path.parent.mkdir()
+    cache_path.write_text(json.dumps({'namespace': 'name', 'query': '67-56-1', 'cid': '887',
+                                      'title': 'Methanol', 'smiles': 'CO'}) + '\n', encoding='utf-8')
+
+    built = IdentityIndex.from_sources([str(source)], str(cache_path))
+    assert (tmp_path / '.cache' / identity.INDEX_SNAPSHOT_NAME).exists()
+
+    # The next process loads the snapshot instead of rebuilding and replays only the new cache lines.
+    def rebuild(cls, paths):
+        raise AssertionError('index rebuilt although the sources did not change')
+
+    monkeypatch.setattr(IdentityIndex, '_build', classmethod(rebuild))
+    with open(cache_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'namespace': 'name', 'query': '7732-18-5', 'cid': '962', 'title': 'Water'}) + '\n')
+    loaded = IdentityIndex.from_sources([str(source)], str(cache_path))
+    assert loaded.records[:len(built.records)] == built.records
+    assert loaded.cid_of(cas='64-17-5') == ('702', 'ethanol')
+    assert loaded.cid_of(cas='67-56-1')[0] == '887'
+    assert loaded.cid_of(cas='7732-18-5')[0] == '962'
+
+
+def test_find_while_adding():
+    index = IdentityIndex()
+    errors = []
+
+    def writer():
+        for i in range(5000):
+            index.add(cas='50-00-0', cid=str(i))
+
+    def reader():
+        try:
+            for _ in range(500):
+                index.find('cas', '50-00-0')
+        except RuntimeError as e:  # "Set changed size during iteration"
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(index.find('cas', '50-00-0')) == 5000
+
+
+def test_crash_cut_cache_line_is_skipped(tmp_path):
+    cache_path = tmp_path / 'pubchem_identity.jsonl'
+    cache_path.write_text(json.dumps({'namespace': 'name', 'query': '67-56-1', 'cid': '887', 'title': 'Methanol'})
+                          + '\n{"namespace": "name", "qu', encoding='utf-8')
+    index = IdentityIndex.from_sources([], str(cache_path))
+    assert index.cid_of(cas='67-56-1')[0] == '887'
+
+    index._remember({'namespace': 'name', 'query': '7732-18-5', 'cid': '962', 'title': 'Water'})
+    (tmp_path / identity.INDEX_SNAPSHOT_NAME).unlink()
+    assert IdentityIndex.from_sources([], str(cache_path)).cid_of(cas='7732-18-5')[0] == '962'
+
+
+def test_repeated_misses_are_sent_to_pubchem_once(monkeypatch):
+    queries = []
+
+    def lookup(namespace, value):
+        queries.append((namespace, value))
+        return {'CID': 702, 'Title': 'Ethanol'} if value == '64-17-5' else None
+
+    monkeypatch.setattr(identity, '_pubchem_property_lookup', lookup)
+    records = [{'cas': '64-17-5'}, {'cas': ' 64-17-5 '}, {'cas': '0-00-0', 'smiles': 'X'}, {'cas': '0-00-0', 'smiles': 'X'}]
+    results = identity.resolve_cids(records, index=IdentityIndex())
+    assert results == [('702', 'Ethanol'), ('702', 'Ethanol'), None, None]
+    assert sorted(queries) == [('name', '0-00-0'), ('name', '64-17-5'), ('smiles', 'X')]
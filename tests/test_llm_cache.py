@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip('google.adk')
+
+from google.adk.models.llm_request import LlmRequest  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from MolSearch.llm_cache import request_key  # noqa: E402
+
+
+def _foreign(author, text):
+    return types.Content(role='user', parts=[types.Part(text='For context:'),
+                                             types.Part(text=f'[{author}] said: {text}')])
+
+
+def _request(contents):
+    return LlmRequest(model='openai/gpt-4o', contents=contents,
+                      config=types.GenerateContentConfig(system_instruction='Summarize the analyses.'))
+
+
+def test_parallel_branch_order_does_not_change_the_key():
+    query = types.Content(role='user', parts=[types.Part(text='Analyze CCO')])
+    activity = [_foreign('activity_analysis_agent', 'calling PubChem'), _foreign('activity_analysis_agent', 'active')]
+    toxicity = [_foreign('toxicity_analysis_agent', 'LD50 7060 mg/kg')]
+    availability = [_foreign('availability_analysis_agent', 'in stock')]
+
+    first = _request([query, *activity, *toxicity, *availability])
+    second = _request([query, *availability, activity[0], *toxicity, activity[1]])
+    assert request_key('openai/gpt-4o', first) == request_key('openai/gpt-4o', second)
+
+
+def test_order_within_a_branch_still_matters():
+    query = types.Content(role='user', parts=[types.Part(text='Analyze CCO')])
+    steps = [_foreign('activity_analysis_agent', 'step 1'), _foreign('activity_analysis_agent', 'step 2')]
+    assert request_key('m', _request([query, *steps])) != request_key('m', _request([query, *steps[::-1]]))
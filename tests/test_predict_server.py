@@ -0,0 +1,113 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import requests
+
+pytest.importorskip('chemprop')
+
+from predict_server import PredictionService, serve  # noqa: E402
+
+
+class GatedModel:
+    """Fake model recording every batch; `hold()` blocks the next batch until `release()`."""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def hold(self):
+        self.gate.clear()
+        self.started.clear()
+
+    def release(self):
+        self.gate.set()
+
+    def __call__(self, smiles):
+        self.batches.append(list(smiles))
+        self.started.set()
+        self.gate.wait(5)
+        return np.array([[len(s) / 10.0, np.nan] for s in smiles])
+
+
+def _service(model, **kwargs):
+    return PredictionService(model, ['EC50_a', 'EC50_b'], max_wait=0.01, **kwargs)
+
+
+def _in_thread(service, smiles, results):
+    thread = threading.Thread(target=lambda: results.append(service.predict(smiles, timeout=5)))
+    thread.start()
+    return thread
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_queued_molecules_are_predicted_in_one_batch():
+    model = GatedModel()
+    service = _service(model)
+    model.hold()
+    results = []
+    threads = [_in_thread(service, ['C'], results)]
+    model.started.wait(5)
+    threads += [_in_thread(service, [s], results) for s in ('CC', 'CCC', 'CCCC')]
+    _wait_for(lambda: service._queue.qsize() == 3)
+    model.release()
+    for thread in threads:
+        thread.join()
+    assert model.batches[0] == ['C'] and sorted(model.batches[1]) == ['CC', 'CCC', 'CCCC']
+    assert service.stats['batches'] == 2 and len(results) == 4
+
+
+def test_in_flight_structure_is_shared():
+    model = GatedModel()
+    service = _service(model)
+    model.hold()
+    results = []
+    threads = [_in_thread(service, ['CCO'], results)]
+    model.started.wait(5)
+    threads.append(_in_thread(service, ['OCC'], results))
+    _wait_for(lambda: service.stats['requests'] == 2)
+    model.release()
+    for thread in threads:
+        thread.join()
+    assert model.batches == [['CCO']]
+    assert [r[0]['EC50_a'] for r in results] == [0.3, 0.3]
+    assert all(r[0]['EC50_b'] is None for r in results)  # NaN is returned as null
+
+
+def test_lru_cache_evicts_least_recently_used():
+    model = GatedModel()
+    service = _service(model, cache_size=2)
+    for smiles in (['CCO'], ['CCN'], ['OCC'], ['CCC'], ['CCN']):
+        service.predict(smiles, timeout=5)
+    # CCO was used again (as OCC) before CCC arrived, so CCN was evicted and is predicted twice.
+    assert model.batches == [['CCO'], ['CCN'], ['CCC'], ['CCN']]
+    assert service.stats['cache_hits'] == 1
+
+
+def test_invalid_smiles_never_reach_the_model():
+    model = GatedModel()
+    service = _service(model)
+    result = service.predict(['not_a_smiles', 'CCO'], timeout=5)
+    assert result[0] == {'smiles': 'not_a_smiles', 'canonical_smiles': '', 'error': 'Invalid SMILES'}
+    assert result[1]['EC50_a'] == 0.3 and model.batches == [['CCO']]
+
+
+def test_http_rejects_bodies_that_are_not_objects():
+    server = serve(_service(GatedModel()), port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}/predict"
+    try:
+        for body in ([1], 'CCO', {'smiles': [1]}, {}):
+            assert requests.post(url, json=body, timeout=5).status_code == 400
+        response = requests.post(url, json={'smiles': 'CCO'}, timeout=5)
+        assert response.status_code == 200 and response.json()['predictions'][0]['EC50_a'] == 0.3
+    finally:
+        server.shutdown()
@@ -0,0 +1,46 @@
+import os
+import socket
+
+import pytest
+import requests
+
+from MolSearch.tools import activity, availability, replay
+
+# Synthetic responses in the recorder's format, not live captures (see the README there).
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'http_synthetic')
+SMILES = 'CC(C)C1=CC(=O)C(=CC=C1)O'
+
+
+def _prepared(url):
+    return requests.Request('GET', url).prepare()
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError("network access during replay")
+    monkeypatch.setattr(socket.socket, 'connect', refuse)
+    monkeypatch.setattr(socket, 'create_connection', refuse)
+    yield
+    replay.uninstall()
+
+
+def test_fixture_molecule_replays_offline(offline):
+    replay.install('replay', FIXTURES_DIR, seed=0)
+    assert activity.get_chembl_id_from_pubchem(cid='3611') == 'CHEMBL48310'
+    result = availability.get_compound_prices_from_smiles(smiles_string=SMILES)
+    assert result['mcule_id'] == availability.get_mcule_id_from_smiles(smiles_string=SMILES)
+    assert result['prices'] and 'availability' in result
+
+
+def test_unrecorded_request_fails_fast(offline):
+    replay.install('replay', FIXTURES_DIR, seed=0)
+    with pytest.raises(replay.FixtureNotFound):
+        replay._replay_send(None, _prepared('https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound/1/JSON'))
+    assert activity.get_chembl_id_from_pubchem(cid='1') is None
+
+
+def test_injected_errors_reach_the_tools(offline):
+    replay.install('replay', FIXTURES_DIR, error_rate=1.0, error_status=503, seed=0)
+    assert activity.get_chembl_id_from_pubchem(cid='3611') is None
+    assert availability.get_mcule_id_from_smiles(smiles_string=SMILES) is None
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import results_store
+
+
+def test_records_without_cas_are_kept_apart(tmp_path):
+    path = tmp_path / 'batch_result.json'
+    path.write_text(json.dumps([
+        {'name': 'A', 'cas': 'nan', 'cid': '1', 'smiles': 'CCO', 'recommended_for_experiment': '40'},
+        {'name': 'B', 'cas': 'nan', 'cid': 'nan', 'smiles': 'CCN', 'recommended_for_experiment': '60'},
+        {'name': 'C', 'cas': '', 'cid': None, 'smiles': 'CCC'},
+    ]), encoding='utf-8')
+    conn = results_store.connect(str(tmp_path / 'results.sqlite'))
+    results_store.load(conn, [str(path)])
+
+    rows = results_store.query(conn, columns=['name', 'cas', 'cid', 'score'], order='name')
+    assert [(r['name'], r['cas'], r['cid']) for r in rows] == [('A', None, '1'), ('B', None, None), ('C', None, None)]
+    assert results_store.query(conn, min_score=50, columns=['name']) == [{'name': 'B'}]
+
+
+RECORDS = [
+    {'name': 'Hinokitiol', 'cas': '499-44-5', 'cid': '3611', 'smiles': 'CC(C)C1=CC(=O)C(=CC=C1)O',
+     'activity_brief': 'antifungal', 'availability_brief': 'In stock', 'recommended_for_experiment': '80%',
+     'overall_evaluation': 'Potent antifungal tropolone with low acute toxicity.'},
+    {'name': 'Ethanol', 'cas': '64-17-5', 'cid': '702', 'smiles': 'CCO', 'activity_brief': 'inactive',
+     'availability_brief': 'in stock', 'recommended_for_experiment': 20,
+     'overall_evaluation': 'Solvent; no relevant activity.'},
+    {'name': 'Failed', 'cas': '50-00-0', 'error': 'timeout'},
+]
+
+
+def _store(tmp_path, records=RECORDS, name='batch_result.json'):
+    path = tmp_path / name
+    path.write_text(json.dumps(records), encoding='utf-8')
+    conn = results_store.connect(str(tmp_path / 'results.sqlite'))
+    results_store.load(conn, [str(path)])
+    return conn, path
+
+
+def test_full_text_match_and_snippet(tmp_path):
+    conn, _ = _store(tmp_path)
+    rows = results_store.query(conn, text='antifungal NOT solvent', columns=['name', 'snippet'], order='rank')
+    assert [r['name'] for r in rows] == ['Hinokitiol']
+    assert '[antifungal]' in rows[0]['snippet']
+    assert results_store.query(conn, text='"acute toxicity"', columns=['name']) == [{'name': 'Hinokitiol'}]
+
+
+def test_invalid_full_text_query_is_reported(tmp_path):
+    conn, _ = _store(tmp_path)
+    with pytest.raises(ValueError, match='3-hydroxy'):
+        results_store.query(conn, text='3-hydroxy')
+    assert results_store.query(conn, text='"3-hydroxy"') == []
+
+
+def test_brief_score_and_error_filters(tmp_path):
+    conn, _ = _store(tmp_path)
+    assert [r['name'] for r in results_store.query(conn, brief='IN STOCK', order='name')] == ['Ethanol', 'Hinokitiol']
+    assert [r['name'] for r in results_store.query(conn, min_score=50)] == ['Hinokitiol']
+    assert [r['name'] for r in results_store.query(conn, max_score=50)] == ['Ethanol']
+    assert [r['name'] for r in results_store.query(conn, errors=True)] == ['Failed']
+    assert results_store.query(conn, cid='702', columns=['score']) == [{'score': 20.0}]
+
+
+def test_reload_updates_records_in_place(tmp_path):
+    conn, path = _store(tmp_path)
+    retried = dict(RECORDS[2], error=None, name='Formaldehyde', overall_evaluation='Reactive aldehyde.',
+                   recommended_for_experiment='10')
+    _store(tmp_path, [retried], name='rerun.json')
+
+    assert results_store.stats(conn)['molecules'] == 3
+    assert results_store.query(conn, cas='50-00-0', columns=['name', 'score', 'error']) == \
+        [{'name': 'Formaldehyde', 'score': 10.0, 'error': None}]
+    assert results_store.query(conn, text='aldehyde', columns=['name']) == [{'name': 'Formaldehyde'}]
+    assert results_store.query(conn, errors=True) == []
@@ -0,0 +1,29 @@
+import pickle
+
+import pandas as pd
+
+from splits import chemprop_rows, chemprop_split_args
+
+
+def test_folds_index_the_rows_chemprop_keeps(tmp_path):
+    data_path = tmp_path / 'dataset.csv'
+    pd.DataFrame({
+        'smiles': ['CCO', 'c1ccccc1', 'not_a_smiles', 'CCN', 'CCCl', '[H][H]', 'c1ccncc1', 'CC(=O)O'],
+        'EC50_a': [1, None, 0, None, 0, 1, 1, 0],
+        'EC50_b': [None, 1, 1, None, None, None, 0, None],
+    }).to_csv(data_path, index=False)
+
+    assert chemprop_rows(str(data_path), target_columns=['EC50_a'])['smiles'].tolist() == \
+        ['CCO', 'CCCl', 'c1ccncc1', 'CC(=O)O']
+    assert len(chemprop_rows(str(data_path))) == 5
+
+    paths = set()
+    for targets, n_rows in ((['EC50_a'], 4), (None, 5)):
+        args = chemprop_split_args(str(data_path), num_folds=2, split_type='random', sizes=(0.5, 0.25, 0.25),
+                                   split_dir=str(tmp_path / 'splits'), target_columns=targets)
+        paths.add(args[-1])
+        with open(args[-1], 'rb') as f:
+            folds = pickle.load(f)
+        for fold in folds:
+            assert sorted(i for part in fold for i in part) == list(range(n_rows))
+    assert len(paths) == 2
@@ -0,0 +1,17 @@
+import pandas as pd
+import pytest
+
+import tables
+
+
+@pytest.mark.parametrize('name', ['out.csv', 'out.parquet'])
+def test_table_writer_round_trips_chunks(tmp_path, name):
+    if tables.is_parquet(name):
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / name)
+    with tables.TableWriter(path) as writer:
+        for i in range(3):
+            writer.write(pd.DataFrame({'smiles': ['C', 'CC'], 'ad_max_similarity': [0.1 * i, 0.2 * i]}))
+    df = tables.read_table(path)
+    assert df['smiles'].tolist() == ['C', 'CC'] * 3
+    assert df['ad_max_similarity'].tolist() == pytest.approx([0.0, 0.0, 0.1, 0.2, 0.2, 0.4])
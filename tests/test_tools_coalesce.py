@@ -0,0 +1,84 @@
+"""ADK's FunctionTool calls tools with keyword arguments; every coalesced tool must accept them."""
+
+import asyncio
+import inspect
+import threading
+import time
+
+import pytest
+
+from MolSearch.tools import activity, availability, prediction, toxicity
+from MolSearch.tools.singleflight import coalesce
+
+TOOLS = [
+    (activity.fetch_activity_data, 'cid', ' 2244 ', '2244'),
+    (activity.get_chembl_id_from_pubchem, 'cid', '2244', '2244'),
+    (availability.get_mcule_id_from_smiles, 'smiles_string', 'OCC', 'CCO'),
+    (availability.get_compound_prices_from_smiles, 'smiles_string', 'OCC', 'CCO'),
+    (prediction.predict_ec50_activity, 'smiles_string', 'OCC', 'CCO'),
+    (toxicity.fetch_toxicity_data, 'cas_number', ' 64-17-5', '64-17-5'),
+]
+
+
+@pytest.mark.parametrize('tool, name, value, expected_key', TOOLS, ids=[t[0].__name__ for t in TOOLS])
+def test_keyword_and_positional_calls_share_a_key(monkeypatch, tool, name, value, expected_key):
+    keys = []
+    # Stop at the single-flight boundary so no request leaves the process.
+    monkeypatch.setattr(tool.single_flight, 'do', lambda key, fn, *args, **kwargs: keys.append(key))
+    tool(**{name: value})
+    tool(value)
+    assert keys == [expected_key, expected_key]
+
+
+@pytest.mark.parametrize('tool', [t[0] for t in TOOLS], ids=[t[0].__name__ for t in TOOLS])
+def test_async_variant_looks_like_the_tool(tool):
+    assert inspect.iscoroutinefunction(tool.aio)
+    assert tool.aio.__name__ == tool.__name__ and tool.aio.__doc__ == tool.__doc__
+    assert inspect.signature(tool.aio) == inspect.signature(tool)
+
+
+def _slow_lookup():
+    calls = []
+
+    @coalesce(key=lambda cid: cid.strip())
+    def lookup(cid):
+        calls.append(cid)
+        time.sleep(0.2)
+        return {'cid': cid.strip()}
+
+    return lookup, calls
+
+
+def test_concurrent_coroutines_share_one_execution():
+    lookup, calls = _slow_lookup()
+
+    async def main():
+        return await asyncio.gather(lookup.aio(cid='3611'), lookup.aio(' 3611'), lookup.aio(cid='702'))
+
+    results = asyncio.run(main())
+    assert results == [{'cid': '3611'}, {'cid': '3611'}, {'cid': '702'}]
+    assert sorted(calls) == ['3611', '702']
+    assert lookup.aio.single_flight.shared == 1
+
+
+def test_concurrent_threads_share_one_execution():
+    lookup, calls = _slow_lookup()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lookup('3611'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [{'cid': '3611'}] * 2 and calls == ['3611']
+
+
+def test_errors_reach_every_waiter():
+    @coalesce()
+    def lookup(cid):
+        time.sleep(0.1)
+        raise ConnectionError(cid)
+
+    async def main():
+        return await asyncio.gather(lookup.aio('1'), lookup.aio('1'), return_exceptions=True)
+
+    assert [type(e) for e in asyncio.run(main())] == [ConnectionError, ConnectionError]